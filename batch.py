@@ -0,0 +1,194 @@
+import argparse
+import csv
+import glob
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import blending
+import diagnostics
+import export
+import ingest
+import partitions
+import profiles
+import schedule
+import scoring
+
+# Columns of the combined run report, one row per input file
+REPORT_COLUMNS = ['File', 'Status', 'Cells', 'Graded_Cells', 'Pairs', 'Remaining', 'Seconds', 'Output', 'Error']
+
+
+# Supported assay file, skipping the lock files Excel leaves next to open workbooks
+def is_assay_file(path):
+    name = os.path.basename(path)
+    return not name.startswith('~$') and os.path.splitext(name)[1].lower().lstrip('.') in ingest.UPLOAD_TYPES
+
+
+# Every assay file named on the command line: files as given, directories searched for
+# supported files, and anything else treated as a glob pattern
+def find_inputs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = [os.path.join(item, name) for name in os.listdir(item)]
+        elif os.path.isfile(item):
+            matches = [item]
+        else:
+            matches = glob.glob(item, recursive=True)
+        paths += sorted(path for path in matches if os.path.isfile(path) and is_assay_file(path))
+    # Keep the first mention of each file
+    return list(dict.fromkeys(paths))
+
+
+# Name each file's summary and profile are saved under: the file name without its extension. Files sharing
+# a name keep their extension in it (lab_csv, lab_xlsx), and any still alike (same name in different folders)
+# are numbered (lab_csv_2), so no two files of a run write the same output.
+def output_names(paths):
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    stem_counts = Counter(stems)
+    bases = [stem if stem_counts[stem] == 1 else stem + '_' + os.path.splitext(path)[1].lstrip('.').lower()
+             for stem, path in zip(stems, paths)]
+    names, taken = {}, set(bases)
+    for path, base in zip(paths, bases):
+        name, number = base, 1
+        while name in names.values() or (name != base and name in taken):
+            number += 1
+            name = f"{base}_{number}"
+        names[path] = name
+    return names
+
+
+# Schedule one assay file and write its Overall Summary next to the others.
+# Runs in a worker process; errors are reported instead of stopping the whole run.
+# With `partition` (room, section or a column of the file) each partition is paired on its own.
+# Files already run in parallel, so the partitions of a file are scheduled one after the other.
+# Stage timings and counters are logged as one JSON line per file; with `profile` the
+# scheduling is run under cProfile and dumped to <name>.prof beside the summary (`name`, see output_names).
+# With `use_model` the trained pair model ranks the partners the rules allow (one core per file).
+# With `pots` above 2 crucibles may blend that many pots, weighted by the `weight_column` of the file if given.
+def schedule_file(path, output_dir, output_format='xlsx', max_distance=None, mode="Greedy", thresholds=None,
+                  partition=None, cross_partition=True, profile=False, log_level=None, use_model=False, pots=2, weight_column=None, name=None):
+    if log_level is not None:
+        diagnostics.configure_logging(log_level)
+    started = time.perf_counter()
+    result = {'File': path, 'Status': 'ok', 'Cells': 0, 'Graded_Cells': 0, 'Pairs': 0, 'Remaining': 0, 'Output': '', 'Error': ''}
+    run_diagnostics = diagnostics.Diagnostics(path)
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    try:
+        with run_diagnostics.collecting():
+            with run_diagnostics.stage('read'):
+                extra_columns = [partition] if partition and partition not in partitions.PARTITIONS else []
+                extra_columns += [weight_column] if weight_column else []
+                data = ingest.read_assays(path, extra_columns=extra_columns)
+            missing = [column for column in ingest.ASSAY_COLUMNS if column not in data.columns]
+            if missing:
+                raise ValueError("missing columns: " + ", ".join(missing))
+
+            with run_diagnostics.stage('grading'):
+                filtered_data = schedule.grade_cells(data, thresholds)
+            scorer = scoring.load_scorer(workers=1) if use_model else None
+            with run_diagnostics.profiling(profile):
+                tapping_schedule = partitions.schedule_line(filtered_data, thresholds, max_distance, mode, partition, cross_partition,
+                                                            workers=1, scorer=scorer, pots=pots, weight_column=weight_column)
+
+            output = os.path.join(output_dir, name + '_summary.' + output_format)
+            with run_diagnostics.stage(output_format + '_export'):
+                if output_format == 'csv':
+                    with open(output, 'w', newline='') as output_file:
+                        export.write_summary_csv(tapping_schedule, output_file)
+                else:
+                    export.write_workbook(tapping_schedule, output)
+        if profile:
+            with open(os.path.join(output_dir, name + '.prof'), 'wb') as profile_file:
+                profile_file.write(run_diagnostics.profile_bytes())
+
+        result.update({
+            'Cells': len(data),
+            'Graded_Cells': len(filtered_data),
+            'Pairs': len(tapping_schedule['table'].paired()),
+            'Remaining': len(tapping_schedule['table'].category('remaining')),
+            'Output': output,
+        })
+    except Exception as error:
+        result.update({'Status': 'failed', 'Error': f"{type(error).__name__}: {error}"})
+    result['Seconds'] = round(time.perf_counter() - started, 3)
+    run_diagnostics.log_summary()
+    return result
+
+
+# Schedule every file across a process pool and write the combined run report
+def run(paths, output_dir, workers=None, output_format='xlsx', max_distance=None, mode="Greedy", thresholds=None,
+        partition=None, cross_partition=True, profile=False, log_level=None, use_model=False, pots=2, weight_column=None):
+    os.makedirs(output_dir, exist_ok=True)
+    options = (output_format, max_distance, mode, thresholds, partition, cross_partition, profile, log_level, use_model, pots, weight_column)
+    names = output_names(paths)
+    if workers == 1:
+        results = [schedule_file(path, output_dir, *options, names[path]) for path in paths]
+    else:
+        # Biggest files go first so no worker is left with a large file at the end of the run
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {path: pool.submit(schedule_file, path, output_dir, *options, names[path])
+                       for path in sorted(paths, key=os.path.getsize, reverse=True)}
+            results = [futures[path].result() for path in paths]
+
+    with open(os.path.join(output_dir, 'run_report.csv'), 'w', newline='') as report_file:
+        writer = csv.DictWriter(report_file, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate tapping schedules for many potline assay files.")
+    parser.add_argument('inputs', nargs='+', help="assay files, directories or glob patterns (xlsx, csv, parquet)")
+    parser.add_argument('-o', '--output-dir', default='schedules', help="where summaries and run_report.csv are written")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--format', choices=['xlsx', 'csv'], default='xlsx', help="summary file format")
+    parser.add_argument('--max-distance', type=int, default=None, help="maximum tapping distance between paired cells")
+    parser.add_argument('--mode', choices=['Greedy', 'Optimal'], default='Greedy', help="pairing mode")
+    parser.add_argument('--thresholds', default=profiles.DEFAULT_PROFILE, help="grade threshold profile from threshold_profiles.toml")
+    parser.add_argument('--partition', help="pair cells within each room, section or value of this column")
+    parser.add_argument('--no-cross-partition', action='store_true', help="leave cells unpaired in their partition instead of pairing them across partitions")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log stage timings and counters as JSON lines on stderr")
+    parser.add_argument('--profile', action='store_true', help="profile the scheduling of each file, saved as <name>.prof")
+    parser.add_argument('--model', action='store_true', help="rank allowed partners with the trained pair model (paired_model.pkl)")
+    parser.add_argument('--pots', type=int, default=2, help="most pots one crucible blends (groups of more than 2 better poor cells no pair can)")
+    parser.add_argument('--weight-column', help="column with the metal tapped from each pot, to weight the blends by")
+    args = parser.parse_args(argv)
+
+    # Settings no file can be scheduled with are refused before any worker starts
+    if args.max_distance is not None and args.max_distance < 1:
+        parser.error("--max-distance is a whole number of positions, at least 1")
+    if not 2 <= args.pots <= blending.MAX_POTS:
+        parser.error(f"--pots is from 2 to {blending.MAX_POTS}")
+    if args.pots > 2 and args.mode == "Optimal":
+        parser.error("--mode Optimal pairs cells two at a time; blend more --pots in Greedy mode")
+    if args.partition and (args.pots > 2 or args.weight_column):
+        parser.error("--pots above 2 and --weight-column schedule the whole line, not by --partition")
+
+    paths = find_inputs(args.inputs)
+    try:
+        thresholds = profiles.get_profile(args.thresholds).thresholds
+    except KeyError as error:
+        parser.error(error.args[0])
+    if not paths:
+        parser.error("no assay files found")
+
+    started = time.perf_counter()
+    log_level = logging.INFO if args.verbose else None
+    results = run(paths, args.output_dir, args.workers, args.format, args.max_distance, args.mode, thresholds, args.partition,
+                  cross_partition=not args.no_cross_partition, profile=args.profile, log_level=log_level,
+                  use_model=args.model, pots=args.pots, weight_column=args.weight_column)
+    failed = [result for result in results if result['Status'] != 'ok']
+    print(f"Scheduled {len(results) - len(failed)} of {len(results)} files in {time.perf_counter() - started:.1f}s, "
+          f"report in {os.path.join(args.output_dir, 'run_report.csv')}")
+    for result in failed:
+        print(f"  {result['File']}: {result['Error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from collections import Counter
+
+import diagnostics
+import export
+import grading
+import pairing
+import sample_data
+import schedule
+
+# Potline sizes benchmarked by default
+SIZES = [100, 1000, 10000, 50000]
+
+# Stages timed for each size, in pipeline order
+STAGES = ['grading', 'pass_poor', 'pass_pairable', 'pass_acceptable', 'pass_leftover', 'summary', 'excel_export']
+
+# Slowdown against a previous run that is reported as a regression, and the least time it has to add,
+# so millisecond stages of small lines do not fail a run on timer noise
+REGRESSION_RATIO = 1.25
+REGRESSION_SECONDS = 0.005
+
+
+# Time one call, returning (seconds, result)
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+# Overall Summary table, assembled the way the app builds it for display
+def summary_frame(tapping_schedule):
+    return tapping_schedule['table'].frame(export.SUMMARY_COLUMNS)
+
+
+# Run the scheduling pipeline once on a potline, timing every stage
+def run_once(data, thresholds=None):
+    thresholds = thresholds or grading.default_thresholds()
+    timings = {}
+    timings['grading'], filtered_data = timed(schedule.grade_cells, data, thresholds)
+
+    potline = pairing.potline_from_frame(filtered_data, thresholds)
+    used = potline.new_used()
+    pairs = {}
+    timings['pass_poor'], pairs['poor'] = timed(pairing.pair_poor_cells, potline, used)
+    timings['pass_pairable'], pairs['pairable'] = timed(pairing.pair_pairable_cells, potline, used)
+    timings['pass_acceptable'], pairs['acceptable'] = timed(pairing.pair_acceptable_cells, potline, used)
+    timings['pass_leftover'], (pairs['mixed'], remaining) = timed(pairing.pair_leftover_cells, potline, used)
+    tapping_schedule = schedule.finished_schedule(potline, pairs, remaining)
+
+    timings['summary'], _ = timed(summary_frame, tapping_schedule)
+    timings['excel_export'], _ = timed(export.workbook_bytes, tapping_schedule)
+    return timings, tapping_schedule
+
+
+# Schedule-quality numbers, so a speedup that changes the schedule shows up next to the timings
+def schedule_quality(tapping_schedule):
+    pairs = {category: len(tapping_schedule['table'].category(category)) for category in schedule.CATEGORIES}
+    grades = Counter(grade for _, _, grade in export.summary_rows(tapping_schedule))
+    return {
+        'cells': len(tapping_schedule['potline']),
+        'paired_cells': 2 * sum(pairs.values()),
+        'pairs': pairs,
+        'remaining': len(tapping_schedule['table'].category('remaining')),
+        'grade_distribution': {str(grade): count for grade, count in sorted(grades.items(), key=lambda item: str(item[0]))},
+    }
+
+
+# Benchmark every size, keeping the best time of `repeat` runs per stage, and the counters of the fastest run
+def run(sizes=SIZES, repeat=3, seed=42):
+    results = []
+    for size in sizes:
+        data = sample_data.generate_potline(size, seed=seed)
+        best, counters, best_total = {}, None, None
+        for _ in range(repeat):
+            run_diagnostics = diagnostics.Diagnostics(f"{size} cells")
+            with run_diagnostics.collecting():
+                timings, tapping_schedule = run_once(data)
+            best = {stage: min(seconds, best.get(stage, seconds)) for stage, seconds in timings.items()}
+            total = sum(timings[stage] for stage in STAGES)
+            if best_total is None or total < best_total:
+                best_total, counters = total, dict(run_diagnostics.counters)
+        best['total'] = sum(best[stage] for stage in STAGES)
+        results.append({'cells': size, 'seconds': best, 'counters': counters, 'quality': schedule_quality(tapping_schedule)})
+        print(f"{size:>7} cells  " + "  ".join(f"{stage} {best[stage]:.4f}s" for stage in STAGES + ['total']), flush=True)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+# Compare with a previous results file: stages slower by more than `ratio` and `min_seconds`, and any change in schedule quality
+def compare(current, previous, ratio=REGRESSION_RATIO, min_seconds=REGRESSION_SECONDS):
+    previous_by_size = {result['cells']: result for result in previous['results']}
+    problems = []
+    for result in current['results']:
+        before = previous_by_size.get(result['cells'])
+        if before is None:
+            continue
+        for stage, seconds in result['seconds'].items():
+            old = before['seconds'].get(stage)
+            if old and seconds / old > ratio and seconds - old > min_seconds:
+                problems.append(f"{result['cells']} cells: {stage} slower, {old:.4f}s -> {seconds:.4f}s")
+        if result['quality'] != before['quality']:
+            problems.append(f"{result['cells']} cells: schedule changed, {before['quality']} -> {result['quality']}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark grading, the pairing passes, summary assembly and Excel export.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="potline sizes in cells")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per size, the best time is kept")
+    parser.add_argument('--seed', type=int, default=42, help="seed for the synthetic potlines")
+    parser.add_argument('-o', '--output', default='bench_results.json', help="where the results are saved as JSON")
+    parser.add_argument('--compare', help="previous results JSON to check for regressions")
+    args = parser.parse_args(argv)
+
+    current = run(args.sizes, args.repeat, args.seed)
+    with open(args.output, 'w') as output_file:
+        json.dump(current, output_file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            problems = compare(current, json.load(previous_file))
+        for problem in problems:
+            print(problem)
+        if problems:
+            return 1
+        print("No regressions against", args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import functools
+import itertools
+import numpy as np
+import diagnostics
+import grading
+import matching
+import pairing
+from pairing import ACCEPTABLE, POOR, BETTERED
+
+# Most pots one crucible takes metal from
+MAX_POTS = 4
+
+# Nearest unused cells a group search picks the rest of a group from. Groups are every combination of
+# these, so this keeps a search at a few dozen groups (56 for four pots) however dense the potline.
+GROUP_CANDIDATES = 8
+
+
+# Every way of picking `size` of `count` candidates, as rows of candidate indices, in combinations() order
+@functools.lru_cache(maxsize=None)
+def combination_indices(count, size):
+    return np.array(list(itertools.combinations(range(count), size)), dtype=np.int64).reshape(-1, size)
+
+
+# Si and Fe of the metal of `row` tapped together with each group of `partners` (one group per row of the
+# matrix): the plain average of the pots, or the average weighted by the metal tapped from each
+def group_blend(potline, row, partners):
+    if potline.weights is None:
+        pots = partners.shape[1] + 1
+        return ((potline.si[row] + potline.si[partners].sum(axis=1)) / pots,
+                (potline.fe[row] + potline.fe[partners].sum(axis=1)) / pots)
+    weights = potline.weights
+    total = weights[row] + weights[partners].sum(axis=1)
+    return ((weights[row] * potline.si[row] + (weights[partners] * potline.si[partners]).sum(axis=1)) / total,
+            (weights[row] * potline.fe[row] + (weights[partners] * potline.fe[partners]).sum(axis=1)) / total)
+
+
+# Best group of 2 to `pots` - 1 unused candidates that blends with `row` into an allowed grade: the most metal
+# value gained over tapping each pot as it is, less the crucible travel (weighted as in matching), then the
+# fewest pots, then the least travel. The search expands outward like closest_partner, but only ever looks at
+# the GROUP_CANDIDATES cells nearest to `row`, and stops widening once it has that many.
+# Returns (partner rows, blend grade code), or (None, None).
+def closest_group(potline, row, candidates, used, result_mask, pots, max_distance=None, distance_weight=matching.DISTANCE_WEIGHT):
+    position = potline.positions[row]
+    si_bound, fe_bound = pairing.grade_bounds(result_mask, potline.thresholds)
+    window = pairing.FIRST_WINDOW if max_distance is None else min(pairing.FIRST_WINDOW, max_distance)
+    while True:
+        rows, everything = candidates.around(position, window)
+        rows = rows[~used[potline.keys[rows]] & (potline.keys[rows] != potline.keys[row])]
+        found = []
+        if len(rows) >= 2:
+            # One row per CELL, the nearest ones first
+            distances = np.abs(position - potline.partner_positions[rows])
+            order = np.lexsort((rows, distances))
+            rows, distances = rows[order], distances[order]
+            first = np.sort(np.unique(potline.keys[rows], return_index=True)[1])
+            rows, distances = rows[first][:GROUP_CANDIDATES], distances[first][:GROUP_CANDIDATES]
+            values = matching.GRADE_VALUES[potline.codes[rows]]
+
+            for size in range(2, min(pots - 1, len(rows)) + 1):
+                groups = combination_indices(len(rows), size)
+                diagnostics.count('candidate_groups', len(groups))
+                avg_si, avg_fe = group_blend(potline, row, rows[groups])
+                within = (avg_si <= si_bound) & (avg_fe <= fe_bound)
+                if not within.any():
+                    continue
+                groups = groups[within]
+                group_codes = grading.grade_codes(avg_si[within], avg_fe[within], potline.thresholds)
+                allowed = result_mask[group_codes]
+                if allowed.any():
+                    groups, group_codes = groups[allowed], group_codes[allowed]
+                    travel = distances[groups].sum(axis=1)
+                    gain = (size + 1) * matching.GRADE_VALUES[group_codes] - matching.GRADE_VALUES[potline.codes[row]] - values[groups].sum(axis=1)
+                    found.append((gain - distance_weight * travel, np.full(len(groups), size), travel, groups, group_codes))
+
+        if found:
+            # Best over every size; `best` is then found again among the groups of its size
+            scores, sizes, travel = (np.concatenate([entry[part] for entry in found]) for part in range(3))
+            best = np.lexsort((travel, sizes, -scores))[0]
+            for _, _, _, groups, group_codes in found:
+                if best < len(groups):
+                    return rows[groups[best]], group_codes[best]
+                best -= len(groups)
+        if everything or len(rows) == GROUP_CANDIDATES or (max_distance is not None and window >= max_distance):
+            return None, None
+        window = window * 2 if max_distance is None else min(window * 2, max_distance)
+
+
+# First pass for crucibles taking metal from up to `pots` pots. Every unused poor cell takes its closest
+# acceptable partner that betters it, as pair_poor_cells does; failing that, the best group of nearby acceptable
+# and poor cells that betters it together (see closest_group); and failing that, another poor cell.
+# With two pots this is pair_poor_cells.
+# Returns the pairs as (main row, partner row, grade code) and the groups as (main row, partner rows, grade code),
+# and marks every cell of them in `used`.
+def blend_poor_cells(potline, used, pots=3, max_distance=None):
+    if not 2 <= pots <= MAX_POTS:
+        raise ValueError(f"A crucible takes metal from 2 to {MAX_POTS} pots, not {pots}")
+    unused = ~used[potline.keys]
+    acceptable = pairing.Candidates(potline, np.flatnonzero(ACCEPTABLE[potline.codes] & unused))
+    poor = pairing.Candidates(potline, np.flatnonzero(POOR[potline.codes] & unused))
+    group_members = pairing.Candidates(potline, np.flatnonzero((ACCEPTABLE | POOR)[potline.codes] & unused))
+    pairs, groups = [], []
+    for number, row in enumerate(np.flatnonzero(POOR[potline.codes] & unused)):
+        if number % pairing.CHECKPOINT_ROWS == 0:
+            diagnostics.checkpoint()
+            for candidates in (acceptable, poor, group_members):
+                candidates.compact(potline, used)
+        if used[potline.keys[row]]:
+            continue
+        partner, code = pairing.closest_partner(potline, row, acceptable, used, BETTERED, False, max_distance)
+        if partner is None and pots > 2:
+            partners, code = closest_group(potline, row, group_members, used, BETTERED, pots, max_distance)
+            if partners is not None:
+                groups.append((row, tuple(partners.tolist()), code))
+                used[potline.keys[row]] = True
+                used[potline.keys[partners]] = True
+                continue
+        if partner is None:
+            partner, code = pairing.closest_partner(potline, row, poor, used, POOR, True, max_distance)
+        if partner is not None:
+            pairs.append((row, partner, code))
+            used[potline.keys[row]] = True
+            used[potline.keys[partner]] = True
+        elif acceptable.exhausted(potline, used) and poor.exhausted(potline, used):
+            break
+    diagnostics.count('groups', len(groups))
+    return pairs, groups
@@ -0,0 +1,149 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import time
+from collections import Counter
+
+logger = logging.getLogger('tapping_schedule')
+
+# Diagnostics of the run in progress, if any. Grading and pairing report into it without it being
+# passed around; when nothing is collecting, reporting costs one lookup.
+_current = contextvars.ContextVar('diagnostics', default=None)
+
+
+# Raised inside a run whose diagnostics were asked to cancel it, at the next stage or checkpoint
+class Cancelled(Exception):
+    pass
+
+
+# Stage timings and counters for one scheduling run
+class Diagnostics:
+    def __init__(self, run_name=''):
+        self.run_name = run_name
+        self.stages = {}
+        self.counters = Counter()
+        self.profile = None
+        # Stages being run right now, outermost first, and whether the run should stop
+        self.running = []
+        self.cancel_requested = False
+
+    # Collect everything reported while the block runs into this object
+    @contextlib.contextmanager
+    def collecting(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    # Ask the run reporting here to stop; it raises Cancelled at its next stage or checkpoint
+    def cancel(self):
+        self.cancel_requested = True
+
+    def checkpoint(self):
+        if self.cancel_requested:
+            raise Cancelled(self.run_name)
+
+    # Time a stage; stages run more than once add up
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.checkpoint()
+        started = time.perf_counter()
+        self.running.append(name)
+        try:
+            yield
+        finally:
+            self.running.pop()
+            seconds = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            log_event('stage', run=self.run_name, stage=name, seconds=round(seconds, 6))
+
+    # Run the block under cProfile, keeping the stats for `profile_report` and `profile_bytes`.
+    # With `enabled` False the block just runs.
+    @contextlib.contextmanager
+    def profiling(self, enabled=True):
+        if not enabled:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.profile = profiler
+
+    # The slowest functions of the profiled run, as text
+    def profile_report(self, limit=25):
+        output = io.StringIO()
+        pstats.Stats(self.profile, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    # The profiled run as a .prof file (for snakeviz, pstats, ...)
+    def profile_bytes(self):
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+    # Stage timings then counters, as rows for a table
+    def rows(self):
+        rows = [{"Metric": f"{name} (s)", "Value": round(seconds, 4)} for name, seconds in self.stages.items()]
+        rows += [{"Metric": name, "Value": count} for name, count in sorted(self.counters.items())]
+        return rows
+
+    # Add the stages and counters of another run (e.g. one run in a background job) to this one
+    def merge(self, other):
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.counters.update(other.counters)
+
+    # One structured log line with everything collected
+    def log_summary(self):
+        log_event('run', run=self.run_name,
+                  stages={name: round(seconds, 6) for name, seconds in self.stages.items()},
+                  counters=dict(self.counters))
+
+
+# Time a stage of the run being collected, or just run the block when nothing is collecting
+@contextlib.contextmanager
+def stage(name):
+    diagnostics = _current.get()
+    if diagnostics is None:
+        yield
+    else:
+        with diagnostics.stage(name):
+            yield
+
+
+# Add to a counter of the run being collected
+def count(name, amount=1):
+    diagnostics = _current.get()
+    if diagnostics is not None:
+        diagnostics.counters[name] += int(amount)
+
+
+# Stop here if the run being collected was cancelled. Long loops call this now and then.
+def checkpoint():
+    diagnostics = _current.get()
+    if diagnostics is not None and diagnostics.cancel_requested:
+        raise Cancelled(diagnostics.run_name)
+
+
+# Structured log line: the event name and its fields as JSON
+def log_event(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': event, **fields}, default=str))
+
+
+# Send the structured log lines to stderr, once per process
+def configure_logging(level=logging.INFO):
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
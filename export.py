@@ -0,0 +1,90 @@
+import csv
+import io
+import xlsxwriter
+from schedule import CATEGORIES
+
+# Columns of the Overall Summary
+SUMMARY_COLUMNS = ('Main_Cell', 'Paired_Cell', 'Resultant_Grade')
+
+# Sheet for each pairing category, in schedule order, then the unpaired cells
+CATEGORY_SHEETS = ('Poor Grades Bettered', 'Non-Improved Grades', 'Acceptable Grades', 'Acceptable & Non-Improved')
+REMAINING_SHEET = 'Remaining Cells'
+
+# Rows buffered before each write to a CSV export
+CSV_CHUNK_ROWS = 10000
+
+
+# (main cell, paired cell, resultant grade) rows for one category, straight from the schedule table
+def category_rows(tapping_schedule, category):
+    return tapping_schedule['table'].category(category).records()
+
+
+# (cell, individual grade) rows for the cells left unpaired
+def remaining_rows(tapping_schedule):
+    for cell, _, grade in tapping_schedule['table'].category('remaining').records():
+        yield cell, grade
+
+
+# Overall Summary rows: every pair, category by category, then the unpaired cells with no partner
+def summary_rows(tapping_schedule):
+    return tapping_schedule['table'].records()
+
+
+# Overall Summary columns, with a partner column per further pot when crucibles take metal from more than two
+def summary_columns(tapping_schedule):
+    return tapping_schedule['table'].columns(SUMMARY_COLUMNS)
+
+
+def _write_sheet(workbook, name, columns, rows):
+    worksheet = workbook.add_worksheet(name)
+    header = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+    worksheet.write_row(0, 0, columns, header)
+    for number, values in enumerate(rows, start=1):
+        for column, value in enumerate(values):
+            if value is not None:
+                worksheet.write(number, column, value)
+
+
+# Write the Overall Summary workbook to a path or file object, row by row.
+# xlsxwriter's constant_memory mode flushes each row as it goes, so memory stays flat however long the potline.
+# With `category_columns` (column names for each category sheet, plus the remaining cells' columns last)
+# the per-category sheets are added after the summary.
+def write_workbook(tapping_schedule, target, category_columns=None):
+    workbook = xlsxwriter.Workbook(target, {'constant_memory': True})
+    _write_sheet(workbook, 'Overall_Summary', summary_columns(tapping_schedule), summary_rows(tapping_schedule))
+    if category_columns is not None:
+        for name, category, columns in zip(CATEGORY_SHEETS, CATEGORIES, category_columns):
+            columns = tapping_schedule['table'].category(category).columns(columns)
+            _write_sheet(workbook, name, columns, category_rows(tapping_schedule, category))
+        _write_sheet(workbook, REMAINING_SHEET, category_columns[-1], remaining_rows(tapping_schedule))
+    workbook.close()
+
+
+# The Overall Summary workbook as bytes, for a download button
+def workbook_bytes(tapping_schedule, category_columns=None):
+    output_file = io.BytesIO()
+    write_workbook(tapping_schedule, output_file, category_columns)
+    return output_file.getvalue()
+
+
+# Write the Overall Summary as CSV to a text file object, a chunk of rows at a time
+def write_summary_csv(tapping_schedule, target, chunk_rows=CSV_CHUNK_ROWS):
+    writer = csv.writer(target)
+    writer.writerow(summary_columns(tapping_schedule))
+    chunk = []
+    for values in summary_rows(tapping_schedule):
+        chunk.append(values)
+        if len(chunk) >= chunk_rows:
+            writer.writerows(chunk)
+            chunk.clear()
+    writer.writerows(chunk)
+
+
+# The Overall Summary as CSV bytes, for a download button
+def csv_bytes(tapping_schedule, chunk_rows=CSV_CHUNK_ROWS):
+    output_file = io.BytesIO()
+    # Rows are encoded as they are written, so the text of the whole CSV is never held next to its bytes
+    text_file = io.TextIOWrapper(output_file, encoding='utf-8', newline='')
+    write_summary_csv(tapping_schedule, text_file, chunk_rows)
+    text_file.detach()
+    return output_file.getvalue()
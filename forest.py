@@ -0,0 +1,313 @@
+import functools
+import hashlib
+import json
+import os
+import sys
+import warnings
+import numpy as np
+import diagnostics
+import grading
+import models
+
+# An exported model is a folder of .npy arrays and a meta.json next to its pickle
+META_FILE = 'meta.json'
+
+# Arrays of an exported forest, all trees one after the other in flat node arrays
+FOREST_ARRAYS = ('roots', 'left', 'right', 'feature', 'threshold', 'value')
+
+# Leaf tables of an exported forest, left out when a tree's table would be too big
+TABLE_ARRAYS = ('edges', 'offsets', 'table_starts', 'table')
+
+# Largest leaf table a single tree may have, in cells
+TABLE_CELLS = 1 << 16
+
+# Rows pushed through the trees at once; the traversal holds one node index per row and tree
+PREDICT_ROWS = 4000
+
+# Features a forest may use and still be compiled down to the grade thresholds
+GRADE_FEATURES = ('Avg_Si', 'Avg_Fe')
+
+
+# Export folder for a pickled model: paired_model.pkl is exported to paired_model_forest/
+def forest_dir(model_path):
+    return os.path.splitext(model_path)[0] + '_forest'
+
+
+FOREST_DIR = forest_dir(models.MODEL_FILE)
+
+
+# A random forest as flat NumPy arrays, predicting like scikit-learn's predict_proba without it.
+# When the export has leaf tables, each tree finds a row's leaf with one lookup: the row's features are
+# binned once against every split value of the forest, and each tree maps those bins to its own cell.
+# Otherwise every tree is walked for the whole batch at once, all rows one level down per step; leaves
+# point back at themselves, so after `depth` steps every row sits on its leaf in every tree.
+class Forest:
+    def __init__(self, arrays, features, grades, depth):
+        self.roots, self.left, self.right, self.feature, self.threshold, self.value = (arrays[name] for name in FOREST_ARRAYS)
+        self.tables = all(name in arrays for name in TABLE_ARRAYS)
+        if self.tables:
+            self.edges, self.offsets, self.table_starts, self.table = (arrays[name] for name in TABLE_ARRAYS)
+        self.feature_names_in_ = np.array(features, dtype=object)
+        self.grades = list(grades)
+        self.classes_ = np.arange(len(grades))
+        self.depth = depth
+
+    # Leaf of each row in the trees starting at `roots`, comparing the features exactly as given
+    def walk(self, features, roots):
+        rows = np.arange(len(features))[:, None]
+        nodes = np.broadcast_to(roots, (len(features), len(roots)))
+        for _ in range(self.depth):
+            go_left = features[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    # Leaf of each row in every tree, found in the leaf tables
+    def table_leaves(self, features):
+        cells = np.tile(self.table_starts, (len(features), 1))
+        for column in range(features.shape[1]):
+            cells += self.offsets[column][np.searchsorted(self.edges[column], features[:, column])]
+        return self.table[cells]
+
+    def predict_proba(self, features):
+        # Trees trained without missing values send them down whichever side had more samples; not kept here
+        if np.isnan(features).any():
+            raise ValueError("Exported forest cannot predict missing feature values")
+        probabilities = np.zeros((len(features), len(self.grades)))
+        for start in range(0, len(features), PREDICT_ROWS):
+            # scikit-learn compares float32 features against float64 thresholds; so do we, to split the same way
+            batch_features = np.asarray(features[start:start + PREDICT_ROWS], dtype=np.float32).astype(np.float64)
+            if self.tables:
+                leaves = self.table_leaves(batch_features)
+            else:
+                leaves = self.walk(batch_features, self.roots)
+            # Trees are added up one by one in order, as scikit-learn does, so the sums round the same way
+            batch = probabilities[start:start + PREDICT_ROWS]
+            for tree_leaves in leaves.T:
+                batch += self.value[tree_leaves]
+        return probabilities / len(self.roots)
+
+    def predict(self, features):
+        return self.classes_[np.argmax(self.predict_proba(features), axis=1)]
+
+
+# A forest that turned out to grade pairs exactly like the threshold table: every leaf is certain of its
+# grade and that grade is the one the thresholds give the pair's average Si and Fe. Prediction is a table lookup.
+class ThresholdTable:
+    def __init__(self, features, grades, thresholds):
+        self.feature_names_in_ = np.array(features, dtype=object)
+        self.grades = list(grades)
+        self.classes_ = np.arange(len(grades))
+        self.thresholds = tuple(tuple(band) for band in thresholds)
+        self.class_of_code = np.full(len(grading.GRADES) + 1, -1)
+        self.class_of_code[[grading.grade_code(grade) for grade in self.grades]] = self.classes_
+        self.columns = [features.index(name) for name in GRADE_FEATURES]
+
+    def predict_proba(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        codes = grading.grade_codes(features[:, self.columns[0]], features[:, self.columns[1]], self.thresholds)
+        return np.eye(len(self.grades))[self.class_of_code[codes]]
+
+    def predict(self, features):
+        return self.classes_[np.argmax(self.predict_proba(features), axis=1)]
+
+
+# Flat arrays of a fitted RandomForestClassifier. Node numbers are offset so every tree's nodes follow
+# the previous tree's; leaves get themselves as both children and feature 0 (never compared in effect).
+# Leaf values are the class fractions each tree predicts, exactly as DecisionTreeClassifier returns them.
+def forest_arrays(model):
+    roots, left, right, feature, threshold, value = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count) + offset
+        leaf = tree.children_left < 0
+        roots.append(offset)
+        left.append(np.where(leaf, nodes, tree.children_left + offset))
+        right.append(np.where(leaf, nodes, tree.children_right + offset))
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(np.where(leaf, np.inf, tree.threshold))
+        fractions = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+        totals = fractions.sum(axis=1, keepdims=True)
+        # scikit-learn before 1.4 stores class counts, which its predict_proba divides by their sum; later
+        # versions store the fractions and return them as they are, so dividing again would change the last bit
+        if not np.allclose(totals, 1):
+            fractions = fractions / np.where(totals == 0, 1, totals)
+        value.append(fractions)
+        offset += tree.node_count
+    return {
+        'roots': np.array(roots, dtype=np.int32),
+        'left': np.concatenate(left).astype(np.int32),
+        'right': np.concatenate(right).astype(np.int32),
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'value': np.concatenate(value),
+    }
+
+
+# Leaf tables for the flat forest arrays, or None when a tree would need more than TABLE_CELLS cells.
+# A tree splitting on k values of a feature cuts it into k + 1 bins; its table has a cell for every
+# combination of bins of the features it splits on, holding the leaf those values reach. A value's bin
+# in a tree comes from its bin among the split values of the whole forest (`edges`): `offsets` holds, for
+# every feature, forest bin and tree, how far into the tree's table that bin moves the cell.
+def leaf_tables(arrays, feature_count, depth):
+    forest = Forest(arrays, [''] * feature_count, [], depth)
+    split = arrays['left'] != np.arange(len(arrays['left']))
+    tree_of = np.repeat(np.arange(len(arrays['roots'])), np.diff(np.append(arrays['roots'], len(arrays['left']))))
+    all_edges = [np.unique(arrays['threshold'][split & (arrays['feature'] == column)]) for column in range(feature_count)]
+    width = max(len(edges) for edges in all_edges)
+    edges = np.full((feature_count, width), np.inf)
+    offsets = np.zeros((feature_count, width + 1, len(arrays['roots'])), dtype=np.int64)
+    table_starts, table = [], []
+    start = 0
+    for column, column_edges in enumerate(all_edges):
+        edges[column, :len(column_edges)] = column_edges
+    for tree, root in enumerate(arrays['roots']):
+        tree_split = split & (tree_of == tree)
+        axes = []
+        for column in range(feature_count):
+            tree_edges = np.unique(arrays['threshold'][tree_split & (arrays['feature'] == column)])
+            if len(tree_edges):
+                axes.append((column, tree_edges))
+        size = np.prod([len(tree_edges) + 1 for _, tree_edges in axes], dtype=np.int64)
+        if size > TABLE_CELLS:
+            return None
+        stride = 1
+        for column, tree_edges in reversed(axes):
+            # The largest value of each bin stands for the whole bin: the split value closing it, or infinity
+            offsets[column, :, tree] = np.searchsorted(tree_edges, np.append(edges[column], np.inf)) * stride
+            stride *= len(tree_edges) + 1
+        points = np.zeros((size, feature_count))
+        grid = np.meshgrid(*[np.append(tree_edges, np.inf) for _, tree_edges in axes], indexing='ij')
+        for (column, _), values in zip(axes, grid):
+            points[:, column] = values.ravel()
+        table_starts.append(start)
+        start += size
+        table.append(forest.walk(points, np.array([root]))[:, 0])
+    return {
+        'edges': edges,
+        'offsets': offsets.astype(np.int32),
+        'table_starts': np.array(table_starts, dtype=np.int32),
+        'table': np.concatenate(table).astype(np.int32),
+    }
+
+
+# One feature row inside every region the forest's splits (and the grade thresholds) cut Avg_Si x Avg_Fe into,
+# for each room and section the forest can see. Points sit between split values, never on one.
+def region_samples(forest, thresholds):
+    features = list(forest.feature_names_in_)
+    axes = []
+    for name, band in zip(GRADE_FEATURES, zip(*thresholds)):
+        column = features.index(name)
+        edges = np.unique(np.concatenate([forest.threshold[forest.feature == column], band]))
+        edges = edges[np.isfinite(edges)]
+        axes.append(np.concatenate([[edges[0] - 1], (edges[:-1] + edges[1:]) / 2, [edges[-1] + 1]]))
+    si, fe = (values.ravel() for values in np.meshgrid(*axes, indexing='ij'))
+    samples = np.zeros((len(si), len(features)))
+    samples[:, features.index('Avg_Si')] = si
+    samples[:, features.index('Avg_Fe')] = fe
+    # The first room and section have no one-hot column; every other one is switched on in a copy of its own
+    variants = [samples]
+    for column, name in enumerate(features):
+        if name not in GRADE_FEATURES:
+            variants.append(samples.copy())
+            variants[-1][:, column] = 1
+    return np.concatenate(variants)
+
+
+# Whether the forest is the threshold table in disguise: it only splits on the average Si and Fe,
+# every leaf is certain, and in every region of its splits it predicts the threshold grade
+def matches_thresholds(forest, thresholds=None):
+    thresholds = thresholds or grading.default_thresholds()
+    features = list(forest.feature_names_in_)
+    if not all(name in features for name in GRADE_FEATURES):
+        return False
+    split = forest.left != np.arange(len(forest.left))
+    if not np.isin(forest.feature[split], [features.index(name) for name in GRADE_FEATURES]).all():
+        return False
+    if not np.isin(forest.value, (0, 1)).all():
+        return False
+    table = ThresholdTable(features, forest.grades, thresholds)
+    samples = region_samples(forest, thresholds)
+    return bool(np.array_equal(forest.predict(samples), table.predict(samples)))
+
+
+# Write a fitted forest (and its label encoder's grades) to `path` as flat arrays, or as just the grade
+# thresholds when it predicts exactly like them. The export is checked against the model's own
+# predict_proba in every region of its splits before it is written; a ValueError means the copy would not predict the same.
+# `model_path` is the pickle the model came from, recorded so a retrained pickle makes the export stale.
+def export_forest(model, label_encoder, path=FOREST_DIR, thresholds=None, check_rows=20000, model_path=None):
+    thresholds = thresholds or grading.default_thresholds()
+    features = [str(name) for name in model.feature_names_in_]
+    grades = [str(grade) for grade in label_encoder.inverse_transform(model.classes_)]
+    arrays = forest_arrays(model)
+    depth = max(estimator.tree_.max_depth for estimator in model.estimators_)
+    arrays.update(leaf_tables(arrays, len(features), depth) or {})
+    forest = Forest(arrays, features, grades, depth)
+
+    samples = region_samples(forest, thresholds) if all(name in features for name in GRADE_FEATURES) else np.zeros((0, len(features)))
+    samples = samples[np.random.default_rng(0).permutation(len(samples))[:check_rows]]
+    with warnings.catch_warnings():
+        # The samples are a plain array in the model's feature order
+        warnings.simplefilter('ignore', UserWarning)
+        expected = model.predict_proba(samples) if len(samples) else None
+    if len(samples) and not np.array_equal(forest.predict_proba(samples), expected):
+        raise ValueError("Exported forest does not predict like the model")
+
+    meta = {'features': features, 'grades': grades, 'depth': int(depth), 'kind': 'forest', 'tables': forest.tables,
+            'model_sha256': model_hash(model_path) if model_path else None}
+    if matches_thresholds(forest, thresholds):
+        meta.update({'kind': 'thresholds', 'thresholds': [list(band) for band in thresholds]})
+    os.makedirs(path, exist_ok=True)
+    if meta['kind'] == 'forest':
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+    # meta.json goes last: a folder without it is an unfinished export and is not loaded
+    with open(os.path.join(path, META_FILE), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+    diagnostics.log_event('model_exported', path=path, kind=meta['kind'], nodes=len(arrays['left']))
+    return meta
+
+
+@functools.lru_cache(maxsize=4)
+def _load_forest(path, mtime):
+    with open(os.path.join(path, META_FILE)) as meta_file:
+        meta = json.load(meta_file)
+    if meta['kind'] == 'thresholds':
+        return ThresholdTable(meta['features'], meta['grades'], meta['thresholds'])
+    # Memory-mapped: loading is instant and the pages are shared by every process reading the same files
+    names = FOREST_ARRAYS + (TABLE_ARRAYS if meta['tables'] else ())
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in names}
+    return Forest(arrays, meta['features'], meta['grades'], meta['depth'])
+
+
+# The exported pair model, loaded once per process and again whenever it is exported anew
+def load_forest(path=FOREST_DIR):
+    return _load_forest(path, os.path.getmtime(os.path.join(path, META_FILE)))
+
+
+# SHA-256 of a model file, hashed again only when the file changes
+def model_hash(model_path):
+    return _model_hash(model_path, os.path.getmtime(model_path))
+
+
+@functools.lru_cache(maxsize=8)
+def _model_hash(model_path, mtime):
+    with open(model_path, 'rb') as model_file:
+        return hashlib.sha256(model_file.read()).hexdigest()
+
+
+# Whether `path` holds an export of exactly the pickled model at `model_path`.
+# The model's hash is compared, not file times, which a git checkout does not keep.
+def is_current(path=FOREST_DIR, model_path=models.MODEL_FILE):
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as meta_file:
+        return json.load(meta_file).get('model_sha256') == model_hash(model_path)
+
+
+# Run after training: python forest.py [paired_model.pkl] [label_encoder.pkl] [output folder]
+if __name__ == '__main__':
+    model_path, encoder_path, path = sys.argv[1:4] + [models.MODEL_FILE, models.LABEL_ENCODER_FILE, FOREST_DIR][len(sys.argv[1:4]):]
+    meta = export_forest(models.load_model(model_path), models.load_label_encoder(encoder_path), path, model_path=model_path)
+    print(f"Exported {model_path} to {path} as {meta['kind']}")
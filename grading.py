@@ -0,0 +1,121 @@
+import functools
+import numpy as np
+import diagnostics
+
+# Grades from best to worst purity. The position of a grade in this tuple is its integer grade code.
+GRADES = ('0303', '0404', '0406', '0506', '0610', '1020', '1535', '2050')
+
+# Code used for values that cannot be graded (e.g. missing Si or Fe)
+NO_GRADE = -1
+
+# Grade groups used by the pairing passes, as grade codes
+PAIRABLE_CODES = (0, 1, 2)    # 0303, 0404, 0406
+ACCEPTABLE_CODES = (3, 4, 5)  # 0506, 0610, 1020
+POOR_CODES = (6, 7)           # 1535, 2050
+
+# Grade bands used when none are given: the standard profile of threshold_profiles.toml, the one place the
+# bands are set. Each band is the upper Si and Fe limit of 0303, 0404, 0406, 0506, 0610, 1020 and 1535, checked
+# in order; anything above the last band is 2050. profiles.py reads the file (again whenever it changes) and
+# imports this module, so it is imported here only when the bands are asked for.
+def default_thresholds():
+    import profiles
+    return profiles.get_profile(profiles.DEFAULT_PROFILE).thresholds
+
+
+# Assign a grade to a single Si and Fe value, same as walking the if/elif chain
+def assign_grade(si, fe, thresholds=None):
+    diagnostics.count('assign_grade_calls')
+    thresholds = thresholds or default_thresholds()
+    for grade, (si_max, fe_max) in zip(GRADES, thresholds):
+        if si <= si_max and fe <= fe_max:
+            return grade
+    si_max, fe_max = thresholds[-1]
+    if si >= si_max or fe >= fe_max:
+        return GRADES[-1]
+    return None
+
+
+# Grade lookup table compiled from a threshold table.
+# Si and Fe are each quantized into bins on the threshold values themselves: every threshold is a
+# bin of its own, and so is every open interval between two thresholds. All values in a bin compare
+# the same way against every threshold, so one precomputed grade per (Si bin, Fe bin) is exact,
+# whatever the lab resolution, including values sitting right on a boundary like 0.034.
+class GradeTable:
+    def __init__(self, thresholds):
+        self.thresholds = thresholds
+        self.si_edges = np.unique([si_max for si_max, _ in thresholds])
+        self.fe_edges = np.unique([fe_max for _, fe_max in thresholds])
+        self.si_steps = np.sort(np.concatenate([self.si_edges, np.nextafter(self.si_edges, np.inf)]))
+        self.fe_steps = np.sort(np.concatenate([self.fe_edges, np.nextafter(self.fe_edges, np.inf)]))
+        si_values = self._representatives(self.si_edges)
+        fe_values = self._representatives(self.fe_edges)
+        self.codes = np.array(
+            [[grade_code(assign_grade(si, fe, thresholds)) for fe in fe_values] for si in si_values],
+            dtype=np.int8,
+        )
+
+    # One value inside each bin: below the first threshold, each threshold, between thresholds,
+    # above the last, and a last bin for missing values
+    @staticmethod
+    def _representatives(edges):
+        values = [edges[0] - 1]
+        for lower, upper in zip(edges[:-1], edges[1:]):
+            values += [lower, (lower + upper) / 2]
+        values += [edges[-1], edges[-1] + 1, np.nan]
+        return values
+
+    # Bin index of each value: 2k strictly below threshold k (and above k-1), 2k+1 exactly on threshold k.
+    # `steps` holds each threshold and the next float up, so one sorted search finds the bin.
+    @staticmethod
+    def bins(steps, values):
+        bins = np.searchsorted(steps, values, side='right')
+        return np.where(np.isnan(values), len(steps) + 1, bins)
+
+    def lookup(self, si, fe):
+        si = np.asarray(si, dtype=np.float64)
+        fe = np.asarray(fe, dtype=np.float64)
+        return self.codes[self.bins(self.si_steps, si), self.bins(self.fe_steps, fe)]
+
+
+# Compiled lookup table for a threshold table, built once and rebuilt whenever the thresholds change
+def grade_table(thresholds=None):
+    return _compile_grade_table(tuple(tuple(band) for band in thresholds or default_thresholds()))
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_grade_table(thresholds):
+    return GradeTable(thresholds)
+
+
+# Assign grade codes to whole arrays of Si and Fe values in one go, as a table lookup.
+# Si and Fe are broadcast against each other, so any matching shapes work (columns, N x N matrices, ...).
+def grade_codes(si, fe, thresholds=None):
+    codes = grade_table(thresholds).lookup(si, fe)
+    diagnostics.count('grade_lookups')
+    diagnostics.count('graded_values', np.size(codes))
+    return codes
+
+
+# Grade codes for the average of every pair of cells, as an N x N matrix
+def pair_grade_matrix(si, fe, thresholds=None):
+    si = np.asarray(si, dtype=np.float64)
+    fe = np.asarray(fe, dtype=np.float64)
+    avg_si = (si[:, None] + si[None, :]) / 2
+    avg_fe = (fe[:, None] + fe[None, :]) / 2
+    return grade_codes(avg_si, avg_fe, thresholds)
+
+
+# Grade name for a single grade code, None if it could not be graded
+def grade_name(code):
+    return None if code == NO_GRADE else GRADES[code]
+
+
+# Grade code for a single grade name, NO_GRADE for None
+def grade_code(grade):
+    return NO_GRADE if grade is None else GRADES.index(grade)
+
+
+# Turn grade codes back into grade names, with None for values that could not be graded
+def grade_names(codes):
+    names = np.array(GRADES + (None,), dtype=object)
+    return names[np.asarray(codes, dtype=np.intp)]
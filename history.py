@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+import diagnostics
+import grading
+import ingest
+import models
+import schedule
+
+# The assay history next to the app: one raw binary file per column, appended to and never rewritten,
+# and a meta.json saying how many rows of them are committed
+HISTORY_DIR = os.path.join(models.MODEL_DIR, 'assay_history')
+META_FILE = 'meta.json'
+
+# Columns of the store and their types. Time is the assay time in whole seconds. Partner is the CELL the
+# assay was scheduled with (-1 when unpaired or not scheduled) and Grade the resultant grade code
+# (the cell's own grade when unpaired, NO_GRADE when not scheduled). Batch numbers the appends.
+COLUMNS = {
+    'CELL': np.int64,
+    'Time': np.int64,
+    'Si': np.float64,
+    'Fe': np.float64,
+    'Partner': np.int64,
+    'Grade': np.int8,
+    'Batch': np.int32,
+}
+
+# Per-cell index: every indexed row sorted by CELL then time, and where each CELL starts in that order.
+# Files are named after the rows they cover (index_order.<rows>.npy), so a reader always finds the index
+# its meta.json speaks of, even while an append builds the next one.
+INDEX_ARRAYS = ('index_order', 'index_cells', 'index_starts')
+
+# Rows appended after the index was last built that queries scan instead of looking up.
+# An append rebuilds the index once there are more.
+INDEX_TAIL_ROWS = 1 << 20
+
+# Assays per cell a trend is fitted to, and how many days ahead it projects the grade
+RECENT_ASSAYS = 10
+DRIFT_DAYS = 7
+
+SECONDS_PER_DAY = 86400
+
+
+# Assay times as whole seconds since the epoch: one time for every row, or a time per row
+def time_seconds(times, rows):
+    if np.ndim(times) == 0:
+        return np.full(rows, pd.Timestamp(times).to_datetime64().astype('datetime64[s]').astype(np.int64))
+    return pd.to_datetime(np.asarray(times)).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+# An append-only, columnar store of past assays and the schedules made from them, memory-mapped for reading.
+# Appends only ever add bytes at the end of each column file and then commit the new row count to meta.json,
+# so readers see whole appends only, and a crashed append is cut off by the next one. Any number of processes
+# can read the same store and share its pages; one process at a time appends.
+class AssayStore:
+    def __init__(self, path=HISTORY_DIR):
+        self.path = path
+        self.meta = None
+        self._arrays = {}
+        self.refresh()
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    # Read meta.json again, picking up appends made by other processes since the store was opened
+    def refresh(self):
+        meta_path = os.path.join(self.path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+        else:
+            meta = {'rows': 0, 'batches': 0, 'indexed_rows': 0}
+        if meta != self.meta:
+            self.meta = meta
+            self._arrays = {}
+        return self
+
+    def __len__(self):
+        return self.meta['rows']
+
+    # One column of the committed rows, memory-mapped
+    def column(self, name):
+        if name not in self._arrays:
+            if len(self):
+                self._arrays[name] = np.memmap(self._file(name), dtype=COLUMNS[name], mode='r', shape=(len(self),))
+            else:
+                self._arrays[name] = np.empty(0, dtype=COLUMNS[name])
+        return self._arrays[name]
+
+    def _index_file(self, name, rows):
+        return os.path.join(self.path, f'{name}.{rows}.npy')
+
+    def _index(self, name):
+        if name not in self._arrays:
+            for index_name in INDEX_ARRAYS:
+                if self.meta['indexed_rows']:
+                    self._arrays[index_name] = np.load(self._index_file(index_name, self.meta['indexed_rows']), mmap_mode='r')
+                else:
+                    self._arrays[index_name] = np.empty(0, dtype=np.int64)
+        return self._arrays[name]
+
+    def _commit(self, meta):
+        meta_path = os.path.join(self.path, META_FILE)
+        with open(meta_path + '.tmp', 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+        self.meta = None
+        self.refresh()
+
+    # Add graded assays (CELL, Si and Fe, as schedule.grade_cells leaves them) taken at `time`: one time for
+    # all of them, or one per row. With the schedule made from them, each row also records its partner and
+    # resultant grade. Returns the number of rows added.
+    # CELL is stored as a whole number; uploads with other cell ids are refused before anything is written.
+    def append(self, data, time, tapping_schedule=None):
+        rows = len(data)
+        numbers = pd.to_numeric(pd.Series(np.asarray(data['CELL'])), errors='coerce')
+        whole = (numbers.notna() & (numbers == numbers.round())).to_numpy()
+        if not whole.all():
+            bad = pd.unique(np.asarray(data['CELL'])[~whole])[:5]
+            raise ValueError(f"The assay history needs whole-number CELL values, not e.g. {', '.join(map(str, bad))}")
+        columns = {
+            'CELL': numbers.to_numpy(dtype=np.int64),
+            'Time': time_seconds(time, rows),
+            'Si': np.asarray(data['Si'], dtype=np.float64),
+            'Fe': np.asarray(data['Fe'], dtype=np.float64),
+            'Partner': np.full(rows, -1, dtype=np.int64),
+            'Grade': np.full(rows, grading.NO_GRADE, dtype=np.int8),
+            'Batch': np.full(rows, self.meta['batches'], dtype=np.int32),
+        }
+        if tapping_schedule is not None:
+            # The schedule's rows are positions in `data`; a group's further pots are scheduled with the main cell
+            table = tapping_schedule['table']
+            cells = tapping_schedule['potline'].cells
+            columns['Grade'][table.rows] = table.codes
+            paired = table.partners >= 0
+            columns['Partner'][table.rows[paired]] = cells[table.partners[paired]]
+            columns['Partner'][table.partners[paired]] = cells[table.rows[paired]]
+            columns['Grade'][table.partners[paired]] = table.codes[paired]
+            if table.others is not None:
+                for others in table.others.T:
+                    grouped = others >= 0
+                    columns['Partner'][others[grouped]] = cells[table.rows[grouped]]
+                    columns['Grade'][others[grouped]] = table.codes[grouped]
+
+        os.makedirs(self.path, exist_ok=True)
+        for name, dtype in COLUMNS.items():
+            with open(self._file(name), 'ab') as column_file:
+                # Anything past the committed rows is left from an append that never finished
+                column_file.truncate(len(self) * np.dtype(dtype).itemsize)
+                column_file.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        meta = dict(self.meta, rows=len(self) + rows, batches=self.meta['batches'] + 1)
+        self._commit(meta)
+        diagnostics.count('history_rows_appended', rows)
+        if len(self) - self.meta['indexed_rows'] > INDEX_TAIL_ROWS:
+            self.reindex()
+        return rows
+
+    # Sort every committed row into the per-cell index
+    def reindex(self):
+        cells, times = self.column('CELL'), self.column('Time')
+        with diagnostics.stage('history_index'):
+            order = np.lexsort((np.arange(len(self)), times, cells))
+            index_cells, index_starts = np.unique(cells[order], return_index=True)
+        for name, array in zip(INDEX_ARRAYS, (order, index_cells, np.append(index_starts, len(self)))):
+            np.save(self._index_file(name, len(self)), array.astype(np.int64))
+        previous = self.meta['indexed_rows']
+        self._commit(dict(self.meta, indexed_rows=len(self)))
+        # Readers still mapping the previous index keep their pages until they let go of them
+        if previous and previous != len(self):
+            for name in INDEX_ARRAYS:
+                try:
+                    os.remove(self._index_file(name, previous))
+                except OSError:
+                    pass
+
+    # Rows of one CELL assayed from `start` up to (not including) `end`, oldest first. Indexed rows are a binary
+    # search away; rows appended since the index was built are scanned.
+    def cell_rows(self, cell, start=None, end=None):
+        times = self.column('Time')
+        lo_time = -np.inf if start is None else time_seconds(start, 1)[0]
+        hi_time = np.inf if end is None else time_seconds(end, 1)[0]
+        index_cells = self._index('index_cells')
+        found = np.searchsorted(index_cells, cell)
+        rows = np.empty(0, dtype=np.int64)
+        if found < len(index_cells) and index_cells[found] == cell:
+            starts = self._index('index_starts')
+            rows = np.asarray(self._index('index_order')[starts[found]:starts[found + 1]])
+            lo, hi = np.searchsorted(times[rows], [lo_time, hi_time])
+            rows = rows[lo:hi]
+        indexed = self.meta['indexed_rows']
+        tail = indexed + np.flatnonzero(self.column('CELL')[indexed:] == cell)
+        tail = tail[(times[tail] >= lo_time) & (times[tail] < hi_time)]
+        if len(tail):
+            rows = np.concatenate([rows, tail])
+            rows = rows[np.lexsort((rows, times[rows]))]
+        return rows
+
+    # The given rows (all of them by default) as a table, times as datetimes and grades as names
+    def frame(self, rows=None):
+        selection = slice(None) if rows is None else rows
+        frame = pd.DataFrame({name: self.column(name)[selection] for name in COLUMNS})
+        frame['Time'] = frame['Time'].to_numpy().astype('datetime64[s]')
+        frame['Partner'] = frame['Partner'].where(frame['Partner'] >= 0)
+        frame['Grade'] = grading.grade_names(frame['Grade'].to_numpy())
+        return frame
+
+    # Every assay of one CELL from `start` up to `end`, oldest first
+    def cell_history(self, cell, start=None, end=None):
+        return self.frame(self.cell_rows(cell, start, end))
+
+    # Every assay from `start` up to `end`, in the order they were added: one sequential pass over the
+    # memory-mapped time column, for retraining and benchmarks
+    def assays(self, start=None, end=None):
+        times = self.column('Time')
+        keep = np.ones(len(self), dtype=bool)
+        if start is not None:
+            keep &= times >= time_seconds(start, 1)[0]
+        if end is not None:
+            keep &= times < time_seconds(end, 1)[0]
+        return self.frame(np.flatnonzero(keep))
+
+    # Recent Si and Fe trend of each cell in `cells` (all cells by default): a straight line through its last
+    # `recent` assays from `start` up to `end`, its slope per day, and the grade that line reaches `drift_days`
+    # after the last assay, e.g. a pot drifting towards 1535. Cells with a single assay have no slope.
+    # Projections below zero are cut off at zero and left without a grade.
+    def trends(self, cells=None, start=None, end=None, recent=RECENT_ASSAYS, drift_days=DRIFT_DAYS, thresholds=None):
+        all_cells = self.column('CELL')
+        times = self.column('Time')
+        keep = np.ones(len(self), dtype=bool) if cells is None else np.isin(all_cells, np.asarray(cells, dtype=np.int64))
+        if start is not None:
+            keep &= times >= time_seconds(start, 1)[0]
+        if end is not None:
+            keep &= times < time_seconds(end, 1)[0]
+        rows = np.flatnonzero(keep)
+        cell_ids, times = all_cells[rows], times[rows]
+        order = np.lexsort((rows, times, cell_ids))
+        rows, cell_ids, times = rows[order], cell_ids[order], times[order]
+
+        # The last `recent` rows of every cell
+        trend_cells, starts, counts = np.unique(cell_ids, return_index=True, return_counts=True)
+        group = np.repeat(np.arange(len(trend_cells)), counts)
+        from_end = np.repeat(starts + counts, counts) - np.arange(len(rows))
+        recent_rows = from_end <= recent
+        rows, group, times = rows[recent_rows], group[recent_rows], times[recent_rows]
+
+        # Least squares per cell, in days since each cell's last assay
+        count = np.bincount(group, minlength=len(trend_cells))
+        last_rows = np.cumsum(count) - 1
+        last_time = times[last_rows]
+        days = (times - last_time[group]) / SECONDS_PER_DAY
+        mean_days = np.bincount(group, days, len(trend_cells)) / count
+        spread = np.bincount(group, (days - mean_days[group]) ** 2, len(trend_cells))
+        trend = {'CELL': trend_cells, 'Assays': count, 'Last_Time': last_time.astype('datetime64[s]')}
+        for name in ('Si', 'Fe'):
+            values = np.asarray(self.column(name)[rows])
+            mean = np.bincount(group, values, len(trend_cells)) / count
+            with np.errstate(invalid='ignore', divide='ignore'):
+                slope = np.bincount(group, (days - mean_days[group]) * (values - mean[group]), len(trend_cells)) / spread
+            slope[spread == 0] = np.nan
+            trend[f'Last_{name}'] = values[last_rows]
+            trend[f'{name}_Slope'] = slope
+            # The line's value `drift_days` on; no slope means no drift, and a falling line stops at zero
+            trend[f'Drift_{name}'] = np.maximum(mean + np.nan_to_num(slope) * (drift_days - mean_days), 0)
+        trend['Grade'] = grading.grade_names(grading.grade_codes(trend['Last_Si'], trend['Last_Fe'], thresholds))
+        # A projection that reaches zero is past anything the line says, so it gets no grade
+        drift_codes = grading.grade_codes(trend['Drift_Si'], trend['Drift_Fe'], thresholds)
+        drift_codes[(trend['Drift_Si'] == 0) | (trend['Drift_Fe'] == 0)] = grading.NO_GRADE
+        trend['Drift_Grade'] = grading.grade_names(drift_codes)
+        return pd.DataFrame(trend)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep the assay history: append assay files, look up cells and their trends.")
+    parser.add_argument('--store', default=HISTORY_DIR, help="folder of the assay history")
+    commands = parser.add_subparsers(dest='command', required=True)
+    append = commands.add_parser('append', help="schedule an assay file and add its assays and schedule to the history")
+    append.add_argument('input', help="assay file (xlsx, csv or parquet) with CELL, Si and Fe")
+    append.add_argument('--time', required=True, help="when the assays were taken, e.g. 2024-05-01T06:00")
+    cell = commands.add_parser('cell', help="print the assays of one cell")
+    cell.add_argument('cell', type=int)
+    cell.add_argument('--start', help="first assay time to include")
+    cell.add_argument('--end', help="assay time to stop before")
+    trends = commands.add_parser('trends', help="print every cell's recent Si and Fe trend")
+    trends.add_argument('--drifting', action='store_true', help="only cells whose projected grade is worse than their last one")
+    commands.add_parser('reindex', help="rebuild the per-cell index")
+    args = parser.parse_args(argv)
+
+    store = AssayStore(args.store)
+    if args.command == 'append':
+        filtered_data = schedule.grade_cells(ingest.read_assays(args.input))
+        try:
+            rows = store.append(filtered_data, args.time, schedule.build_schedule(filtered_data))
+        except ValueError as error:
+            parser.error(str(error))
+        print(f"Added {rows} assays to {args.store} ({len(store)} in all)")
+    elif args.command == 'cell':
+        print(store.cell_history(args.cell, args.start, args.end).to_string(index=False))
+    elif args.command == 'trends':
+        trend = store.trends()
+        if args.drifting:
+            trend = trend[grading.grade_codes(trend['Drift_Si'], trend['Drift_Fe']) > grading.grade_codes(trend['Last_Si'], trend['Last_Fe'])]
+        print(trend.to_string(index=False))
+    else:
+        store.reindex()
+        print(f"Indexed {len(store)} assays")
+
+
+if __name__ == '__main__':
+    main()
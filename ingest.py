@@ -0,0 +1,62 @@
+import os
+import pandas as pd
+import pyarrow.parquet
+
+# The only columns grading and pairing use
+ASSAY_COLUMNS = ['CELL', 'Si', 'Fe']
+
+# File types accepted for assay uploads
+UPLOAD_TYPES = ['xlsx', 'csv', 'parquet']
+
+
+# Excel files are read with calamine (python-calamine, in Rust), CSV files with pyarrow's multi-threaded parser
+EXCEL_ENGINE = 'calamine'
+CSV_ENGINE = 'pyarrow'
+
+
+# File type from the file name (or path), defaulting to Excel like the original uploader
+def file_type(name):
+    extension = os.path.splitext(name or '')[1].lower().lstrip('.')
+    return extension if extension in UPLOAD_TYPES else 'xlsx'
+
+
+# Give the assay columns explicit dtypes: Si and Fe as float64 (anything that is not a number,
+# e.g. "offline", becomes missing), CELL as int64 when every CELL is a whole number.
+# `extra_columns` are kept as they are.
+def typed_assays(data, extra_columns=()):
+    wanted = ASSAY_COLUMNS + [column for column in extra_columns if column not in ASSAY_COLUMNS]
+    data = data[[column for column in wanted if column in data.columns]].copy()
+    for column in ('Si', 'Fe'):
+        if column in data.columns:
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype('float64')
+    if 'CELL' in data.columns and pd.api.types.is_numeric_dtype(data['CELL']):
+        cells = data['CELL']
+        if cells.notna().all() and (cells == cells.round()).all():
+            data['CELL'] = cells.astype('int64')
+    return data
+
+
+# Read an assay file (path or uploaded file object) as a compact typed table of CELL, Si and Fe,
+# plus any `extra_columns` asked for (e.g. a partition column).
+# Only those columns are parsed; missing ones are simply absent, so callers can report them.
+def read_assays(source, name=None, extra_columns=()):
+    wanted = ASSAY_COLUMNS + [column for column in extra_columns if column not in ASSAY_COLUMNS]
+    if name is None:
+        name = getattr(source, 'name', source if isinstance(source, str) else None)
+    kind = file_type(name)
+
+    if kind == 'csv':
+        header = pd.read_csv(source, nrows=0).columns
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        columns = [column for column in wanted if column in header]
+        data = pd.read_csv(source, usecols=columns, engine=CSV_ENGINE)
+    elif kind == 'parquet':
+        header = pyarrow.parquet.read_schema(source).names
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        data = pd.read_parquet(source, columns=[column for column in wanted if column in header])
+    else:
+        data = pd.read_excel(source, usecols=lambda column: column in wanted, engine=EXCEL_ENGINE)
+
+    return typed_assays(data, extra_columns)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import diagnostics
+
+# Schedules computed at the same time. Jobs beyond this wait in the queue, in the order they came,
+# so a few big uploads share the CPU instead of every session starting its own computation.
+JOB_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+# Finished jobs kept for reattaching before the oldest are forgotten. Their schedules are not kept with them:
+# the page takes each one into schedule_cache, whose memory cap bounds them (see Job.take_result).
+FINISHED_JOBS = 32
+
+# Seconds a page waits for its job before showing progress instead, so small files still appear at once,
+# and how often a page showing progress checks the job again
+INLINE_SECONDS = 2.0
+POLL_SECONDS = 1.0
+
+# Job states
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+# Id of the job for a schedule cache key: the same upload and settings always give the same id,
+# so a rerun (or another session) finds the job already running instead of starting it again
+def job_id(key):
+    return hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+
+
+# One scheduling run in the background. Everything it reports goes to its own Diagnostics, which is
+# what the page reads to show which stage it is in; cancelling sets the Diagnostics' cancel flag, and
+# the run stops at its next stage or checkpoint.
+class Job:
+    def __init__(self, job_id, function, args, kwargs, stages=(), name=''):
+        self.id = job_id
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.stages = tuple(stages)
+        self.diagnostics = diagnostics.Diagnostics(name or job_id)
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self._done = threading.Event()
+
+    def run(self):
+        if self.diagnostics.cancel_requested:
+            self._finish(CANCELLED)
+            return
+        self.state = RUNNING
+        try:
+            with self.diagnostics.collecting():
+                self.result = self.function(*self.args, **self.kwargs)
+            self._finish(DONE)
+        except diagnostics.Cancelled:
+            self._finish(CANCELLED)
+        except Exception as error:
+            self.error = error
+            self._finish(FAILED)
+
+    def _finish(self, state):
+        self.state = state
+        self.finished = time.time()
+        # The arguments (the whole upload) are not needed any more
+        self.args, self.kwargs = (), {}
+        diagnostics.log_event('job', job=self.id, state=state, seconds=round(self.finished - self.submitted, 6))
+        self._done.set()
+
+    # The finished run's result, handed over once: the job lets go of it, so a finished job
+    # kept for reattaching holds only its state and diagnostics
+    def take_result(self):
+        result, self.result = self.result, None
+        return result
+
+    def cancel(self):
+        self.diagnostics.cancel()
+
+    def done(self):
+        return self._done.is_set()
+
+    # Wait for the job to finish, at most `timeout` seconds. True when it has finished.
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    # How far the job has got: the fraction of its stages finished, and a line saying what it is doing
+    def progress(self):
+        if self.state == QUEUED:
+            return 0.0, "Waiting for a free worker"
+        if self.done():
+            return 1.0, self.state.capitalize()
+        finished = sum(name in self.diagnostics.stages for name in self.stages)
+        running = list(self.diagnostics.running)
+        text = "Running " + " / ".join(name.replace('_', ' ') for name in running) if running else "Running"
+        counters = self.diagnostics.counters
+        if 'partitions' in running and counters['partitions']:
+            text += f" ({counters['partitions_scheduled']} of {counters['partitions']} done)"
+        return (finished / len(self.stages) if self.stages else 0.0), text
+
+
+# Background jobs on a small pool of worker threads, looked up by id. A job submitted again under an id
+# that is queued, running, or done with its result not yet taken is the same job; any other is started again.
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, finished_jobs=FINISHED_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='schedule-job')
+        self.finished_jobs = finished_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Run `function(*args, **kwargs)` as job `job_id`, or return the job already under that id.
+    # `stages` are the diagnostics stages the function goes through, for progress.
+    def submit(self, job_id, function, *args, stages=(), name='', **kwargs):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and (job.state in (QUEUED, RUNNING) or (job.state == DONE and job.result is not None)):
+                return job
+            job = Job(job_id, function, args, kwargs, stages, name)
+            self.jobs[job_id] = job
+            self._forget_finished()
+        self.executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done()]
+        for job_id in finished[:max(0, len(finished) - self.finished_jobs)]:
+            del self.jobs[job_id]
+
+
+# The process-wide queue. Streamlit re-runs the app script on every interaction but keeps imported
+# modules, so jobs survive reruns and are shared by every session on the same server.
+queue = JobQueue()
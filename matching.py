@@ -0,0 +1,153 @@
+import numpy as np
+import networkx as nx
+import diagnostics
+import grading
+import pairing
+from grading import GRADES
+from pairing import PAIRABLE, ACCEPTABLE, POOR, NOT_POOR, BETTERED
+
+# Relative value of one pot of metal at each grade, best grade first. The last slot is for ungraded metal.
+GRADE_VALUES = np.append(np.arange(len(GRADES), 0, -1), 0)
+
+# Value lost per position of crucible travel between two paired cells
+DISTANCE_WEIGHT = 0.05
+
+# How many neighbouring cells on each side of a cell are considered as partners
+NEIGHBOURS = 10
+
+
+# Which pairs the scheduling rules allow, same as the greedy passes:
+# poor with acceptable when the grade is bettered, poor with poor, 0303/0404/0406 among themselves,
+# acceptable among themselves, and acceptable with 0303/0404/0406.
+def allowed_pairs(codes_a, codes_b, pair_codes):
+    poor_a, poor_b = POOR[codes_a], POOR[codes_b]
+    acceptable_a, acceptable_b = ACCEPTABLE[codes_a], ACCEPTABLE[codes_b]
+    pairable_a, pairable_b = PAIRABLE[codes_a], PAIRABLE[codes_b]
+    return (
+        (((poor_a & acceptable_b) | (acceptable_a & poor_b)) & BETTERED[pair_codes])
+        | (poor_a & poor_b & POOR[pair_codes])
+        | (pairable_a & pairable_b & PAIRABLE[pair_codes])
+        | (acceptable_a & acceptable_b & NOT_POOR[pair_codes])
+        | (acceptable_a & pairable_b)
+        | (pairable_a & acceptable_b)
+    )
+
+
+# Grade codes for the blend of each (row, partner) pair
+def pair_codes(potline, rows, partners):
+    avg_si, avg_fe = pairing.blend(potline, rows, partners)
+    return grading.grade_codes(avg_si, avg_fe, potline.thresholds)
+
+
+# Metal value gained by pairing two cells instead of tapping them alone, less the crucible travel
+def pair_weights(potline, rows, partners, codes, distance_weight=DISTANCE_WEIGHT):
+    distances = np.abs(potline.partner_positions[rows] - potline.partner_positions[partners])
+    gain = 2 * GRADE_VALUES[codes] - GRADE_VALUES[potline.codes[rows]] - GRADE_VALUES[potline.codes[partners]]
+    return gain - distance_weight * distances
+
+
+# Most cells (distinct CELLs) one optimal solve takes. The solve grows much faster than the line (about 7s
+# for 1,000 cells, 54s for 3,000) and cannot be cancelled once started, so bigger lines are refused.
+OPTIMAL_MAX_CELLS = 2000
+
+
+# Refuse an optimal solve over more than OPTIMAL_MAX_CELLS cells
+def check_optimal_size(cells):
+    if cells > OPTIMAL_MAX_CELLS:
+        raise ValueError(f"Optimal mode solves at most {OPTIMAL_MAX_CELLS} cells at once, not {cells}; "
+                         "use Greedy mode or schedule by room or section")
+
+
+# Sparse candidate graph: each cell is linked to its nearest neighbours along the potline,
+# plus any `extra_pairs` (e.g. the greedy schedule) so the solve can never do worse than them.
+# Only the first row of each CELL takes part, like the greedy passes.
+def candidate_edges(potline, neighbours=NEIGHBOURS, max_distance=None, extra_pairs=()):
+    rows = np.unique(potline.keys, return_index=True)[1]
+    rows = rows[np.lexsort((rows, potline.partner_positions[rows]))]
+
+    pairs = [np.column_stack((rows[:-k], rows[k:])) for k in range(1, min(neighbours, len(rows) - 1) + 1)]
+    if len(extra_pairs):
+        pairs.append(np.array([(row, partner) for row, partner, _ in extra_pairs], dtype=np.int64))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int8)
+    pairs = np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)
+
+    rows, partners = pairs[:, 0], pairs[:, 1]
+    keep = potline.keys[rows] != potline.keys[partners]
+    if max_distance is not None:
+        keep &= np.abs(potline.partner_positions[rows] - potline.partner_positions[partners]) <= max_distance
+    codes = pair_codes(potline, rows, partners)
+    keep &= allowed_pairs(potline.codes[rows], potline.codes[partners], codes)
+    return pairs[keep], codes[keep]
+
+
+# Pair all cells in one solve: the most pairs possible, and among those the most metal value
+# for the least crucible travel. Returns (main row, partner row, pair grade code) tuples,
+# the main row being the worse grade of the two (or the earlier cell for equal grades).
+def optimal_pairs(potline, neighbours=NEIGHBOURS, max_distance=None, distance_weight=DISTANCE_WEIGHT, extra_pairs=()):
+    check_optimal_size(potline.key_count)
+    pairs, codes = candidate_edges(potline, neighbours, max_distance, extra_pairs)
+    weights = pair_weights(potline, pairs[:, 0], pairs[:, 1], codes, distance_weight)
+    diagnostics.count('candidate_pairs', len(pairs))
+
+    graph = nx.Graph()
+    for (row, partner), weight in zip(pairs.tolist(), weights.tolist()):
+        graph.add_edge(row, partner, weight=weight)
+    matched = nx.max_weight_matching(graph, maxcardinality=True)
+
+    code_of = {(row, partner): code for (row, partner), code in zip(pairs.tolist(), codes.tolist())}
+    result = []
+    for row, partner in matched:
+        row, partner = min(row, partner), max(row, partner)
+        code = code_of[(row, partner)]
+        if potline.codes[partner] > potline.codes[row]:
+            row, partner = partner, row
+        result.append((row, partner, code))
+    result.sort(key=lambda pair: pair[0])
+    return result
+
+
+# Split pairs into the schedule's categories, in the order the greedy passes fill them:
+# poor grades bettered, 0303/0404/0406 pairs, acceptable pairs, and acceptable with 0303/0404/0406
+def split_by_category(potline, pairs):
+    poor, pairable, acceptable, mixed = [], [], [], []
+    for pair in pairs:
+        main_code, partner_code = potline.codes[pair[0]], potline.codes[pair[1]]
+        if POOR[main_code]:
+            poor.append(pair)
+        elif PAIRABLE[main_code] and PAIRABLE[partner_code]:
+            pairable.append(pair)
+        elif ACCEPTABLE[main_code] and ACCEPTABLE[partner_code]:
+            acceptable.append(pair)
+        else:
+            mixed.append(pair)
+    return poor, pairable, acceptable, mixed
+
+
+# Headline numbers for a schedule: pairs, unpaired cells, metal value, crucible travel and overall score
+def schedule_metrics(potline, pairs, distance_weight=DISTANCE_WEIGHT):
+    rows = np.array([pair[0] for pair in pairs], dtype=np.int64)
+    partners = np.array([pair[1] for pair in pairs], dtype=np.int64)
+    used = potline.new_used()
+    used[potline.keys[rows]] = True
+    used[potline.keys[partners]] = True
+    unpaired = np.unique(potline.keys, return_index=True)[1]
+    unpaired = unpaired[~used[potline.keys[unpaired]]]
+
+    metal_value = 2 * GRADE_VALUES[pair_codes(potline, rows, partners)].sum() + GRADE_VALUES[potline.codes[unpaired]].sum()
+    travel = np.abs(potline.partner_positions[rows] - potline.partner_positions[partners]).sum()
+    return {
+        "Pairs": len(pairs),
+        "Unpaired": len(unpaired),
+        "Metal_Value": int(metal_value),
+        "Travel": int(travel),
+        "Score": float(metal_value - distance_weight * travel),
+    }
+
+
+# Compare the optimal schedule with the greedy one, with the improvement as a third row
+def compare_schedules(potline, greedy, optimal, distance_weight=DISTANCE_WEIGHT):
+    greedy_metrics = schedule_metrics(potline, greedy, distance_weight)
+    optimal_metrics = schedule_metrics(potline, optimal, distance_weight)
+    improvement = {name: optimal_metrics[name] - greedy_metrics[name] for name in greedy_metrics}
+    return {"Greedy": greedy_metrics, "Optimal": optimal_metrics, "Improvement": improvement}
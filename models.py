@@ -0,0 +1,27 @@
+import functools
+import os
+
+# Files written by the training notebook, next to the app
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = os.path.join(MODEL_DIR, 'paired_model.pkl')
+LABEL_ENCODER_FILE = os.path.join(MODEL_DIR, 'label_encoder.pkl')
+
+
+# Unpickle a model file once per process. Streamlit re-runs the app script on every interaction but keeps
+# imported modules, so this cache survives reruns. The file's modification time is part of the key,
+# so a retrained model saved over the old one is picked up on the next call.
+@functools.lru_cache(maxsize=8)
+def _load(path, mtime):
+    # joblib and scikit-learn are only imported when a model is actually needed
+    import joblib
+    return joblib.load(path)
+
+
+# The trained pair model, loaded on first use
+def load_model(path=MODEL_FILE):
+    return _load(path, os.path.getmtime(path))
+
+
+# The label encoder for the pair model's grade classes, loaded on first use
+def load_label_encoder(path=LABEL_ENCODER_FILE):
+    return _load(path, os.path.getmtime(path))
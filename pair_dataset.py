@@ -0,0 +1,153 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import grading
+import history
+import partitions
+
+# Columns of the pair training data, as the notebook builds them
+PAIR_COLUMNS = ['Cell_A', 'Cell_B', 'Room', 'Section', 'Avg_Si', 'Avg_Fe', 'Initial_Grade_A', 'Initial_Grade_B', 'Paired_Grade']
+
+# Cells only pair with cells of the same section, as in the notebook. Historical data can add
+# e.g. a date column, so only cells assayed together are paired.
+PAIR_BY = ('Section',)
+
+# Pairs built at once; a chunk takes about 100 bytes per pair while it is being built
+CHUNK_PAIRS = 2000000
+
+# Pairs per Parquet shard
+SHARD_PAIRS = 10000000
+
+
+# Grade names as a categorical, so millions of pair rows share eight strings
+def grade_categories(codes):
+    return pd.Categorical.from_codes(codes, categories=grading.GRADES)
+
+
+# The assays with their grade, room and section, as the notebook adds them (cells above 100 in Room B,
+# Section 4, as scoring.py encodes them too). `cell_column` holds the cell numbers (Cell_ID in the notebook's files).
+def graded_cells(data, cell_column='Cell_ID', thresholds=None):
+    cells = data.copy()
+    si = pd.to_numeric(cells['Si'], errors='coerce').to_numpy(dtype=np.float64)
+    fe = pd.to_numeric(cells['Fe'], errors='coerce').to_numpy(dtype=np.float64)
+    cells['Grade'] = grade_categories(grading.grade_codes(si, fe, thresholds))
+    cells['Room'], cells['Section'] = partitions.model_rooms_sections(cells[cell_column])
+    return cells
+
+
+# Row indices of every pair of cells that share the `by` columns, in the order of
+# combinations(rows, 2): by first row, then second row. Yielded in chunks of about `chunk_pairs`
+# pairs (a row with more partners than that gets a chunk of its own).
+def pair_indices(cells, by=PAIR_BY, chunk_pairs=CHUNK_PAIRS):
+    groups = cells.groupby(list(by), sort=False, dropna=False).ngroup().to_numpy()
+    # Each group's rows side by side, in row order: a row's partners are the rows after it in its group
+    order = np.argsort(groups, kind='stable')
+    group_sizes = np.bincount(groups)
+    group_starts = np.concatenate([[0], np.cumsum(group_sizes)[:-1]])
+    place = np.empty(len(cells), dtype=np.int64)
+    place[order] = np.arange(len(cells))
+    first_partner = place + 1
+    partner_counts = group_starts[groups] + group_sizes[groups] - first_partner
+
+    ends = np.cumsum(partner_counts)
+    start_row = 0
+    while start_row < len(cells):
+        pairs_before = ends[start_row - 1] if start_row else 0
+        end_row = max(int(np.searchsorted(ends, pairs_before + chunk_pairs, side='right')), start_row + 1)
+        counts = partner_counts[start_row:end_row]
+        if counts.sum():
+            rows = np.repeat(np.arange(start_row, end_row), counts)
+            # Position of each pair among its row's partners: 0, 1, ... for every row
+            steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            yield rows, order[np.repeat(first_partner[start_row:end_row], counts) + steps]
+        start_row = end_row
+
+
+# The pair training data for graded cells (see graded_cells), one DataFrame per chunk of pairs.
+# Features and labels are the same as the notebook's loop over combinations, row for row:
+# the average Si and Fe of the two cells, their room and section, and the grade of the average.
+def pair_chunks(cells, cell_column='Cell_ID', by=PAIR_BY, chunk_pairs=CHUNK_PAIRS, thresholds=None):
+    cell_ids = cells[cell_column].to_numpy()
+    si = pd.to_numeric(cells['Si'], errors='coerce').to_numpy(dtype=np.float64)
+    fe = pd.to_numeric(cells['Fe'], errors='coerce').to_numpy(dtype=np.float64)
+    grade_codes = cells['Grade'].cat.codes.to_numpy()
+    rooms = cells['Room'].to_numpy()
+    sections = cells['Section'].to_numpy()
+    extra = [column for column in by if column not in ('Room', 'Section')]
+    for rows, partners in pair_indices(cells, by, chunk_pairs):
+        avg_si = (si[rows] + si[partners]) / 2
+        avg_fe = (fe[rows] + fe[partners]) / 2
+        chunk = {
+            'Cell_A': cell_ids[rows], 'Cell_B': cell_ids[partners],
+            'Room': rooms[rows], 'Section': sections[rows],
+            'Avg_Si': avg_si, 'Avg_Fe': avg_fe,
+            'Initial_Grade_A': grade_categories(grade_codes[rows]),
+            'Initial_Grade_B': grade_categories(grade_codes[partners]),
+            'Paired_Grade': grade_categories(grading.grade_codes(avg_si, avg_fe, thresholds)),
+        }
+        chunk.update({column: cells[column].to_numpy()[rows] for column in extra})
+        yield pd.DataFrame(chunk)
+
+
+# The whole pair training data in memory, for data the size of one potline
+def pair_dataset(data, cell_column='Cell_ID', by=PAIR_BY, thresholds=None):
+    cells = graded_cells(data, cell_column, thresholds)
+    chunks = list(pair_chunks(cells, cell_column, by, thresholds=thresholds))
+    if not chunks:
+        return pd.DataFrame(columns=PAIR_COLUMNS + [column for column in by if column not in PAIR_COLUMNS])
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Stream the pair training data to Parquet shards part-00000.parquet, part-00001.parquet, ... in `directory`,
+# so months of history never have to fit in memory at once. pd.read_parquet(directory) reads them back as one table.
+# Returns the shard paths.
+def write_pair_shards(data, directory, cell_column='Cell_ID', by=PAIR_BY, shard_pairs=SHARD_PAIRS,
+                      thresholds=None):
+    import pyarrow
+    import pyarrow.parquet
+    os.makedirs(directory, exist_ok=True)
+    cells = graded_cells(data, cell_column, thresholds)
+    paths, writer = [], None
+    shard_rows = 0
+    for chunk in pair_chunks(cells, cell_column, by, min(CHUNK_PAIRS, shard_pairs), thresholds):
+        if writer is None or shard_rows >= shard_pairs:
+            if writer is not None:
+                writer.close()
+            paths.append(os.path.join(directory, f'part-{len(paths):05d}.parquet'))
+            table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+            writer = pyarrow.parquet.ParquetWriter(paths[-1], table.schema)
+            shard_rows = 0
+        else:
+            table = pyarrow.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+        writer.write_table(table)
+        shard_rows += len(chunk)
+    if writer is not None:
+        writer.close()
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the pair training data from assay history as Parquet shards.")
+    parser.add_argument('input', help="assay file (xlsx, csv or parquet) with cell numbers, Si and Fe, or an assay history folder "
+                                      "(see history.py; its cells are in CELL and each upload is a Batch, e.g. --cell-column CELL --by Batch Section)")
+    parser.add_argument('output_dir', help="folder for the part-NNNNN.parquet shards")
+    parser.add_argument('--cell-column', default='Cell_ID', help="column holding the cell numbers")
+    parser.add_argument('--by', nargs='+', default=list(PAIR_BY), help="columns two cells must share to be paired (e.g. Date Section)")
+    parser.add_argument('--shard-pairs', type=int, default=SHARD_PAIRS, help="pairs per shard")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.input):
+        data = history.AssayStore(args.input).assays()
+    elif args.input.lower().endswith('.csv'):
+        data = pd.read_csv(args.input)
+    elif args.input.lower().endswith('.parquet'):
+        data = pd.read_parquet(args.input)
+    else:
+        data = pd.read_excel(args.input)
+    paths = write_pair_shards(data, args.output_dir, args.cell_column, args.by, args.shard_pairs)
+    print(f"Wrote {len(paths)} shards to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
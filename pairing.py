@@ -0,0 +1,272 @@
+import copy
+import numpy as np
+import diagnostics
+import grading
+from grading import GRADES, PAIRABLE_CODES, ACCEPTABLE_CODES, POOR_CODES
+
+
+# Boolean lookup over grade codes, indexable directly with a code array.
+# The extra last slot belongs to NO_GRADE (-1), so ungraded pairs can be allowed or refused too.
+def code_mask(codes, no_grade=False):
+    mask = np.zeros(len(GRADES) + 1, dtype=bool)
+    mask[list(codes)] = True
+    mask[-1] = no_grade
+    return mask
+
+
+PAIRABLE = code_mask(PAIRABLE_CODES)
+ACCEPTABLE = code_mask(ACCEPTABLE_CODES)
+POOR = code_mask(POOR_CODES)
+NOT_POOR = ~POOR  # includes ungraded results, as `grade not in ['1535', '2050']` did
+# What bettering a poor cell takes: a graded result that is not poor. A blend that cannot be graded never counts.
+BETTERED = code_mask(set(range(len(GRADES))) - set(POOR_CODES))
+
+
+# Everything the pairing passes need about a potline, precomputed once as arrays
+# `weights` is the metal tapped from each pot (e.g. its tonnage); without it every pot counts the same in a blend.
+class Potline:
+    def __init__(self, cells, si, fe, positions, thresholds=None, weights=None):
+        self.cells = np.asarray(cells)
+        self.si = np.asarray(si, dtype=np.float64)
+        self.fe = np.asarray(fe, dtype=np.float64)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.thresholds = thresholds or grading.default_thresholds()
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+        if self.weights is not None and not (np.isfinite(self.weights) & (self.weights > 0)).all():
+            bad = self.cells[~(np.isfinite(self.weights) & (self.weights > 0))]
+            raise ValueError(f"Metal tapped must be a positive number for every pot; {len(bad)} cells have none, "
+                             f"e.g. CELL {', '.join(map(str, bad[:5].tolist()))}")
+        self.codes = grading.grade_codes(self.si, self.fe, self.thresholds)
+
+        # Optional pair scorer (see scoring.ModelScorer) ranking the partners a search finds
+        self.scorer = None
+
+        # CELL -> position and row of the first row with that CELL, and a small integer key per CELL
+        # so used cells can be tracked in an array instead of a set
+        self.cell_index = {}
+        self.cell_rows = {}
+        key_of = {}
+        self.keys = np.empty(len(self.cells), dtype=np.int64)
+        for row, cell in enumerate(self.cells.tolist()):
+            if cell not in key_of:
+                key_of[cell] = len(key_of)
+                self.cell_index[cell] = int(self.positions[row])
+                self.cell_rows[cell] = row
+            self.keys[row] = key_of[cell]
+        self.key_count = len(key_of)
+
+        # Distances are measured to the first row of the partner's CELL
+        first_positions = np.fromiter(self.cell_index.values(), dtype=np.int64, count=self.key_count)
+        self.partner_positions = first_positions[self.keys]
+
+    def __len__(self):
+        return len(self.cells)
+
+    def new_used(self):
+        return np.zeros(self.key_count, dtype=bool)
+
+    # The same potline graded with other thresholds. Cells, keys and distances are shared, only the grades are new.
+    def with_thresholds(self, thresholds):
+        potline = copy.copy(self)
+        potline.thresholds = thresholds
+        potline.codes = grading.grade_codes(self.si, self.fe, thresholds)
+        potline.scorer = None
+        return potline
+
+
+# Build a Potline from the filtered upload; the frame index is the position used for distances.
+# `weight_column` names the column holding the metal tapped from each pot, if blends are weighted by it.
+def potline_from_frame(filtered_data, thresholds=None, weight_column=None):
+    return Potline(
+        filtered_data['CELL'].to_numpy(),
+        filtered_data['Si'].to_numpy(),
+        filtered_data['Fe'].to_numpy(),
+        filtered_data.index.to_numpy(),
+        thresholds,
+        None if weight_column is None else filtered_data[weight_column].to_numpy(),
+    )
+
+
+# Si and Fe of the metal of `rows` tapped together with `partners` (arrays or single rows, broadcast):
+# the plain average of the two pots, or the average weighted by the metal tapped from each
+def blend(potline, rows, partners):
+    if potline.weights is None:
+        return (potline.si[rows] + potline.si[partners]) / 2, (potline.fe[rows] + potline.fe[partners]) / 2
+    weights = potline.weights
+    total = weights[rows] + weights[partners]
+    return ((weights[rows] * potline.si[rows] + weights[partners] * potline.si[partners]) / total,
+            (weights[rows] * potline.fe[rows] + weights[partners] * potline.fe[partners]) / total)
+
+
+# Window the first search looks at on each side of a cell, in positions. It doubles until a partner turns up.
+FIRST_WINDOW = 4
+
+# Main cells a pass goes through between checks that the run has not been cancelled
+CHECKPOINT_ROWS = 1000
+
+# Allowance for rounding in reach_limit, so a partner that blends exactly onto a grade limit is never ruled out
+REACH_SLACK = 1e-9
+
+
+# Highest Si and Fe a blend can have and still get one of the grades `result_mask` allows.
+# Blends that cannot be graded all lie below the last band, so allowing them (the mask's last slot)
+# allows up to that band.
+def grade_bounds(result_mask, thresholds):
+    bands = [band for code, band in enumerate(thresholds) if result_mask[code]]
+    if result_mask[grading.NO_GRADE]:
+        bands.append(thresholds[-1])
+    if result_mask[len(thresholds):len(GRADES)].any() or not bands:
+        return np.inf, np.inf
+    return max(si_max for si_max, _ in bands), max(fe_max for _, fe_max in bands)
+
+
+# Highest value a partner can have for its blend with `value` to stay within `bound`: the mirror image of
+# `value` for an even blend. A weighted blend lies between the two values, so only a cell already above
+# the bound needs a partner below it.
+def reach_limit(potline, value, bound):
+    if potline.weights is None:
+        return 2 * bound - value + REACH_SLACK
+    return bound + REACH_SLACK if value > bound else np.inf
+
+
+# Candidate rows for one pairing option, sorted by the position distances are measured to
+class Candidates:
+    def __init__(self, potline, rows):
+        order = np.lexsort((rows, potline.partner_positions[rows]))
+        self.rows = rows[order]
+        self.positions = potline.partner_positions[self.rows]
+        self.lowest = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    # True once every candidate has been paired
+    def exhausted(self, potline, used):
+        return bool(used[potline.keys[self.rows]].all())
+
+    # Drop the candidates paired since the last call, so searches stop going over them
+    def compact(self, potline, used):
+        unused = ~used[potline.keys[self.rows]]
+        if not unused.all():
+            self.rows = self.rows[unused]
+            self.positions = self.positions[unused]
+            self.lowest = None
+
+    # Rows whose position is within `window` of `position` on either side
+    def around(self, position, window):
+        lo = np.searchsorted(self.positions, position - window, side='left')
+        hi = np.searchsorted(self.positions, position + window, side='right')
+        return self.rows[lo:hi], lo == 0 and hi == len(self.rows)
+
+    # False when no candidate can blend with `row` within `si_bound` and `fe_bound` (grade_bounds), wherever it is:
+    # checked against the lowest Fe among the candidates up to each Si, so a cell nothing on the line can
+    # pair with is turned down without searching the whole line. Candidates used since the last compact()
+    # still count, which only lets more cells through to the search.
+    def can_reach(self, potline, row, si_bound, fe_bound):
+        if self.lowest is None:
+            order = np.argsort(potline.si[self.rows], kind='stable')
+            self.lowest = (potline.si[self.rows][order], np.minimum.accumulate(potline.fe[self.rows][order]))
+        lowest_si, lowest_fe = self.lowest
+        count = np.searchsorted(lowest_si, reach_limit(potline, potline.si[row], si_bound), side='right')
+        return bool(count) and lowest_fe[count - 1] <= reach_limit(potline, potline.fe[row], fe_bound)
+
+
+# Closest unused partner for one cell, among the candidate rows whose pair grade is allowed.
+# The search expands outward from the cell's position and stops at the first window holding an
+# eligible partner, since everything outside the window is further away. Partners further than
+# `max_distance` are never considered. Ties go to the row that comes first in the potline, like
+# the original strict `<` comparison.
+def closest_partner(potline, row, candidates, used, result_mask, exclude_self, max_distance=None):
+    position = potline.positions[row]
+    window = FIRST_WINDOW if max_distance is None else min(FIRST_WINDOW, max_distance)
+    while True:
+        rows, everything = candidates.around(position, window)
+        rows = rows[~used[potline.keys[rows]]]
+        if exclude_self:
+            rows = rows[potline.keys[rows] != potline.keys[row]]
+
+        if len(rows):
+            diagnostics.count('candidate_pairs', len(rows))
+            avg_si, avg_fe = blend(potline, row, rows)
+            pair_codes = grading.grade_codes(avg_si, avg_fe, potline.thresholds)
+            allowed = result_mask[pair_codes]
+            if allowed.any():
+                rows = rows[allowed]
+                pair_codes = pair_codes[allowed]
+                distances = np.abs(position - potline.partner_positions[rows])
+                if potline.scorer is None or len(rows) == 1:
+                    closest = np.flatnonzero(distances == distances.min())
+                    best = closest[np.argmin(rows[closest])]
+                else:
+                    # Best-scored partner in the window, then the closest of those, then the first row
+                    best = np.lexsort((rows, distances, -potline.scorer.score(potline, row, rows)))[0]
+                return rows[best], pair_codes[best]
+
+        if everything or (max_distance is not None and window >= max_distance):
+            return None, None
+        # Before the first widening: if nothing anywhere on the line can blend into an allowed grade, stop here
+        if window <= FIRST_WINDOW and not candidates.can_reach(potline, row, *grade_bounds(result_mask, potline.thresholds)):
+            return None, None
+        window = window * 2 if max_distance is None else min(window * 2, max_distance)
+
+
+# One greedy pass: every unused cell with a main grade takes its closest eligible partner.
+# `options` are (partner grades, allowed pair grades, exclude self) tried in order until one finds a partner.
+# Returns (main row, partner row, pair grade code) tuples and marks both cells in `used`.
+def greedy_pass(potline, used, main_mask, options, max_distance=None):
+    # Cells already used by an earlier pass can never be picked, so they are left out from the start
+    unused = ~used[potline.keys]
+    candidate_sets = [Candidates(potline, np.flatnonzero(partner_mask[potline.codes] & unused)) for partner_mask, _, _ in options]
+    pairs = []
+    for number, row in enumerate(np.flatnonzero(main_mask[potline.codes] & unused)):
+        if number % CHECKPOINT_ROWS == 0:
+            diagnostics.checkpoint()
+            for candidates in candidate_sets:
+                candidates.compact(potline, used)
+        if used[potline.keys[row]]:
+            continue
+        for candidates, (_, result_mask, exclude_self) in zip(candidate_sets, options):
+            partner, pair_code = closest_partner(potline, row, candidates, used, result_mask, exclude_self, max_distance)
+            if partner is not None:
+                pairs.append((row, partner, pair_code))
+                used[potline.keys[row]] = True
+                used[potline.keys[partner]] = True
+                break
+        else:
+            # No partner left for anyone: the remaining cells of this pass would search in vain
+            if all(candidates.exhausted(potline, used) for candidates in candidate_sets):
+                break
+    return pairs
+
+
+# First pass: better the poor grades with acceptable grades, or failing that pair them with other poor grades
+def pair_poor_cells(potline, used, max_distance=None):
+    return greedy_pass(potline, used, POOR, [
+        (ACCEPTABLE, BETTERED, False),
+        (POOR, POOR, True),
+    ], max_distance)
+
+
+# Second pass: pair 0303, 0404 and 0406 among themselves, keeping the result in that group
+def pair_pairable_cells(potline, used, max_distance=None):
+    return greedy_pass(potline, used, PAIRABLE, [
+        (PAIRABLE, PAIRABLE, True),
+    ], max_distance)
+
+
+# Third pass: pair the acceptable grades among themselves without dropping to a poor grade
+def pair_acceptable_cells(potline, used, max_distance=None):
+    return greedy_pass(potline, used, ACCEPTABLE, [
+        (ACCEPTABLE, NOT_POOR, True),
+    ], max_distance)
+
+
+# Last pass: pair the acceptable grades still unpaired with the 0303/0404/0406 grades still unpaired,
+# preferring a partner that lifts the pair into 0303/0404/0406, and the closest one either way.
+# Returns the pairs and the rows of the cells left without a partner once the pass is done.
+def pair_leftover_cells(potline, used, max_distance=None):
+    pairs = greedy_pass(potline, used, ACCEPTABLE, [
+        (PAIRABLE, PAIRABLE, True),
+        (PAIRABLE, NOT_POOR, True),
+    ], max_distance)
+    return pairs, np.flatnonzero(~used[potline.keys])
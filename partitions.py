@@ -0,0 +1,180 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import diagnostics
+import matching
+import pairing
+import schedule
+
+# Potline layout from the notebook's get_room_section: 25 cells to a section and two sections to a room,
+# so cells 1-25 and 26-50 are sections 1 and 2 of Room A, and 51-75 and 76-100 sections 3 and 4 of Room B
+SECTION_CELLS = 25
+ROOM_SECTIONS = 2
+
+# Built-in partition keys; any other key is the name of a column of the assays
+PARTITIONS = ('room', 'section')
+
+# Lines smaller than this are scheduled partition by partition in this process,
+# since starting worker processes would take longer than the pairing itself
+PARALLEL_MIN_CELLS = 5000
+
+# Worker processes for partitions, shared by every run in the process: page jobs running side by side queue
+# their partitions on the same workers instead of each starting a pool of its own
+PARTITION_WORKERS = os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# The shared partition pool, started on first use. Its workers are spawned, not forked, since runs come
+# from the threads of the page's job queue and a threaded server is not safe to fork.
+def partition_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARTITION_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+# Section number of each cell number
+def cell_sections(cells):
+    return (np.asarray(cells, dtype=np.int64) - 1) // SECTION_CELLS + 1
+
+
+# Room letter of each cell number
+def cell_rooms(cells):
+    room_numbers = np.maximum((cell_sections(cells) - 1) // ROOM_SECTIONS, 0)
+    letters = np.array([chr(ord('A') + number) for number in range(room_numbers.max(initial=0) + 1)])
+    return letters[room_numbers]
+
+
+# Room and section of each cell as the notebook's get_room_section gave them to the pair model: cells 1-100 as
+# above, every cell above 100 in Room B, Section 4, and cells below 1 in Room B, Section 3. Cells that are not
+# numbers get no room ('') and section 0, so none of the model's one-hot columns is set for them.
+def model_rooms_sections(cells):
+    numbers = pd.to_numeric(pd.Series(np.asarray(cells)), errors='coerce').to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        sections = np.where(numbers < 1, 3, np.minimum(np.ceil(numbers / SECTION_CELLS), 2 * ROOM_SECTIONS))
+    unknown = np.isnan(numbers)
+    rooms = np.where(unknown, '', np.where(sections <= ROOM_SECTIONS, 'A', 'B')).astype(object)
+    return rooms, np.where(unknown, 0, sections).astype(np.int64)
+
+
+# Partition label of every row of the graded assays: its room, its section, or the value of a column
+def partition_labels(filtered_data, partition):
+    if partition in PARTITIONS:
+        if not pd.api.types.is_numeric_dtype(filtered_data['CELL']):
+            raise ValueError("Room and section partitions need numeric CELL values")
+        return cell_rooms(filtered_data['CELL']) if partition == 'room' else cell_sections(filtered_data['CELL'])
+    if partition not in filtered_data.columns:
+        raise ValueError(f"No column {partition!r} to partition the potline by")
+    return filtered_data[partition].to_numpy()
+
+
+# Add up the Optimal vs Greedy comparisons of the partitions; every figure in them is a total
+def add_comparisons(total, comparison):
+    if comparison is None:
+        return total
+    if total is None:
+        return {name: dict(metrics) for name, metrics in comparison.items()}
+    for name, metrics in comparison.items():
+        for metric, value in metrics.items():
+            total[name][metric] += value
+    return total
+
+
+# Schedule a batch of partitions in a worker process
+def schedule_parts(parts, thresholds, max_distance, mode, scorer):
+    return [schedule.build_schedule(part, thresholds, max_distance, mode, scorer) for part in parts]
+
+
+# Schedule every partition on its own, on the shared partition pool (in this process when `workers` is 1
+# or the line is small), and put the results back together on the whole potline. With `cross_partition`, the cells left unpaired inside their partition then go
+# through the pairing passes once more over the whole line, so they can still pair across a boundary.
+# Rows with no partition label (e.g. an empty custom column) are only paired in that last pass.
+def build_partitioned_schedule(filtered_data, partition, thresholds=None, max_distance=None,
+                               mode="Greedy", cross_partition=True, workers=None, scorer=None):
+    labels, names = pd.factorize(partition_labels(filtered_data, partition), sort=True)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], np.arange(len(names) + 1))
+    part_rows = [order[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    parts = [filtered_data.iloc[rows] for rows in part_rows]
+    diagnostics.count('partitions', len(parts))
+
+    results = []
+    with diagnostics.stage('partitions'):
+        if workers == 1 or PARTITION_WORKERS == 1 or len(parts) < 2 or len(filtered_data) < PARALLEL_MIN_CELLS:
+            for part in parts:
+                results.append(schedule.build_schedule(part, thresholds, max_distance, mode, scorer))
+                diagnostics.count('partitions_scheduled')
+        else:
+            # Many small partitions (the sections of a long line) go to the workers in batches
+            batch_size = max(1, len(parts) // (4 * PARTITION_WORKERS))
+            batches = [parts[start:start + batch_size] for start in range(0, len(parts), batch_size)]
+            futures = [partition_pool().submit(schedule_parts, batch, thresholds, max_distance, mode, scorer) for batch in batches]
+            try:
+                for future in futures:
+                    batch_results = future.result()
+                    results += batch_results
+                    diagnostics.count('partitions_scheduled', len(batch_results))
+                    diagnostics.checkpoint()
+            finally:
+                # A cancelled run drops its partitions not started yet; the workers stay for the next run
+                for future in futures:
+                    future.cancel()
+
+    # Partition rows back to rows of the whole potline. A CELL listed in two partitions keeps its first pair only.
+    potline = pairing.potline_from_frame(filtered_data, thresholds)
+    used = potline.new_used()
+    pairs = {category: [] for category in schedule.CATEGORIES}
+    comparison = None
+    for rows, part_schedule in zip(part_rows, results):
+        for category in schedule.CATEGORIES:
+            for row, partner, code in part_schedule['table'].category(category).pairs():
+                row, partner = rows[row], rows[partner]
+                if used[potline.keys[row]] or used[potline.keys[partner]]:
+                    continue
+                pairs[category].append((row, partner, code))
+                used[potline.keys[row]] = True
+                used[potline.keys[partner]] = True
+        comparison = add_comparisons(comparison, part_schedule['comparison'])
+
+    if cross_partition:
+        with diagnostics.stage('cross_partition'):
+            remaining = schedule.run_passes(potline, pairs, used, max_distance, scorer)
+    else:
+        remaining = np.flatnonzero(~used[potline.keys])
+    return schedule.finished_schedule(potline, pairs, remaining, comparison)
+
+
+# Refuse an Optimal run whose line, or largest partition, is more than one optimal solve takes
+# (matching.OPTIMAL_MAX_CELLS), before any partition is scheduled
+def check_optimal_size(filtered_data, partition=None):
+    if partition is None:
+        matching.check_optimal_size(filtered_data['CELL'].nunique())
+    elif len(filtered_data):
+        cells = pd.DataFrame({'label': partition_labels(filtered_data, partition), 'CELL': filtered_data['CELL'].to_numpy()})
+        matching.check_optimal_size(int(cells.groupby('label')['CELL'].nunique().max()))
+
+
+# Diagnostics stages schedule_line goes through with these settings, in order, for progress reports
+def line_stages(mode="Greedy", partition=None, cross_partition=True):
+    if partition is not None:
+        return ('partitions', 'cross_partition') if cross_partition else ('partitions',)
+    return ('potline',) + schedule.PASS_STAGES + (('optimal_matching',) if mode == "Optimal" else ())
+
+
+# Schedule the whole line, or partition by partition when a partition key is given.
+# Groups of more than two pots (`pots`, see schedule.build_schedule) are only formed on the whole line.
+def schedule_line(filtered_data, thresholds=None, max_distance=None, mode="Greedy",
+                  partition=None, cross_partition=True, workers=None, scorer=None, pots=2, weight_column=None):
+    if partition is None:
+        return schedule.build_schedule(filtered_data, thresholds, max_distance, mode, scorer, pots, weight_column)
+    if pots > 2 or weight_column is not None:
+        raise ValueError("Blending more than two pots or by tapped metal is scheduled on the whole line, not by partition")
+    if mode == "Optimal":
+        check_optimal_size(filtered_data, partition)
+    return build_partitioned_schedule(filtered_data, partition, thresholds, max_distance, mode, cross_partition, workers, scorer)
@@ -0,0 +1,53 @@
+import functools
+import os
+import tomllib
+import grading
+
+# Threshold profiles shipped with the app; another file can be passed to load_profiles()
+PROFILE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'threshold_profiles.toml')
+
+# Profile used when none is named
+DEFAULT_PROFILE = 'standard'
+
+
+# A named set of grade bands, compiled. `thresholds` is the tuple form every grading and pairing function
+# takes (and schedule caches are keyed on); the compiled grade lookup table is built here once, so grading
+# with the profile later is a cache hit.
+class ThresholdProfile:
+    def __init__(self, name, thresholds, description=''):
+        self.name = name
+        self.description = description or name
+        self.thresholds = tuple((float(si_max), float(fe_max)) for si_max, fe_max in thresholds)
+        self.table = grading.grade_table(self.thresholds)
+
+
+# Check a profile from the config file and turn it into a ThresholdProfile
+def parse_profile(name, settings):
+    bands = settings.get('bands') if isinstance(settings, dict) else None
+    if not isinstance(bands, list) or len(bands) != len(grading.GRADES) - 1:
+        raise ValueError(f"Threshold profile {name!r} needs {len(grading.GRADES) - 1} bands (0303 to 1535)")
+    for band in bands:
+        if not (isinstance(band, list) and len(band) == 2
+                and all(isinstance(limit, (int, float)) and not isinstance(limit, bool) and limit > 0 for limit in band)):
+            raise ValueError(f"Threshold profile {name!r}: every band is a pair of positive Si and Fe limits, got {band!r}")
+    return ThresholdProfile(name, bands, settings.get('description', ''))
+
+
+@functools.lru_cache(maxsize=8)
+def _load_profiles(path, mtime):
+    with open(path, 'rb') as profile_file:
+        config = tomllib.load(profile_file)
+    return {name: parse_profile(name, settings) for name, settings in config.items()}
+
+
+# Every profile in the config file by name, in file order. Read and compiled once, and again when the file changes.
+def load_profiles(path=PROFILE_FILE):
+    return _load_profiles(path, os.path.getmtime(path))
+
+
+# One profile by name; a KeyError lists the profiles there are
+def get_profile(name=DEFAULT_PROFILE, path=PROFILE_FILE):
+    available = load_profiles(path)
+    if name not in available:
+        raise KeyError(f"No threshold profile {name!r}; profiles: {', '.join(available)}")
+    return available[name]
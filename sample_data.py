@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+
+# Synthetic potline like the one generated in TappingSchedule.ipynb: uniform Si and Fe values with
+# some offline cells (no Si or Fe). With the defaults it reproduces the notebook's 100-cell sample exactly.
+def generate_potline(cells=100, offline=None, seed=42):
+    if offline is None:
+        offline = cells // 10
+    random = np.random.RandomState(seed)
+
+    cell_numbers = np.arange(1, cells + 1)
+    si_values = random.uniform(0.02, 0.25, size=cells)
+    fe_values = random.uniform(0.02, 0.4, size=cells)
+
+    # Randomly assign some cells as offline by setting Si and Fe to NaN
+    offline_cells = random.choice(cell_numbers, size=offline, replace=False)
+    si_values[offline_cells - 1] = np.nan
+    fe_values[offline_cells - 1] = np.nan
+
+    return pd.DataFrame({
+        "CELL": cell_numbers,
+        "Si": si_values,
+        "Fe": fe_values,
+    })
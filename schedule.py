@@ -0,0 +1,304 @@
+import numpy as np
+import pandas as pd
+import diagnostics
+import grading
+import blending
+import pairing
+import matching
+
+# Schedule categories, in the order the pairing passes fill them
+CATEGORIES = ('poor', 'pairable', 'acceptable', 'mixed')
+
+# Category codes of the schedule table: the pairing categories, then the cells left unpaired
+TABLE_CATEGORIES = CATEGORIES + ('remaining',)
+REMAINING = len(CATEGORIES)
+
+# Diagnostics stages of the pairing passes, in the order they run
+PASS_STAGES = ('pass_poor', 'pass_pairable', 'pass_acceptable', 'pass_leftover')
+
+# Entries turned into Python values at a time when a table is read row by row
+RECORD_CHUNK = 10000
+
+
+# Fill missing Si and Fe with zeros, drop offline cells (no Si or Fe) and grade the rest.
+# The uploaded frame itself is left untouched.
+def grade_cells(data, thresholds=None):
+    si = data['Si'].fillna(0)
+    fe = data['Fe'].fillna(0)
+    online = (si > 0) & (fe > 0)
+    filtered_data = data[online].copy()
+    filtered_data['Si'] = si[online]
+    filtered_data['Fe'] = fe[online]
+    filtered_data['Grade'] = grading.grade_names(grading.grade_codes(filtered_data['Si'], filtered_data['Fe'], thresholds))
+    return filtered_data
+
+
+# The whole schedule as one compact table. Each entry is a row of the potline, its partner's row (-1 when
+# unpaired), the resultant grade code (the cell's own grade when unpaired) and a category code. Entries are
+# stored category by category, so a category is a slice of the same arrays, and every display table,
+# the summary and the export read from these arrays without building per-category copies.
+# When crucibles take metal from more than two pots, `others` holds the rows of each entry's further
+# pots (-1 where there are none), one column per pot; it is None for a table or slice of pairs only.
+class ScheduleTable:
+    __slots__ = ('potline', 'rows', 'partners', 'codes', 'categories', 'others')
+
+    def __init__(self, potline, rows, partners, codes, categories, others=None):
+        self.potline = potline
+        self.rows = rows
+        self.partners = partners
+        self.codes = codes
+        self.categories = categories
+        self.others = others
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _slice(self, lo, hi):
+        others = None
+        if self.others is not None and (self.others[lo:hi] >= 0).any():
+            others = self.others[lo:hi]
+        return ScheduleTable(self.potline, self.rows[lo:hi], self.partners[lo:hi], self.codes[lo:hi], self.categories[lo:hi], others)
+
+    # One category ('poor', 'pairable', 'acceptable', 'mixed' or 'remaining') as a view of this table
+    def category(self, category):
+        number = TABLE_CATEGORIES.index(category)
+        lo, hi = np.searchsorted(self.categories, [number, number + 1])
+        return self._slice(lo, hi)
+
+    # Every pair, without the unpaired cells, as a view of this table
+    def paired(self):
+        return self._slice(0, np.searchsorted(self.categories, REMAINING))
+
+    # (main row, partner row, grade code) tuples, as the pairing passes return them.
+    # The further pots of a group are not included.
+    def pairs(self):
+        return list(zip(self.rows.tolist(), self.partners.tolist(), self.codes.tolist()))
+
+    # (main row, partner rows, grade code) tuples for the entries with further pots
+    def groups(self):
+        if self.others is None:
+            return []
+        entries = np.flatnonzero((self.others >= 0).any(axis=1))
+        return [(row, (partner,) + tuple(other for other in others if other >= 0), code) for row, partner, others, code in
+                zip(self.rows[entries].tolist(), self.partners[entries].tolist(), self.others[entries].tolist(), self.codes[entries].tolist())]
+
+    # Column names for this table: (main cell, partner, grade) gets a partner column per further pot,
+    # named after the partner column (Paired_Cell_2, Paired_Cell_3, ...)
+    def columns(self, columns):
+        if self.others is None or len(columns) == 2:
+            return tuple(columns)
+        extra = tuple(f"{columns[1]}_{number}" for number in range(2, self.others.shape[1] + 2))
+        return (columns[0], columns[1]) + extra + tuple(columns[2:])
+
+    # (main cell, partner cell, grade name) for every entry, None for the partner of an unpaired cell,
+    # with the cells of any further pots after the partner (see columns()).
+    # Values are made a chunk at a time, so reading a long table row by row stays light.
+    def records(self, chunk=RECORD_CHUNK):
+        cells = self.potline.cells
+        for start in range(0, len(self), chunk):
+            rows = self.rows[start:start + chunk]
+            partners = self.partners[start:start + chunk]
+            partner_cells = cells[partners].tolist()
+            grades = grading.grade_names(self.codes[start:start + chunk]).tolist()
+            if self.others is None:
+                for main_cell, partner_cell, has_partner, grade in zip(cells[rows].tolist(), partner_cells, (partners >= 0).tolist(), grades):
+                    yield main_cell, partner_cell if has_partner else None, grade
+                continue
+            others = self.others[start:start + chunk]
+            other_cells = np.where(others >= 0, cells[others], None).tolist()
+            for main_cell, partner_cell, has_partner, extra, grade in zip(cells[rows].tolist(), partner_cells, (partners >= 0).tolist(), other_cells, grades):
+                yield (main_cell, partner_cell if has_partner else None, *extra, grade)
+
+    # Display table with the given column names: (main cell, partner, grade), or (cell, grade) for unpaired cells,
+    # with a column per further pot as columns() names them
+    def frame(self, columns):
+        cells = self.potline.cells
+        grades = pd.Categorical.from_codes(self.codes, categories=grading.GRADES)
+        if len(columns) == 2:
+            return pd.DataFrame({columns[0]: cells[self.rows], columns[1]: grades})
+        names = self.columns(columns)
+        frame = {names[0]: cells[self.rows], names[1]: pd.Series(cells[self.partners]).where(self.partners >= 0)}
+        if self.others is not None:
+            for name, others in zip(names[2:-1], self.others.T):
+                frame[name] = pd.Series(cells[others]).where(others >= 0)
+        frame[names[-1]] = grades
+        return pd.DataFrame(frame)
+
+
+# Collect the pairs of each category and the unpaired rows into a ScheduleTable.
+# `groups` (main row, partner rows, grade code) of more than two pots go after the pairs of the poor category.
+def schedule_table(potline, pairs, remaining, groups=()):
+    counts = [len(pairs[category]) for category in CATEGORIES] + [len(remaining)]
+    counts[0] += len(groups)
+    entries = [pair for pair in pairs[CATEGORIES[0]]]
+    entries += [(row, partners[0], code) for row, partners, code in groups]
+    entries += [pair for category in CATEGORIES[1:] for pair in pairs[category]]
+    paired = np.array(entries, dtype=np.int64).reshape(-1, 3)
+    remaining = np.asarray(remaining, dtype=np.int64)
+
+    others = None
+    if groups:
+        others = np.full((len(paired) + len(remaining), max(len(partners) for _, partners, _ in groups) - 1), -1, dtype=np.int32)
+        for number, (_, partners, _) in enumerate(groups, start=len(pairs[CATEGORIES[0]])):
+            others[number, :len(partners) - 1] = partners[1:]
+    return ScheduleTable(
+        potline,
+        np.concatenate([paired[:, 0], remaining]).astype(np.int32),
+        np.concatenate([paired[:, 1], np.full(len(remaining), -1)]).astype(np.int32),
+        np.concatenate([paired[:, 2], potline.codes[remaining]]).astype(np.int8),
+        np.repeat(np.arange(len(TABLE_CATEGORIES), dtype=np.int8), counts),
+        others,
+    )
+
+
+# Rows of the cells left without a partner
+def unpaired_rows(potline, pairs):
+    used = potline.new_used()
+    for row, partner, _ in pairs:
+        used[potline.keys[row]] = True
+        used[potline.keys[partner]] = True
+    return np.flatnonzero(~used[potline.keys])
+
+
+# Run the whole schedule on graded cells.
+# Returns a dict with the potline, the ScheduleTable of pairs and unpaired cells, and in Optimal mode
+# the comparison with the greedy passes (None otherwise).
+# With a `scorer` (scoring.load_scorer()) the greedy passes rank the partners they find by its scores.
+# With `pots` above 2 a crucible may take metal from that many pots, so poor cells no single partner betters
+# can be bettered by a group (see blending.blend_poor_cells). `weight_column` weights every blend by the
+# metal tapped from each pot. Optimal mode only forms pairs, on lines of up to matching.OPTIMAL_MAX_CELLS cells.
+def build_schedule(filtered_data, thresholds=None, max_distance=None, mode="Greedy", scorer=None,
+                   pots=2, weight_column=None):
+    if mode == "Optimal" and pots > 2:
+        raise ValueError("Optimal mode pairs cells two at a time; blend more pots per crucible in Greedy mode")
+    if mode == "Optimal":
+        # Refused before the greedy passes, not after them
+        matching.check_optimal_size(filtered_data['CELL'].nunique())
+    with diagnostics.stage('potline'):
+        potline = pairing.potline_from_frame(filtered_data, thresholds, weight_column)
+    used = potline.new_used()
+    diagnostics.count('cells', len(potline))
+
+    pairs = {category: [] for category in CATEGORIES}
+    groups = []
+    remaining = run_passes(potline, pairs, used, max_distance, scorer, pots, groups)
+
+    # Optimal mode: pair all cells in one solve and report how it compares with the greedy passes
+    comparison = None
+    if mode == "Optimal":
+        greedy_pairs = [pair for category in CATEGORIES for pair in pairs[category]]
+        with diagnostics.stage('optimal_matching'):
+            optimal_pairs = matching.optimal_pairs(potline, max_distance=max_distance, extra_pairs=greedy_pairs)
+        comparison = matching.compare_schedules(potline, greedy_pairs, optimal_pairs)
+        pairs = dict(zip(CATEGORIES, matching.split_by_category(potline, optimal_pairs)))
+        remaining = unpaired_rows(potline, optimal_pairs)
+
+    return finished_schedule(potline, pairs, remaining, comparison, groups)
+
+
+# Run the pairing passes in order over the cells `used` does not mark yet, adding the pairs they make
+# to each category of `pairs`, and with `pots` above 2 the groups of more pots to `groups`.
+# Returns the rows left unpaired.
+def run_passes(potline, pairs, used, max_distance=None, scorer=None, pots=2, groups=None):
+    if scorer is not None:
+        scorer.prepare(potline)
+    potline.scorer = scorer
+    with diagnostics.stage('pass_poor'):
+        if pots > 2:
+            poor_pairs, poor_groups = blending.blend_poor_cells(potline, used, pots, max_distance)
+            pairs['poor'] += poor_pairs
+            groups += poor_groups
+        else:
+            pairs['poor'] += pairing.pair_poor_cells(potline, used, max_distance)
+    with diagnostics.stage('pass_pairable'):
+        pairs['pairable'] += pairing.pair_pairable_cells(potline, used, max_distance)
+    with diagnostics.stage('pass_acceptable'):
+        pairs['acceptable'] += pairing.pair_acceptable_cells(potline, used, max_distance)
+    with diagnostics.stage('pass_leftover'):
+        mixed, remaining = pairing.pair_leftover_cells(potline, used, max_distance)
+        pairs['mixed'] += mixed
+    # The finished schedule is cached and shared, and does not keep the model with it
+    potline.scorer = None
+    return remaining
+
+
+# The schedule dict handed to displays, exports and caches
+def finished_schedule(potline, pairs, remaining, comparison=None, groups=()):
+    table = schedule_table(potline, pairs, remaining, groups)
+    diagnostics.count('pairs', len(table) - len(remaining))
+    diagnostics.count('remaining_cells', len(remaining))
+    return {'potline': potline, 'table': table, 'comparison': comparison}
+
+
+# Merge re-assayed or newly online cells into the assays: rows of `delta` replace the Si and Fe of
+# the rows with the same CELL, keeping their place in the potline, and new cells are added at the end.
+def apply_delta(data, delta):
+    delta = delta.drop_duplicates('CELL', keep='last').set_index('CELL')
+    merged = data.copy()
+    replaced = merged['CELL'].isin(delta.index)
+    for column in ('Si', 'Fe'):
+        merged.loc[replaced, column] = merged.loc[replaced, 'CELL'].map(delta[column])
+
+    added = delta[~delta.index.isin(merged['CELL'])].reset_index().reindex(columns=merged.columns)
+    start = merged.index.max() + 1 if len(merged) else 0
+    added.index = pd.RangeIndex(start, start + len(added))
+    return pd.concat([merged, added]) if len(added) else merged
+
+
+# Rows of `potline` that are the same row of `previous`: same position, CELL, Si and Fe. -1 for the others.
+def unchanged_rows(previous, potline):
+    rows = pd.Index(potline.positions).get_indexer(previous.positions)
+    found = rows >= 0
+    same = np.zeros(len(rows), dtype=bool)
+    same[found] = (
+        (potline.cells[rows[found]] == previous.cells[found])
+        & (potline.si[rows[found]] == previous.si[found])
+        & (potline.fe[rows[found]] == previous.fe[found])
+    )
+    return np.where(same, rows, -1)
+
+
+# Re-pair only what a change of assays touches. `previous` is the schedule before the change, built with
+# the same thresholds and max_distance, and `filtered_data` the graded assays after it (see apply_delta).
+# Pairs whose two cells are unchanged stay as they were, in the same order; the changed cells, their former
+# partners and the cells that were left unpaired go through the pairing passes again, and their new pairs
+# are added at the end of each category. Optimal mode solves the whole line at once, and groups of more than
+# two pots are formed among all poor cells together, so both are rebuilt in full.
+def reschedule(previous, filtered_data, thresholds=None, max_distance=None, mode="Greedy", scorer=None,
+               pots=2, weight_column=None):
+    if mode == "Optimal" or previous['comparison'] is not None or pots > 2 or previous['table'].others is not None:
+        return build_schedule(filtered_data, thresholds, max_distance, mode, scorer, pots, weight_column)
+
+    with diagnostics.stage('potline'):
+        potline = pairing.potline_from_frame(filtered_data, thresholds, weight_column)
+    used = potline.new_used()
+    new_rows = unchanged_rows(previous['potline'], potline)
+
+    pairs = {}
+    for category in CATEGORIES:
+        kept = [(new_rows[row], new_rows[partner], code) for row, partner, code in previous['table'].category(category).pairs()]
+        pairs[category] = [(row, partner, code) for row, partner, code in kept if row >= 0 and partner >= 0]
+        for row, partner, _ in pairs[category]:
+            used[potline.keys[row]] = True
+            used[potline.keys[partner]] = True
+    diagnostics.count('cells', len(potline))
+    diagnostics.count('repaired_cells', np.count_nonzero(~used[potline.keys]))
+
+    remaining = run_passes(potline, pairs, used, max_distance, scorer)
+    return finished_schedule(potline, pairs, remaining)
+
+
+# (main cell, paired cell, resultant grade) for every pair of a schedule, in schedule order
+def schedule_pairs(schedule):
+    return list(schedule['table'].paired().records())
+
+
+# Pairs a reschedule dropped and pairs it made, by CELL
+def schedule_changes(previous, current):
+    before = schedule_pairs(previous)
+    after = schedule_pairs(current)
+    before_set, after_set = set(before), set(after)
+    changes = [("Removed",) + pair for pair in before if pair not in after_set]
+    changes += [("Added",) + pair for pair in after if pair not in before_set]
+    return [{"Change": change, "Main_Cell": main_cell, "Paired_Cell": paired_cell, "Resultant_Grade": grade}
+            for change, main_cell, paired_cell, grade in changes]
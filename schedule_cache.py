@@ -0,0 +1,79 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Memory the caches may hold in total, in megabytes, shared evenly between uploads and schedules
+CACHE_MB = int(os.environ.get('TAPPING_CACHE_MB', 256))
+
+
+# Key for an uploaded file: the hash of its content, so the same file uploaded again hits the cache
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Rough memory footprint of a cached value, in bytes
+def size_of(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return size_of(vars(value))
+    if hasattr(value, '__slots__'):
+        return sum(size_of(getattr(value, name)) for name in value.__slots__)
+    return sys.getsizeof(value)
+
+
+# Least-recently-used cache capped by memory instead of entry count.
+# Streamlit serves every session from the same process, so access is locked.
+# Cached values are shared between sessions and must not be modified.
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = size_of(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            # Something bigger than the whole cache is just not kept
+            if size > self.max_bytes:
+                return
+            while self.total_bytes + size > self.max_bytes:
+                self.total_bytes -= self._entries.popitem(last=False)[1][1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+# Process-wide caches: parsed uploads by content hash, and finished schedules (and their exports)
+# by content hash, thresholds and scheduling options
+uploads = LRUCache(CACHE_MB * 2**20 // 2)
+schedules = LRUCache(CACHE_MB * 2**20 // 2)
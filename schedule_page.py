@@ -0,0 +1,235 @@
+import time
+import streamlit as st
+import pandas as pd
+import diagnostics
+import export
+import ingest
+import jobs
+import partitions
+import profiles
+import schedule
+import schedule_cache
+import scoring
+
+
+# Stop the page with a message when Optimal mode would have to solve more cells at once than it takes
+# (matching.OPTIMAL_MAX_CELLS): the solve cannot be cancelled once it has started
+def check_optimal_size(filtered_data, pairing_mode, partition):
+    if pairing_mode == "Optimal":
+        try:
+            partitions.check_optimal_size(filtered_data, partition)
+        except ValueError as error:
+            st.error(str(error))
+            st.stop()
+
+
+# The scheduling page app.py and tapp.py both show, with their own headings and column names.
+# `profile_name` is the threshold profile (threshold_profiles.toml) the page starts with.
+# `category_columns` names the columns of each category's table, then of the remaining cells, in the
+# table shown per category (only with `category_titles`) and in the optional per-category sheets.
+def show(title, intro, profile_name, grading_heading, comparison_heading, category_columns, category_titles=None):
+    st.title(title)
+    st.write(intro)
+
+    # Upload the assay file
+    uploaded_file = st.file_uploader("Choose an Excel, CSV or Parquet file", type=ingest.UPLOAD_TYPES)
+
+    # Grade bands: the app's own profile first, any other profile in the config file can be picked
+    available = profiles.load_profiles()
+    names = [profile_name] + [name for name in available if name != profile_name]
+    profile = available[st.selectbox("Grade thresholds", names, format_func=lambda name: available[name].description)]
+    thresholds = profile.thresholds
+
+    # Optional re-assays: changed or newly online cells, rescheduled on top of the schedule of the file above
+    delta_file = st.file_uploader("Changed or added cells (optional)", type=ingest.UPLOAD_TYPES)
+
+    # Optional crucible travel limit: how far apart two paired cells may be, 0 means no limit
+    max_distance = st.number_input("Maximum tapping distance between paired cells (0 = no limit)", min_value=0, value=0, step=1)
+
+    # Greedy runs the pairing passes in order, Optimal pairs all cells in one solve
+    pairing_mode = st.radio("Pairing mode", ["Greedy", "Optimal"], horizontal=True)
+
+    # Tapping crews work per room or section: pair cells within their own partition, each partition on its own worker
+    schedule_by = st.selectbox("Schedule by", ["Whole line", "Room", "Section"])
+    partition = {"Room": 'room', "Section": 'section'}.get(schedule_by)
+    cross_partition = bool(partition) and st.checkbox("Pair cells left over in their room or section across the line", value=True)
+
+    # Optional: among the partners the grading rules allow, prefer the one the trained pair model expects the best metal from
+    use_model = st.checkbox("Rank candidate partners with the trained pair model")
+
+    # Optional diagnostics: stage timings and counters for this run, and a cProfile of the scheduling passes
+    show_diagnostics = st.checkbox("Show diagnostics")
+    profile_run = show_diagnostics and st.checkbox("Profile the scheduling run (cProfile)")
+    diagnostics.configure_logging()
+
+    if uploaded_file is not None:
+        run_diagnostics = diagnostics.Diagnostics(uploaded_file.name)
+        # Load the CELL, Si and Fe columns from the uploaded file, reusing the parsed table if the same file was uploaded before
+        upload_key = schedule_cache.content_hash(uploaded_file.getvalue())
+        data = schedule_cache.uploads.get(upload_key)
+        if data is None:
+            with run_diagnostics.collecting(), run_diagnostics.stage('read'):
+                data = ingest.read_assays(uploaded_file)
+            schedule_cache.uploads.put(upload_key, data)
+        else:
+            run_diagnostics.counters['upload_cache_hits'] += 1
+
+        # Check the data structure
+        st.write("Data Preview:")
+        st.dataframe(data)
+
+        delta = None
+        if delta_file is not None:
+            delta_key = schedule_cache.content_hash(delta_file.getvalue())
+            delta = schedule_cache.uploads.get(delta_key)
+            if delta is None:
+                delta = ingest.read_assays(delta_file)
+                schedule_cache.uploads.put(delta_key, delta)
+            st.write("Changed or Added Cells:")
+            st.dataframe(delta)
+
+        # Ensure necessary columns are present
+        if 'CELL' in data.columns and 'Si' in data.columns and 'Fe' in data.columns and (delta is None or set(ingest.ASSAY_COLUMNS) <= set(delta.columns)):
+            max_distance = max_distance or None
+            scorer = None
+            if use_model:
+                scorer = scoring.load_scorer()
+                if scorer is None:
+                    st.warning("The trained pair model could not be loaded, partners are ranked by the grading rules alone.")
+            schedule_key = (upload_key, thresholds, max_distance, pairing_mode, partition, cross_partition, scorer is not None)
+
+            # Merge the re-assays into the upload. The schedule of the upload alone is the starting point, and only the cells the changes touch are paired again.
+            previous_schedule = None
+            if delta is not None:
+                previous_schedule = schedule_cache.schedules.get(schedule_key)
+                if previous_schedule is None:
+                    previous_data = schedule.grade_cells(data, thresholds)
+                    check_optimal_size(previous_data, pairing_mode, partition)
+                    previous_schedule = partitions.schedule_line(previous_data, thresholds, max_distance, pairing_mode, partition, cross_partition, scorer=scorer)
+                    schedule_cache.schedules.put(schedule_key, previous_schedule)
+                data = schedule.apply_delta(data, delta)
+                schedule_key += (delta_key,)
+
+            # Fill missing values with zeros, filter out invalid rows and grade the rest
+            with run_diagnostics.collecting(), run_diagnostics.stage('grading'):
+                filtered_data = schedule.grade_cells(data, thresholds)
+
+            # Display results for individual cells
+            st.write(grading_heading)
+            st.dataframe(filtered_data[['CELL', 'Si', 'Fe', 'Grade']])
+            check_optimal_size(filtered_data, pairing_mode, partition)
+
+            # Run the pairing passes, or reuse the schedule if this file was already scheduled with the same settings
+            tapping_schedule = schedule_cache.schedules.get(schedule_key)
+            if profile_run:
+                # cProfile only sees this thread, so a profiled run is computed here instead of as a background job
+                with run_diagnostics.collecting(), run_diagnostics.profiling(True):
+                    if previous_schedule is None or partition is not None:
+                        tapping_schedule = partitions.schedule_line(filtered_data, thresholds, max_distance, pairing_mode, partition, cross_partition, scorer=scorer)
+                    else:
+                        tapping_schedule = schedule.reschedule(previous_schedule, filtered_data, thresholds, max_distance, pairing_mode, scorer)
+                schedule_cache.schedules.put(schedule_key, tapping_schedule)
+            elif tapping_schedule is None:
+                # Computed as a background job shared by every session with the same file and settings. The page waits briefly,
+                # then shows the job's progress and reruns until it is done; a rerun picks the same job up again by its id.
+                job_id = jobs.job_id(schedule_key)
+                job = jobs.queue.get(job_id)
+                if job is not None and job.state == jobs.CANCELLED and not st.button("Restart scheduling"):
+                    st.warning(f"Scheduling job {job_id} was cancelled.")
+                    st.stop()
+                if previous_schedule is None or partition is not None:
+                    job = jobs.queue.submit(job_id, partitions.schedule_line, filtered_data, thresholds, max_distance, pairing_mode, partition, cross_partition,
+                                            scorer=scorer, stages=partitions.line_stages(pairing_mode, partition, cross_partition), name=uploaded_file.name)
+                else:
+                    job = jobs.queue.submit(job_id, schedule.reschedule, previous_schedule, filtered_data, thresholds, max_distance, pairing_mode, scorer,
+                                            stages=('potline',) + schedule.PASS_STAGES, name=uploaded_file.name)
+                if not job.wait(jobs.INLINE_SECONDS):
+                    fraction, text = job.progress()
+                    st.progress(fraction, text=text)
+                    st.caption(f"Scheduling job {job.id}")
+                    # Cancelling stops the job at its next checkpoint; the page then offers to restart it
+                    if st.button("Cancel scheduling"):
+                        job.cancel()
+                    else:
+                        time.sleep(jobs.POLL_SECONDS)
+                    st.rerun()
+                run_diagnostics.merge(job.diagnostics)
+                if job.state == jobs.FAILED:
+                    raise job.error
+                tapping_schedule = job.take_result()
+                if tapping_schedule is None:
+                    # Another session took the result into the schedule cache first; if the cache has already
+                    # let it go, the rerun schedules it again
+                    tapping_schedule = schedule_cache.schedules.get(schedule_key)
+                    if tapping_schedule is None:
+                        st.rerun()
+                schedule_cache.schedules.put(schedule_key, tapping_schedule)
+            else:
+                run_diagnostics.counters['schedule_cache_hits'] += 1
+
+            if tapping_schedule['comparison'] is not None:
+                st.subheader(comparison_heading)
+                st.dataframe(pd.DataFrame(tapping_schedule['comparison']).T)
+
+            # Pairs the re-assays dropped or made
+            if previous_schedule is not None:
+                st.subheader("Pairing Changes:")
+                st.dataframe(pd.DataFrame(schedule.schedule_changes(previous_schedule, tapping_schedule)))
+
+            # Tables for each category (when the page has titles for them), then the overall summary, all read from the one schedule table
+            schedule_table = tapping_schedule['table']
+            for category_title, category, columns in zip(category_titles or (), schedule.TABLE_CATEGORIES, category_columns):
+                st.subheader(category_title)
+                st.dataframe(schedule_table.category(category).frame(columns))
+
+            st.subheader("Overall Summary of Paired and Unpaired Cells")
+            st.dataframe(schedule_table.frame(export.SUMMARY_COLUMNS))
+
+            # Save the summary to an Excel file, optionally with a sheet per category, written row by row from the schedule
+            category_sheets = st.checkbox("Add a sheet for each pairing category")
+            sheet_columns = category_columns if category_sheets else None
+
+            export_key = schedule_key + ('xlsx', category_sheets)
+            output_bytes = schedule_cache.schedules.get(export_key)
+            if output_bytes is None:
+                with run_diagnostics.stage('excel_export'):
+                    output_bytes = export.workbook_bytes(tapping_schedule, sheet_columns)
+                schedule_cache.schedules.put(export_key, output_bytes)
+
+            st.download_button(
+                label="Download Overall Summary",
+                data=output_bytes,
+                file_name='overall_summary.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            )
+
+            csv_key = schedule_key + ('csv',)
+            csv_bytes = schedule_cache.schedules.get(csv_key)
+            if csv_bytes is None:
+                with run_diagnostics.stage('csv_export'):
+                    csv_bytes = export.csv_bytes(tapping_schedule)
+                schedule_cache.schedules.put(csv_key, csv_bytes)
+
+            st.download_button(
+                label="Download Overall Summary (CSV)",
+                data=csv_bytes,
+                file_name='overall_summary.csv',
+                mime='text/csv',
+            )
+
+            # Stage timings and counters for this run, logged as one JSON line and shown on request
+            run_diagnostics.log_summary()
+            if show_diagnostics:
+                with st.expander("Diagnostics", expanded=True):
+                    st.dataframe(pd.DataFrame(run_diagnostics.rows(), dtype=object))
+                    if run_diagnostics.profile is not None:
+                        st.text(run_diagnostics.profile_report())
+                        st.download_button(
+                            label="Download Profile",
+                            data=run_diagnostics.profile_bytes(),
+                            file_name='schedule.prof',
+                            mime='application/octet-stream',
+                        )
+
+        else:
+            st.error("Uploaded file must contain 'CELL', 'Si', and 'Fe' columns.")
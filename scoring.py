@@ -0,0 +1,159 @@
+import copy
+import functools
+import os
+import threading
+import warnings
+import numpy as np
+import diagnostics
+import forest
+import grading
+import models
+import pairing
+import partitions
+from matching import GRADE_VALUES
+
+# Si and Fe features are rounded to this many decimals before prediction, so pairs that round
+# to the same features share one cached prediction
+FEATURE_DECIMALS = 3
+
+# Positions on each side of a cell whose pairs are scored up front in one batch,
+# the window the pairing passes search first
+SCORE_WINDOW = pairing.FIRST_WINDOW
+
+# Feature rows per predict_proba call
+BATCH_ROWS = 100000
+
+# Predictions kept per scorer before the cache is emptied
+CACHE_ROWS = 1000000
+
+# Features computed from the two cells' Si and Fe values (the averages blended as the potline blends them);
+# Room_<room> and Section_<number> one-hot features come from the main cell's number, mapped as the
+# notebook did (partitions.model_rooms_sections), and stay zero for cells that are not numbers.
+VALUE_FEATURES = ('Pot1_Si', 'Pot1_Fe', 'Pot2_Si', 'Pot2_Fe', 'Avg_Si', 'Avg_Fe')
+
+
+# Scores candidate pairs with a trained pair model: the model's class probabilities weighted by
+# the metal value of each grade, so a higher score means better metal expected from the pair.
+# Predictions are made in batches and cached by their rounded features. One scorer is shared by every
+# run of the process (page sessions, background jobs), so its cache is only touched under its lock.
+class ModelScorer:
+    def __init__(self, model, grades, workers=None):
+        self.features = [str(name) for name in getattr(model, 'feature_names_in_', [])]
+        unknown = [name for name in self.features
+                   if name not in VALUE_FEATURES and not name.startswith(('Room_', 'Section_'))]
+        if not self.features or unknown:
+            raise ValueError(f"Pair model features not supported: {unknown or 'no feature names'}")
+
+        class_codes = [grading.grade_code(str(grade)) for grade in grades]
+        self.class_values = GRADE_VALUES[class_codes].astype(np.float64)
+
+        # Forests predict on every core; the shared cached model is left as it is
+        self.model = copy.copy(model)
+        if hasattr(self.model, 'n_jobs'):
+            self.model.n_jobs = workers or -1
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    # Scorers go to partition worker processes with their cache, each with a lock of its own
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        with self.lock:
+            state['cache'] = dict(self.cache)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    # Feature matrix for (main row, partner row) pairs, in the order the model was trained on
+    def feature_rows(self, potline, rows, partners):
+        si, fe = potline.si, potline.fe
+        avg_si, avg_fe = pairing.blend(potline, rows, partners)
+        values = {
+            'Pot1_Si': si[rows], 'Pot1_Fe': fe[rows],
+            'Pot2_Si': si[partners], 'Pot2_Fe': fe[partners],
+            'Avg_Si': avg_si, 'Avg_Fe': avg_fe,
+        }
+        rooms, sections = partitions.model_rooms_sections(potline.cells[rows])
+        columns = []
+        for name in self.features:
+            if name in values:
+                columns.append(np.round(values[name], FEATURE_DECIMALS))
+            elif name.startswith('Room_'):
+                columns.append(rooms == name[len('Room_'):])
+            else:
+                columns.append(sections == int(name[len('Section_'):]))
+        return np.column_stack(columns).astype(np.float64) if len(rows) else np.empty((0, len(self.features)))
+
+    # Scores for feature rows: cached ones are looked up, the rest predicted in batches.
+    # The scores returned are the ones read or predicted here, whatever other runs do to the cache meanwhile.
+    def predict(self, features):
+        keys = [row.tobytes() for row in features]
+        with self.lock:
+            scores = {key: self.cache[key] for key in set(keys) if key in self.cache}
+        missing = {key: row for key, row in zip(keys, features) if key not in scores}
+        if missing:
+            new_keys = list(missing)
+            new_rows = np.array([missing[key] for key in new_keys])
+            diagnostics.count('model_predictions', len(new_rows))
+            diagnostics.count('model_calls', -(-len(new_rows) // BATCH_ROWS))
+            new_scores = []
+            for start in range(0, len(new_rows), BATCH_ROWS):
+                with warnings.catch_warnings():
+                    # Feature names are fixed by self.features; the plain array is what the model sees
+                    warnings.simplefilter('ignore', UserWarning)
+                    probabilities = self.model.predict_proba(new_rows[start:start + BATCH_ROWS])
+                new_scores += (probabilities @ self.class_values).tolist()
+            predicted = dict(zip(new_keys, new_scores))
+            scores.update(predicted)
+            with self.lock:
+                if len(self.cache) + len(predicted) > CACHE_ROWS:
+                    self.cache.clear()
+                self.cache.update(predicted)
+        return np.array([scores[key] for key in keys])
+
+    # Scores of pairing `row` with each of `partners`
+    def score(self, potline, row, partners):
+        return self.predict(self.feature_rows(potline, np.full(len(partners), row), partners))
+
+    # Score every pair of cells within `window` positions of each other in one go,
+    # so the pairing passes mostly find their scores in the cache
+    def prepare(self, potline, window=SCORE_WINDOW):
+        order = np.argsort(potline.positions, kind='stable')
+        positions = potline.positions[order]
+        rows, partners = [], []
+        for offset in range(1, window + 1):
+            near = positions[offset:] - positions[:-offset] <= window
+            rows += [order[:-offset][near], order[offset:][near]]
+            partners += [order[offset:][near], order[:-offset][near]]
+        if rows:
+            with diagnostics.stage('model_scoring'):
+                self.predict(self.feature_rows(potline, np.concatenate(rows), np.concatenate(partners)))
+
+
+@functools.lru_cache(maxsize=4)
+def _scorer(path, encoder_path, mtime, workers):
+    model = models.load_model(path)
+    return ModelScorer(model, models.load_label_encoder(encoder_path).inverse_transform(model.classes_), workers)
+
+
+@functools.lru_cache(maxsize=4)
+def _forest_scorer(path, mtime):
+    exported = forest.load_forest(path)
+    return ModelScorer(exported, exported.grades)
+
+
+# The pair model as a scorer, kept with its prediction cache for the life of the process.
+# The flat-array export of the model (forest.py) is used instead of the pickle when it is up to date.
+# Returns None when the model cannot be used here (missing file, scikit-learn not installed, features
+# it was not trained on), in which case pairing stays with the rule-based grades alone.
+def load_scorer(path=models.MODEL_FILE, encoder_path=models.LABEL_ENCODER_FILE, workers=None):
+    try:
+        forest_path = forest.forest_dir(path)
+        if forest.is_current(forest_path, path):
+            return _forest_scorer(forest_path, os.path.getmtime(os.path.join(forest_path, forest.META_FILE)))
+        return _scorer(path, encoder_path, os.path.getmtime(path), workers)
+    except Exception as error:
+        diagnostics.log_event('model_unavailable', model=path, error=f"{type(error).__name__}: {error}")
+        return None
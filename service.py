@@ -0,0 +1,305 @@
+import argparse
+import io
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+import diagnostics
+import export
+import ingest
+import partitions
+import blending
+import profiles
+import schedule
+import schedule_cache
+import scoring
+
+# Where the service listens by default; the Streamlit page keeps its own port
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = int(os.environ.get('TAPPING_SERVICE_PORT', 8502))
+
+# Scheduling processes kept warm, with every threshold profile compiled and the pair model loaded when asked for
+SERVICE_WORKERS = max(1, os.cpu_count() or 1)
+
+# Largest request body accepted, and how long a request waits for its schedule
+MAX_BODY_BYTES = 64 * 2**20
+REQUEST_SECONDS = 300
+
+# Uploads sent as files, by content type; anything else is read as JSON
+FILE_TYPES = {
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx',
+    'text/csv': 'csv',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/octet-stream': 'xlsx',
+}
+
+# Scheduling options a request may set, in the body of a JSON request or the query string of a file upload
+OPTIONS = ('profile', 'max_distance', 'mode', 'partition', 'cross_partition', 'model', 'pots', 'weight_column')
+
+
+# A request the service cannot schedule, answered with 400 and the message
+class RequestError(ValueError):
+    pass
+
+
+# Scheduling options from a request, checked and with the service's defaults filled in
+def request_options(values):
+    unknown = [name for name in values if name not in OPTIONS]
+    if unknown:
+        raise RequestError(f"Unknown options: {', '.join(unknown)}; options are {', '.join(OPTIONS)}")
+    try:
+        options = {
+            'profile': str(values.get('profile') or profiles.DEFAULT_PROFILE),
+            'max_distance': int(values['max_distance']) if values.get('max_distance') not in (None, '', 0, '0') else None,
+            'mode': str(values.get('mode') or "Greedy"),
+            'partition': values.get('partition') or None,
+            'cross_partition': str(values.get('cross_partition', True)).lower() not in ('false', '0', 'no'),
+            'model': str(values.get('model', False)).lower() in ('true', '1', 'yes'),
+            'pots': int(values.get('pots') or 2),
+            'weight_column': values.get('weight_column') or None,
+        }
+    except (TypeError, ValueError) as error:
+        raise RequestError(f"Bad option value: {error}")
+    if options['mode'] not in ("Greedy", "Optimal"):
+        raise RequestError("mode is Greedy or Optimal")
+    if options['max_distance'] is not None and options['max_distance'] < 1:
+        raise RequestError("max_distance is a whole number of positions, at least 1 (leave it out for no limit)")
+    if not 2 <= options['pots'] <= blending.MAX_POTS:
+        raise RequestError(f"pots is from 2 to {blending.MAX_POTS}")
+    try:
+        profiles.get_profile(options['profile'])
+    except KeyError as error:
+        raise RequestError(error.args[0])
+    return options
+
+
+# NaN and Infinity are not JSON, though Python's json reads them; a body with them is refused
+def reject_constant(name):
+    raise ValueError(f"{name} is not a JSON value")
+
+
+# Columns of the assays the options use besides CELL, Si and Fe: a custom partition column and the weight column
+def option_columns(options):
+    columns = [options['partition']] if options['partition'] not in (None,) + partitions.PARTITIONS else []
+    return columns + ([options['weight_column']] if options['weight_column'] is not None else [])
+
+
+# The assays of a request: a JSON body {"assays": [{"CELL": .., "Si": .., "Fe": ..}, ...], ...options} (or the
+# assays as columns, {"CELL": [..], "Si": [..], "Fe": [..]}), or an xlsx, csv or parquet file.
+# Options can also be given in the query string; the body's win. Returns (assays, options).
+def request_assays(body, file_type, query):
+    if file_type is not None:
+        options = request_options(query)
+        try:
+            data = ingest.read_assays(io.BytesIO(body), name='upload.' + file_type, extra_columns=option_columns(options))
+        except Exception as error:
+            raise RequestError(f"Could not read the {file_type} file: {error}")
+        return data, options
+    try:
+        payload = json.loads(body, parse_constant=reject_constant)
+        assays = payload.pop('assays')
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        raise RequestError(f"Expected a JSON object with an 'assays' list or columns, or an assay file: {error}")
+    options = request_options({**query, **payload})
+    try:
+        data = ingest.typed_assays(pd.DataFrame(assays), extra_columns=option_columns(options))
+    except (ValueError, TypeError) as error:
+        raise RequestError(f"Expected the assays as a list of rows or as columns: {error}")
+    return data, options
+
+
+# Warm a worker process: compile every threshold profile and load the pair model once, so requests never wait for them
+def warm_worker(use_model, log_level):
+    if log_level is not None:
+        diagnostics.configure_logging(log_level)
+    profiles.load_profiles()
+    if use_model:
+        scoring.load_scorer(workers=1)
+
+
+# Process id of a worker, to start every worker before the first request
+def worker_pid():
+    return os.getpid()
+
+
+# Numpy values in a response as plain JSON values
+def json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# Schedule one request in a worker process and return the JSON response body: the Overall Summary as one
+# object per row, the columns in order, the counts, and in Optimal mode the comparison with the greedy passes.
+def schedule_request(body, file_type, query):
+    started = time.perf_counter()
+    run_diagnostics = diagnostics.Diagnostics('service')
+    with run_diagnostics.collecting():
+        data, options = request_assays(body, file_type, query)
+        missing = [column for column in ingest.ASSAY_COLUMNS if column not in data.columns]
+        if missing:
+            raise RequestError("Missing columns: " + ", ".join(missing))
+        thresholds = profiles.get_profile(options['profile']).thresholds
+        filtered_data = schedule.grade_cells(data, thresholds)
+        scorer = scoring.load_scorer(workers=1) if options['model'] else None
+        warnings = []
+        if options['model'] and scorer is None:
+            warnings.append("The trained pair model could not be loaded, partners are ranked by the grading rules alone.")
+        try:
+            tapping_schedule = partitions.schedule_line(filtered_data, thresholds, options['max_distance'], options['mode'], options['partition'],
+                                                        options['cross_partition'], workers=1, scorer=scorer, pots=options['pots'],
+                                                        weight_column=options['weight_column'])
+        except (ValueError, KeyError) as error:
+            raise RequestError(str(error))
+        table = tapping_schedule['table']
+        columns = export.summary_columns(tapping_schedule)
+        response = {
+            'columns': list(columns),
+            'summary': [dict(zip(columns, values)) for values in export.summary_rows(tapping_schedule)],
+            'cells': len(data),
+            'graded_cells': len(filtered_data),
+            'pairs': len(table.paired()),
+            'remaining': len(table.category('remaining')),
+            'comparison': tapping_schedule['comparison'],
+            'options': options,
+            'warnings': warnings,
+            'seconds': round(time.perf_counter() - started, 6),
+        }
+    run_diagnostics.log_summary()
+    return json.dumps(response, default=json_value).encode()
+
+
+# The scheduling service: HTTP requests on threads, schedules on a pool of warm worker processes.
+# Finished responses are cached by request content and identical requests in flight share one computation.
+class ScheduleService:
+    def __init__(self, workers=SERVICE_WORKERS, use_model=False, log_level=None):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker, initargs=(use_model, log_level))
+        self.responses = schedule_cache.LRUCache(schedule_cache.CACHE_MB * 2**20 // 2)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        # Start every worker now instead of on the first requests
+        for future in [self.pool.submit(worker_pid) for _ in range(workers)]:
+            future.result()
+
+    # JSON response body for a request, computed once for identical requests
+    def schedule(self, body, file_type, query):
+        key = (schedule_cache.content_hash(body), file_type, tuple(sorted(query.items())))
+        response = self.responses.get(key)
+        if response is not None:
+            diagnostics.log_event('service_cache_hit')
+            return response
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.pool.submit(schedule_request, body, file_type, query)
+                self.in_flight[key] = future
+        try:
+            response = future.result(REQUEST_SECONDS)
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+        self.responses.put(key, response)
+        return response
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, status, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, default=json_value).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self.send_json(HTTPStatus.OK, {'status': 'ok', 'workers': self.server.service.workers})
+        elif path == '/profiles':
+            self.send_json(HTTPStatus.OK, {name: {'description': profile.description, 'bands': profile.thresholds}
+                                           for name, profile in profiles.load_profiles().items()})
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f"No such resource {path}; use GET /health, GET /profiles or POST /schedule"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        if url.path != '/schedule':
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f"No such resource {url.path}; use POST /schedule"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': f"Request bodies are limited to {MAX_BODY_BYTES} bytes"})
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        file_type = FILE_TYPES.get(content_type)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        started = time.perf_counter()
+        try:
+            response = self.server.service.schedule(body, file_type, query)
+            status = HTTPStatus.OK
+        except RequestError as error:
+            response, status = {'error': str(error)}, HTTPStatus.BAD_REQUEST
+        except TimeoutError:
+            response, status = {'error': f"No schedule within {REQUEST_SECONDS}s"}, HTTPStatus.SERVICE_UNAVAILABLE
+        except Exception as error:
+            response, status = {'error': f"{type(error).__name__}: {error}"}, HTTPStatus.INTERNAL_SERVER_ERROR
+        self.send_json(status, response)
+        diagnostics.log_event('service_request', status=int(status), bytes=length, seconds=round(time.perf_counter() - started, 6))
+
+    # Requests are logged as JSON events (with -v), not as access log lines on stderr
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, workers=SERVICE_WORKERS, use_model=False, log_level=None):
+    service = ScheduleService(workers, use_model, log_level)
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    diagnostics.log_event('service_started', host=host, port=server.server_address[1], workers=workers)
+    # Stopped by a process manager the same way as by Ctrl-C, so the worker processes are shut down with it
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve tapping schedules over HTTP: POST assays to /schedule, get the Overall Summary as JSON.")
+    parser.add_argument('--host', default=SERVICE_HOST, help="address to listen on (0.0.0.0 for every interface)")
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help="port to listen on")
+    parser.add_argument('-j', '--workers', type=int, default=SERVICE_WORKERS, help="scheduling processes (default: one per core)")
+    parser.add_argument('--model', action='store_true', help="load the trained pair model in every worker, for requests with model=true")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log requests and stage timings as JSON lines on stderr")
+    args = parser.parse_args(argv)
+
+    log_level = logging.INFO if args.verbose else None
+    if log_level is not None:
+        diagnostics.configure_logging(log_level)
+    print(f"Scheduling service on http://{args.host}:{args.port} with {args.workers} workers")
+    serve(args.host, args.port, args.workers, args.model, log_level)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+import pandas as pd
+import ingest
+import service
+
+# The local service, as service.py starts it by default
+SERVICE_URL = f"http://{service.SERVICE_HOST}:{service.SERVICE_PORT}"
+
+# Content type for each assay file type the service reads
+CONTENT_TYPES = {file_type: content_type for content_type, file_type in service.FILE_TYPES.items() if content_type != 'application/octet-stream'}
+
+
+# A request the service answered with an error, with its HTTP status and message
+class ServiceError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+# A stand-in for the plant systems calling the scheduling service, and what the load test uses.
+# Schedules are returned as the service's JSON response (see service.schedule_request).
+class ServiceClient:
+    def __init__(self, url=SERVICE_URL, timeout=service.REQUEST_SECONDS):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, body=None, content_type='application/json', query=None):
+        url = self.url + path
+        if query:
+            url += '?' + urllib.parse.urlencode(query)
+        request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type} if body is not None else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            try:
+                message = json.loads(error.read()).get('error', error.reason)
+            except ValueError:
+                message = error.reason
+            raise ServiceError(error.code, message)
+
+    def health(self):
+        return self._request('/health')
+
+    def profiles(self):
+        return self._request('/profiles')
+
+    # Schedule assays given as a DataFrame (CELL, Si and Fe), a list of {"CELL", "Si", "Fe"} records, or the path
+    # of an xlsx, csv or parquet file, with any of service.OPTIONS (profile, max_distance, mode, ...)
+    def schedule(self, assays, **options):
+        if isinstance(assays, (str, os.PathLike)):
+            with open(assays, 'rb') as assay_file:
+                body = assay_file.read()
+            return self._request('/schedule', body, CONTENT_TYPES[ingest.file_type(os.fspath(assays))], options)
+        if isinstance(assays, pd.DataFrame):
+            assays = assays[ingest.ASSAY_COLUMNS].to_dict('list')
+        return self._request('/schedule', json.dumps({'assays': assays, **options}).encode())
+
+    # The Overall Summary of a schedule as a DataFrame
+    def summary(self, assays, **options):
+        response = self.schedule(assays, **options)
+        return pd.DataFrame(response['summary'], columns=response['columns'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schedule an assay file with the scheduling service and print or save the Overall Summary.")
+    parser.add_argument('input', help="assay file (xlsx, csv or parquet) with CELL, Si and Fe")
+    parser.add_argument('--url', default=SERVICE_URL, help="where the service runs")
+    parser.add_argument('--profile', help="grade threshold profile")
+    parser.add_argument('--max-distance', type=int, help="maximum tapping distance between paired cells")
+    parser.add_argument('--mode', choices=['Greedy', 'Optimal'], help="pairing mode")
+    parser.add_argument('--output', help="save the whole JSON response to this file")
+    args = parser.parse_args(argv)
+
+    options = {name: value for name, value in (('profile', args.profile), ('max_distance', args.max_distance), ('mode', args.mode)) if value is not None}
+    try:
+        response = ServiceClient(args.url).schedule(args.input, **options)
+    except (ServiceError, OSError) as error:
+        print(f"Scheduling failed: {error}", file=sys.stderr)
+        return 1
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(response, output_file)
+    print(pd.DataFrame(response['summary'], columns=response['columns']).to_string(index=False))
+    print(f"{response['pairs']} pairs, {response['remaining']} unpaired, scheduled in {response['seconds']:.3f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import sample_data
+import service
+import service_client
+
+# Seconds to wait for a service started by the load test to answer /health
+START_SECONDS = 60
+
+
+# One timed request: (seconds, error message or None)
+def timed_request(client, assays, options):
+    started = time.perf_counter()
+    try:
+        client.schedule(assays, **options)
+        error = None
+    except (service_client.ServiceError, OSError) as failure:
+        error = str(failure)
+    return time.perf_counter() - started, error
+
+
+# Send `requests` schedule requests from `clients` concurrent callers and report throughput and latency.
+# Each request schedules one of `payloads` (assay DataFrames or file paths) in turn.
+def load_test(client, payloads, requests, clients, options=None):
+    options = options or {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as callers:
+        results = list(callers.map(lambda number: timed_request(client, payloads[number % len(payloads)], options), range(requests)))
+    seconds = time.perf_counter() - started
+    latencies = np.array([latency for latency, error in results if error is None])
+    errors = [error for _, error in results if error is not None]
+    report = {
+        'requests': requests,
+        'clients': clients,
+        'errors': len(errors),
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(requests / seconds, 2) if seconds else None,
+    }
+    if len(latencies):
+        report.update({f'p{percentile}_ms': round(float(np.percentile(latencies, percentile)) * 1000, 1) for percentile in (50, 90, 99)})
+        report['max_ms'] = round(float(latencies.max()) * 1000, 1)
+    if errors:
+        report['first_error'] = errors[0]
+    return report
+
+
+# Start a local service in its own process and wait until it answers
+def start_service(port, workers):
+    process = subprocess.Popen([sys.executable, service.__file__, '--port', str(port), '--workers', str(workers)], stdout=subprocess.DEVNULL)
+    client = service_client.ServiceClient(f"http://{service.SERVICE_HOST}:{port}")
+    deadline = time.time() + START_SECONDS
+    while True:
+        try:
+            client.health()
+            return process
+        except OSError:
+            if process.poll() is not None or time.time() > deadline:
+                process.kill()
+                raise RuntimeError("The scheduling service did not start")
+            time.sleep(0.2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the scheduling service with concurrent callers.")
+    parser.add_argument('--url', default=service_client.SERVICE_URL, help="where the service runs")
+    parser.add_argument('--start', action='store_true', help="start a local service for the test, on the port of --url")
+    parser.add_argument('--workers', type=int, default=service.SERVICE_WORKERS, help="worker processes of a service started with --start")
+    parser.add_argument('-c', '--clients', type=int, default=8, help="concurrent callers")
+    parser.add_argument('-n', '--requests', type=int, default=100, help="requests in all")
+    parser.add_argument('--cells', type=int, default=3000, help="cells per synthetic potline")
+    parser.add_argument('--distinct', type=int, default=1, help="different synthetic potlines sent in turn; more than the requests means no cached answers")
+    parser.add_argument('--file', action='append', help="send this assay file instead of synthetic potlines (repeatable)")
+    parser.add_argument('--mode', choices=['Greedy', 'Optimal'], default='Greedy', help="pairing mode")
+    parser.add_argument('-o', '--output', help="save the report as JSON")
+    args = parser.parse_args(argv)
+
+    payloads = args.file or [sample_data.generate_potline(args.cells, seed=seed) for seed in range(args.distinct)]
+    client = service_client.ServiceClient(args.url)
+    process = start_service(int(args.url.rsplit(':', 1)[1].split('/')[0]), args.workers) if args.start else None
+    try:
+        report = load_test(client, payloads, args.requests, args.clients, {'mode': args.mode})
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
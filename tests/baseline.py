@@ -0,0 +1,111 @@
+# The original scalar grading and pairing rules, kept as the oracle the fast implementations are tested against.
+# assign_grade is the if/elif chain of app.py (tapp.py's with the cell purity limits), and baseline_passes the
+# first three iterrows passes of app.py: the same loops over the same rows, with the pandas lookups replaced
+# by dicts and lists so a few hundred random lines run in seconds. Do not optimise these.
+
+POOR_GRADES = ['1535', '2050']
+PAIRABLE_GRADES = ['0303', '0404', '0406']
+ACCEPTABLE_GRADES = ['0506', '0610', '1020']
+
+
+# Grade of one Si and Fe value with the upper limits of 0303, 0404, 0406, 0506, 0610, 1020 and 1535
+def assign_grade(si, fe, thresholds):
+    (s0303, f0303), (s0404, f0404), (s0406, f0406), (s0506, f0506), (s0610, f0610), (s1020, f1020), (s1535, f1535) = thresholds
+    if si <= s0303 and fe <= f0303:
+        return '0303'
+    elif si <= s0404 and fe <= f0404:
+        return '0404'
+    elif si <= s0406 and fe <= f0406:
+        return '0406'
+    elif si <= s0506 and fe <= f0506:
+        return '0506'
+    elif si <= s0610 and fe <= f0610:
+        return '0610'
+    elif si <= s1020 and fe <= f1020:
+        return '1020'
+    elif si <= s1535 and fe <= f1535:
+        return '1535'
+    elif si >= s1535 or fe >= f1535:
+        return '2050'
+    return None
+
+
+# Closest unused partner of one main row, as the inner iterrows loop found it: the first row at the
+# smallest distance, measured from the main row's index to the first index of the partner's CELL
+def closest(rows, first_index, used_cells, index, cell_id, si_a, fe_a, partner_grades, keep, same_cell, thresholds):
+    best_pairing = None
+    best_combined_grade = None
+    best_distance = float('inf')
+    for _, other_cell_id, si_b, fe_b, other_grade in rows:
+        if other_grade in partner_grades and (same_cell or other_cell_id != cell_id) and other_cell_id not in used_cells:
+            combined_grade = assign_grade((si_a + si_b) / 2, (fe_a + fe_b) / 2, thresholds)
+            if keep(combined_grade):
+                distance = abs(index - first_index[other_cell_id])
+                if distance < best_distance:
+                    best_distance = distance
+                    best_pairing = other_cell_id
+                    best_combined_grade = combined_grade
+    return best_pairing, best_combined_grade
+
+
+# Pairs of the first three passes of app.py as (main CELL, partner CELL, resultant grade), one list per pass,
+# for the graded rows of an upload (CELL, Si, Fe and Grade, indexed by position)
+def baseline_passes(filtered_data, thresholds):
+    rows = list(zip(filtered_data.index, filtered_data['CELL'], filtered_data['Si'], filtered_data['Fe'], filtered_data['Grade']))
+    first_index = {}
+    for index, cell_id, _, _, _ in rows:
+        first_index.setdefault(cell_id, index)
+    used_cells = set()
+    passes = [
+        # Poor grades bettered by an acceptable grade, or failing that paired with another poor grade
+        (POOR_GRADES, [(ACCEPTABLE_GRADES, lambda grade: grade not in POOR_GRADES, True),
+                       (POOR_GRADES, lambda grade: grade in POOR_GRADES, False)]),
+        # 0303, 0404 and 0406 among themselves
+        (PAIRABLE_GRADES, [(PAIRABLE_GRADES, lambda grade: grade in PAIRABLE_GRADES, False)]),
+        # Acceptable grades among themselves without dropping to a poor grade
+        (ACCEPTABLE_GRADES, [(ACCEPTABLE_GRADES, lambda grade: grade not in POOR_GRADES, False)]),
+    ]
+    results = []
+    for main_grades, searches in passes:
+        pairs = []
+        for index, cell_id, si_a, fe_a, individual_grade in rows:
+            if individual_grade not in main_grades or cell_id in used_cells:
+                continue
+            for partner_grades, keep, same_cell in searches:
+                best_pairing, best_combined_grade = closest(rows, first_index, used_cells, index, cell_id, si_a, fe_a,
+                                                            partner_grades, keep, same_cell, thresholds)
+                if best_pairing is not None:
+                    pairs.append((cell_id, best_pairing, best_combined_grade))
+                    used_cells.add(cell_id)
+                    used_cells.add(best_pairing)
+                    break
+        results.append(pairs)
+    return results
+
+
+# The notebook's room and section of a cell
+def get_room_section(cell_id):
+    if 1 <= cell_id <= 50:
+        room = 'A'
+        section = 1 if cell_id <= 25 else 2
+    else:
+        room = 'B'
+        section = 3 if cell_id <= 75 else 4
+    return room, section
+
+
+# The notebook's pair training rows: every two cells of the same section, in combinations() order
+def notebook_pairs(data, thresholds):
+    rows = []
+    for cell_id, si, fe in zip(data['Cell_ID'], data['Si'], data['Fe']):
+        room, section = get_room_section(cell_id)
+        rows.append((cell_id, si, fe, assign_grade(si, fe, thresholds), room, section))
+    pair_data = []
+    for first, row1 in enumerate(rows):
+        for row2 in rows[first + 1:]:
+            if row1[5] == row2[5]:
+                avg_si = (row1[1] + row2[1]) / 2
+                avg_fe = (row1[2] + row2[2]) / 2
+                pair_data.append([row1[0], row2[0], row1[4], row1[5], avg_si, avg_fe, row1[3], row2[3],
+                                  assign_grade(avg_si, avg_fe, thresholds)])
+    return pair_data
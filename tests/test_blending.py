@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+import batch
+import blending
+import grading
+import profiles
+import schedule
+from baseline import assign_grade, POOR_GRADES
+
+LINES = 60
+
+
+# A line short of clean metal, so many poor cells need more than one partner to be bettered,
+# with the metal tapped from each pot for weighted blends
+def poor_line(seed):
+    random = np.random.default_rng(seed)
+    cells = random.integers(10, 120)
+    return pd.DataFrame({
+        'CELL': random.permutation(np.arange(1, cells + 1)),
+        'Si': np.round(random.uniform(0.02, 0.2, cells), 3),
+        'Fe': np.round(random.uniform(0.03, 0.45, cells), 3),
+        'Tonnes': np.round(random.uniform(2, 6, cells), 1),
+    })
+
+
+@pytest.mark.parametrize('pots', (3, blending.MAX_POTS))
+@pytest.mark.parametrize('weight_column', (None, 'Tonnes'))
+def test_groups_better_their_poor_cell(pots, weight_column):
+    thresholds = profiles.get_profile('standard').thresholds
+    groups = 0
+    for seed in range(LINES):
+        filtered_data = schedule.grade_cells(poor_line(seed), thresholds)
+        tapping_schedule = schedule.build_schedule(filtered_data, thresholds, pots=pots, weight_column=weight_column)
+        table = tapping_schedule['table']
+        potline = tapping_schedule['potline']
+
+        # Every cell once, whether paired, grouped or left unpaired
+        cells = [cell for record in table.records() for cell in record[:-1] if cell is not None]
+        assert sorted(cells) == sorted(filtered_data['CELL'].tolist()), f"line {seed}"
+
+        for row, partners, code in table.groups():
+            members = [row, *partners]
+            weights = np.ones(len(members)) if weight_column is None else filtered_data[weight_column].to_numpy()[members]
+            si = np.average(potline.si[members], weights=weights)
+            fe = np.average(potline.fe[members], weights=weights)
+            assert 3 <= len(members) <= pots, f"line {seed}"
+            assert grading.grade_name(potline.codes[row]) in POOR_GRADES, f"line {seed}"
+            assert grading.grade_name(code) == assign_grade(si, fe, thresholds), f"line {seed}"
+            assert grading.grade_name(code) not in POOR_GRADES, f"line {seed}"
+            groups += 1
+    assert groups
+
+
+@pytest.mark.parametrize('arguments', [
+    ['--pots', '1'],
+    ['--pots', str(blending.MAX_POTS + 1)],
+    ['--pots', '3', '--mode', 'Optimal'],
+    ['--pots', '3', '--partition', 'room'],
+    ['--weight-column', 'Tonnes', '--partition', 'section'],
+    ['--max-distance', '0'],
+])
+def test_batch_refuses_settings_it_cannot_schedule(arguments, tmp_path):
+    with pytest.raises(SystemExit) as exit_info:
+        batch.main([str(tmp_path), '-o', str(tmp_path / 'out'), *arguments])
+    assert exit_info.value.code == 2
+    assert not (tmp_path / 'out').exists()
@@ -0,0 +1,52 @@
+import csv
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import export
+import profiles
+import schedule
+
+THRESHOLDS = profiles.get_profile('standard').thresholds
+
+CATEGORY_COLUMNS = [('Poor_Cell', 'Partner', 'Grade'), ('Cell', 'Partner', 'Grade'), ('Cell', 'Partner', 'Grade'),
+                    ('Acceptable_Cell', 'Partner', 'Grade'), ('Cell', 'Grade')]
+
+
+# A scheduled line of 200 cells, with crucibles of up to `pots` pots
+def scheduled_line(pots=2):
+    random = np.random.default_rng(3)
+    data = pd.DataFrame({'CELL': np.arange(1, 201), 'Si': np.round(random.uniform(0.02, 0.2, 200), 3),
+                         'Fe': np.round(random.uniform(0.03, 0.4, 200), 3)})
+    return schedule.build_schedule(schedule.grade_cells(data, THRESHOLDS), THRESHOLDS, pots=pots)
+
+
+def expected_rows(rows):
+    return [['' if value is None else str(value) for value in values] for values in rows]
+
+
+@pytest.mark.parametrize('pots', (2, 3))
+@pytest.mark.parametrize('chunk_rows', (7, export.CSV_CHUNK_ROWS))
+def test_csv_has_every_summary_row(pots, chunk_rows):
+    tapping_schedule = scheduled_line(pots)
+    content = export.csv_bytes(tapping_schedule, chunk_rows)
+    assert content.count(b'\r\n') == len(tapping_schedule['table']) + 1
+    rows = list(csv.reader(io.StringIO(content.decode('utf-8'), newline='')))
+    assert rows[0] == list(export.summary_columns(tapping_schedule))
+    assert rows[1:] == expected_rows(export.summary_rows(tapping_schedule))
+
+
+def test_workbook_sheets_hold_the_schedule():
+    tapping_schedule = scheduled_line()
+    sheets = pd.read_excel(io.BytesIO(export.workbook_bytes(tapping_schedule, CATEGORY_COLUMNS)), sheet_name=None, dtype=object)
+    assert list(sheets) == ['Overall_Summary', *export.CATEGORY_SHEETS, export.REMAINING_SHEET]
+
+    summary = sheets['Overall_Summary']
+    assert tuple(summary.columns) == export.SUMMARY_COLUMNS
+    cells = summary.astype(object).where(summary.notna(), None).values.tolist()
+    assert cells == [list(values) for values in export.summary_rows(tapping_schedule)]
+
+    for name, category, columns in zip(export.CATEGORY_SHEETS, schedule.CATEGORIES, CATEGORY_COLUMNS):
+        assert tuple(sheets[name].columns) == columns
+        assert len(sheets[name]) == len(tapping_schedule['table'].category(category))
+    assert sheets[export.REMAINING_SHEET].values.tolist() == [list(values) for values in export.remaining_rows(tapping_schedule)]
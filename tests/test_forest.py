@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+import forest
+import grading
+import profiles
+
+ensemble = pytest.importorskip('sklearn.ensemble')
+preprocessing = pytest.importorskip('sklearn.preprocessing')
+
+THRESHOLDS = profiles.get_profile('standard').thresholds
+FEATURES = ['Pot1_Si', 'Pot1_Fe', 'Pot2_Si', 'Pot2_Fe', 'Avg_Si', 'Avg_Fe', 'Room_B', 'Section_2', 'Section_3', 'Section_4']
+
+
+# Pair features as the pair model is trained on them, at lab resolution
+def pair_features(rows, seed):
+    random = np.random.default_rng(seed)
+    si = np.round(random.uniform(0.015, 0.25, (rows, 2)), 3)
+    fe = np.round(random.uniform(0.015, 0.45, (rows, 2)), 3)
+    sections = random.integers(1, 5, rows)
+    return np.column_stack([si[:, 0], fe[:, 0], si[:, 1], fe[:, 1], si.mean(axis=1), fe.mean(axis=1),
+                            sections > 2, sections == 2, sections == 3, sections == 4]).astype(np.float64)
+
+
+def fitted_model(labels_of, **settings):
+    features = pair_features(3000, 1)
+    encoder = preprocessing.LabelEncoder().fit(grading.GRADES)
+    model = ensemble.RandomForestClassifier(random_state=0, **settings)
+    model.fit(pd.DataFrame(features, columns=FEATURES), encoder.transform(labels_of(features)))
+    return model, encoder
+
+
+def threshold_grades(features):
+    return grading.grade_names(grading.grade_codes(features[:, 4], features[:, 5], THRESHOLDS))
+
+
+# Grades with a few of them flipped, so the forest is uncertain somewhere and cannot be the threshold table
+def noisy_grades(features):
+    grades = threshold_grades(features)
+    flipped = np.random.default_rng(2).random(len(grades)) < 0.1
+    grades[flipped] = np.random.default_rng(3).choice(grading.GRADES, flipped.sum())
+    return grades
+
+
+@pytest.mark.parametrize('table_cells', (forest.TABLE_CELLS, 0))
+def test_exported_forest_predicts_bit_for_bit_like_the_model(tmp_path, monkeypatch, table_cells):
+    monkeypatch.setattr(forest, 'TABLE_CELLS', table_cells)
+    model, encoder = fitted_model(noisy_grades, n_estimators=12, max_depth=4)
+    meta = forest.export_forest(model, encoder, str(tmp_path), THRESHOLDS)
+    assert meta['kind'] == 'forest' and meta['tables'] == bool(table_cells)
+
+    exported = forest.load_forest(str(tmp_path))
+    assert list(exported.feature_names_in_) == FEATURES
+    # Rows the model was not trained on, some of them not at lab resolution
+    features = pair_features(5000, 7)
+    features[::3, :6] += np.random.default_rng(8).normal(0, 1e-4, (len(features[::3]), 6))
+    assert np.array_equal(exported.predict_proba(features), model.predict_proba(pd.DataFrame(features, columns=FEATURES)))
+    assert exported.grades == list(encoder.inverse_transform(model.classes_))
+
+
+def test_export_is_current_only_for_its_own_pickle(tmp_path):
+    model_path = tmp_path / 'paired_model.pkl'
+    model_path.write_bytes(b'first model')
+    model, encoder = fitted_model(noisy_grades, n_estimators=3, max_depth=4)
+    path = forest.forest_dir(str(model_path))
+    forest.export_forest(model, encoder, path, THRESHOLDS, model_path=str(model_path))
+    assert forest.is_current(path, str(model_path))
+    model_path.write_bytes(b'retrained model')
+    assert not forest.is_current(path, str(model_path))
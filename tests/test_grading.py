@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import grading
+import profiles
+from baseline import assign_grade
+
+PROFILES = ('standard', 'cell_purity')
+
+
+# Every limit of the profile, the floats either side of it, random values, and values that cannot be graded
+def grading_values(thresholds):
+    values = []
+    for limit in sorted({limit for band in thresholds for limit in band}):
+        values += [limit, np.nextafter(limit, 0), np.nextafter(limit, 1)]
+    values += list(np.random.default_rng(0).uniform(0, 0.5, 200)) + [0.0, 1.0, np.nan]
+    return np.array(values)
+
+
+@pytest.mark.parametrize('profile', PROFILES)
+def test_grade_codes_match_the_if_elif_chain(profile):
+    thresholds = profiles.get_profile(profile).thresholds
+    values = grading_values(thresholds)
+    si, fe = np.meshgrid(values, values)
+    expected = [[assign_grade(s, f, thresholds) for s, f in zip(si_row, fe_row)] for si_row, fe_row in zip(si, fe)]
+    assert grading.grade_names(grading.grade_codes(si, fe, thresholds)).tolist() == expected
+
+
+@pytest.mark.parametrize('profile', PROFILES)
+def test_assign_grade_matches_the_if_elif_chain(profile):
+    thresholds = profiles.get_profile(profile).thresholds
+    values = grading_values(thresholds)
+    for si in values[::3]:
+        for fe in values:
+            assert grading.assign_grade(si, fe, thresholds) == assign_grade(si, fe, thresholds)
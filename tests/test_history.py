@@ -0,0 +1,92 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import history
+import profiles
+import schedule
+
+THRESHOLDS = profiles.get_profile('standard').thresholds
+
+
+def assays(cells, si, fe):
+    return schedule.grade_cells(pd.DataFrame({'CELL': cells, 'Si': si, 'Fe': fe}), THRESHOLDS)
+
+
+# Three days of assays of cells 1-4, the third day scheduled, the others not
+@pytest.fixture
+def store(tmp_path):
+    store = history.AssayStore(str(tmp_path / 'history'))
+    store.append(assays([1, 2, 3, 4], [0.03, 0.12, 0.05, 0.2], [0.05, 0.3, 0.09, 0.4]), '2026-01-01 06:00')
+    store.append(assays([1, 2, 3, 4], [0.04, 0.11, 0.05, 0.15], [0.06, 0.28, 0.09, 0.38]), '2026-01-02 06:00')
+    day3 = assays([1, 2, 3, 4], [0.05, 0.1, 0.05, 0.1], [0.07, 0.26, 0.09, 0.36])
+    store.append(day3, '2026-01-03 06:00', schedule.build_schedule(day3, THRESHOLDS))
+    return store
+
+
+def test_appends_are_read_back_by_cell_and_time(store):
+    assert len(store) == 12 and store.meta['batches'] == 3
+    history_1 = store.cell_history(1)
+    assert history_1['Si'].tolist() == [0.03, 0.04, 0.05]
+    assert history_1['Batch'].tolist() == [0, 1, 2]
+    assert store.cell_history(1, start='2026-01-02').shape[0] == 2
+    assert store.cell_history(1, end='2026-01-02').shape[0] == 1
+    assert store.assays(start='2026-01-02 00:00', end='2026-01-03 00:00')['CELL'].tolist() == [1, 2, 3, 4]
+
+
+def test_scheduled_assays_record_their_partner_and_grade(store):
+    day3 = store.assays(start='2026-01-03')
+    partners = dict(zip(day3['CELL'], day3['Partner']))
+    for cell, partner in partners.items():
+        if not pd.isna(partner):
+            assert partners[partner] == cell
+    assert day3['Grade'].notna().all()
+    assert store.assays(end='2026-01-03')['Partner'].isna().all()
+
+
+def test_index_finds_the_same_rows_as_a_scan(store, monkeypatch):
+    scanned = {cell: store.cell_rows(cell).tolist() for cell in (1, 2, 3, 4, 5)}
+    store.reindex()
+    assert store.meta['indexed_rows'] == 12
+    store.append(assays([2, 5], [0.06, 0.07], [0.1, 0.1]), '2026-01-04 06:00')
+    assert store.cell_rows(2).tolist() == scanned[2] + [12]
+    assert store.cell_rows(5).tolist() == [13]
+    assert {cell: store.cell_rows(cell).tolist() for cell in (1, 3, 4)} == {cell: scanned[cell] for cell in (1, 3, 4)}
+
+    # Past INDEX_TAIL_ROWS an append rebuilds the index, and the old index files go
+    monkeypatch.setattr(history, 'INDEX_TAIL_ROWS', 1)
+    store.append(assays([1, 5], [0.06, 0.07], [0.1, 0.1]), '2026-01-05 06:00')
+    assert store.meta['indexed_rows'] == len(store) == 16
+    assert not os.path.exists(store._index_file('index_order', 12))
+    assert store.cell_rows(5).tolist() == [13, 15]
+
+
+def test_an_unfinished_append_is_cut_off(store):
+    # Bytes written past the committed rows, as an append that crashed before its commit leaves them
+    with open(store._file('CELL'), 'ab') as column_file:
+        column_file.write(np.arange(3, dtype=np.int64).tobytes())
+    reader = history.AssayStore(store.path)
+    assert len(reader) == 12 and reader.column('CELL').tolist() == store.column('CELL').tolist()
+
+    store.append(assays([7], [0.05], [0.1]), '2026-01-04 06:00')
+    assert os.path.getsize(store._file('CELL')) == 13 * 8
+    assert reader.refresh().cell_history(7)['Si'].tolist() == [0.05]
+
+
+def test_whole_number_cells_only(store):
+    with pytest.raises(ValueError):
+        store.append(pd.DataFrame({'CELL': ['P1', 'P2'], 'Si': [0.05, 0.06], 'Fe': [0.1, 0.1]}), '2026-01-04')
+    assert len(store.refresh()) == 12
+    assert os.path.getsize(store._file('Si')) == 12 * 8
+
+
+def test_trends_project_the_recent_assays(store):
+    trends = store.trends(thresholds=THRESHOLDS).set_index('CELL')
+    assert trends['Assays'].tolist() == [3, 3, 3, 3]
+    assert trends.loc[1, 'Si_Slope'] == pytest.approx(0.01)
+    assert trends.loc[1, 'Drift_Si'] == pytest.approx(0.05 + 7 * 0.01)
+    assert trends.loc[3, 'Si_Slope'] == pytest.approx(0) and trends.loc[3, 'Drift_Grade'] == trends.loc[3, 'Grade']
+
+    # Cell 4's Si falls 0.05 a day: seven days on it would be below zero
+    assert trends.loc[4, 'Drift_Si'] == 0
+    assert pd.isna(trends.loc[4, 'Drift_Grade'])
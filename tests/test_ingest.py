@@ -0,0 +1,58 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import ingest
+
+# An assay sheet as the lab sends it: columns the schedule does not use, an offline cell marked in text
+SHEET = pd.DataFrame({
+    'Line': ['P1'] * 4,
+    'CELL': [1, 2, 3, 4],
+    'Si': [0.03, 0.12, 'offline', 0.2],
+    'Fe': [0.05, 0.3, 0.1, 0.4],
+    'Crew': ['north', 'south', 'north', 'south'],
+    'Sampled_By': ['ab', 'cd', 'ab', 'cd'],
+})
+
+
+def upload(kind, sheet=SHEET):
+    output_file = io.BytesIO()
+    if kind == 'csv':
+        sheet.to_csv(output_file, index=False)
+    elif kind == 'parquet':
+        sheet.astype({'Si': str}).to_parquet(output_file, index=False)
+    else:
+        sheet.to_excel(output_file, index=False)
+    output_file.seek(0)
+    output_file.name = 'assays.' + kind
+    return output_file
+
+
+@pytest.mark.parametrize('kind', ingest.UPLOAD_TYPES)
+def test_only_the_assay_columns_are_read_and_typed(kind):
+    data = ingest.read_assays(upload(kind))
+    assert list(data.columns) == ingest.ASSAY_COLUMNS
+    assert data['CELL'].dtype == np.int64 and data['Si'].dtype == np.float64 and data['Fe'].dtype == np.float64
+    assert data['CELL'].tolist() == [1, 2, 3, 4]
+    assert data['Si'].isna().tolist() == [False, False, True, False]
+
+
+@pytest.mark.parametrize('kind', ingest.UPLOAD_TYPES)
+def test_extra_columns_are_kept_as_they_are(kind):
+    data = ingest.read_assays(upload(kind), extra_columns=['Crew', 'Missing'])
+    assert list(data.columns) == ingest.ASSAY_COLUMNS + ['Crew']
+    assert data['Crew'].tolist() == SHEET['Crew'].tolist()
+
+
+def test_missing_columns_are_left_out():
+    data = ingest.read_assays(upload('csv', SHEET.drop(columns='Fe')))
+    assert list(data.columns) == ['CELL', 'Si']
+
+
+def test_cell_ids_that_are_not_whole_numbers_stay_as_they_are():
+    assert ingest.typed_assays(pd.DataFrame({'CELL': ['P1-7', 'P1-8'], 'Si': [0.1, 0.2], 'Fe': [0.1, 0.2]}))['CELL'].tolist() == ['P1-7', 'P1-8']
+    assert ingest.typed_assays(pd.DataFrame({'CELL': [1.5, 2.0], 'Si': [0.1, 0.2], 'Fe': [0.1, 0.2]}))['CELL'].dtype == np.float64
+
+
+def test_file_type_defaults_to_excel():
+    assert [ingest.file_type(name) for name in ('a.CSV', 'b.parquet', 'c.xlsx', 'd.xls', None)] == ['csv', 'parquet', 'xlsx', 'xlsx', 'xlsx']
@@ -0,0 +1,60 @@
+import threading
+import pytest
+import diagnostics
+import jobs
+import partitions
+import sample_data
+import schedule
+
+
+# A run that keeps going until it is cancelled, checking in at every step as the pairing passes do
+def run_until_cancelled(started):
+    started.set()
+    while True:
+        diagnostics.checkpoint()
+        threading.Event().wait(0.01)
+
+
+def test_same_id_reattaches_until_the_result_is_taken():
+    queue = jobs.JobQueue(workers=1)
+    job = queue.submit('line', sum, [1, 2, 3])
+    assert job.wait(10) and job.state == jobs.DONE
+    assert queue.submit('line', sum, [4]) is job
+    assert job.take_result() == 6 and job.result is None
+    rerun = queue.submit('line', sum, [4])
+    assert rerun is not job and rerun.wait(10) and rerun.take_result() == 4
+
+
+def test_cancel_stops_the_run_and_a_resubmit_starts_again():
+    queue = jobs.JobQueue(workers=1)
+    started = threading.Event()
+    job = queue.submit('line', run_until_cancelled, started)
+    assert started.wait(10)
+    queue.cancel('line')
+    assert job.wait(10) and job.state == jobs.CANCELLED
+    rerun = queue.submit('line', sum, [1])
+    assert rerun is not job and rerun.wait(10) and rerun.state == jobs.DONE
+
+
+def test_failed_job_keeps_its_error():
+    queue = jobs.JobQueue(workers=1)
+    job = queue.submit('line', int, 'not a number')
+    assert job.wait(10) and job.state == jobs.FAILED and isinstance(job.error, ValueError)
+
+
+def test_finished_jobs_are_forgotten_oldest_first():
+    queue = jobs.JobQueue(workers=1, finished_jobs=2)
+    for number in range(4):
+        queue.submit(str(number), sum, [number]).wait(10)
+    queue.submit('last', sum, [0]).wait(10)
+    assert queue.get('0') is None and queue.get('last') is not None
+
+
+def test_optimal_mode_refuses_lines_one_solve_cannot_finish():
+    filtered_data = schedule.grade_cells(sample_data.generate_potline(2500, offline=0))
+    with pytest.raises(ValueError, match='Optimal mode solves at most'):
+        schedule.build_schedule(filtered_data, mode="Optimal")
+    with pytest.raises(ValueError, match='Optimal mode solves at most'):
+        partitions.schedule_line(filtered_data, mode="Optimal")
+    # Sections are small enough to solve one by one
+    assert partitions.schedule_line(filtered_data, mode="Optimal", partition='section', workers=1)['comparison'] is not None
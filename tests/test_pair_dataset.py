@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pair_dataset
+import profiles
+from baseline import notebook_pairs
+
+
+# Cell numbers on both sides of every section and room limit, past 100 and below 1, some listed twice
+def assay_data(seed, cells=120):
+    random = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Cell_ID': random.integers(-2, 160, cells),
+        'Si': np.round(random.uniform(0.015, 0.25, cells), 3),
+        'Fe': np.round(random.uniform(0.015, 0.4, cells), 3),
+    })
+
+
+def plain_rows(frame):
+    return [[None if isinstance(value, float) and np.isnan(value) else value for value in row]
+            for row in frame.astype(object).values.tolist()]
+
+
+def test_pairs_match_the_notebook_loop():
+    for seed in range(5):
+        data = assay_data(seed)
+        pairs = pair_dataset.pair_dataset(data)
+        assert list(pairs.columns) == pair_dataset.PAIR_COLUMNS
+        assert plain_rows(pairs) == notebook_pairs(data, profiles.get_profile('standard').thresholds)
+
+
+def test_chunked_pairs_are_the_same_pairs():
+    data = assay_data(7)
+    whole = pair_dataset.pair_dataset(data)
+    chunked = pd.concat(pair_dataset.pair_chunks(pair_dataset.graded_cells(data), chunk_pairs=50), ignore_index=True)
+    assert plain_rows(chunked) == plain_rows(whole)
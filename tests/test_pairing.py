@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+import grading
+import pairing
+import profiles
+import schedule
+from baseline import ACCEPTABLE_GRADES, PAIRABLE_GRADES, POOR_GRADES, baseline_passes, closest
+
+LINES = 300
+
+
+# A random upload: Si and Fe at lab resolution, so blends land on grade limits and distances tie,
+# some offline cells, and every third line with CELLs listed more than once. Every other line is
+# mostly clean metal, so the pairable and acceptable passes have cells to pair too.
+def random_line(seed):
+    random = np.random.default_rng(seed)
+    cells = random.integers(5, 80)
+    cell_numbers = random.integers(1, cells // 2 + 2, cells) if seed % 3 == 0 else np.arange(1, cells + 1)
+    si_max, fe_max = (0.25, 0.4) if seed % 2 else (0.08, 0.15)
+    data = pd.DataFrame({
+        'CELL': cell_numbers,
+        'Si': np.round(random.uniform(0.015, si_max, cells), 3),
+        'Fe': np.round(random.uniform(0.015, fe_max, cells), 3),
+    })
+    data.loc[random.random(cells) < 0.1, ['Si', 'Fe']] = np.nan
+    return data
+
+
+def pair_cells(potline, pairs):
+    return [(potline.cells[row], potline.cells[partner], grading.grade_name(code)) for row, partner, code in pairs]
+
+
+@pytest.mark.parametrize('profile', ('standard', 'cell_purity'))
+def test_first_three_passes_match_the_iterrows_passes(profile):
+    thresholds = profiles.get_profile(profile).thresholds
+    for seed in range(LINES):
+        filtered_data = schedule.grade_cells(random_line(seed), thresholds)
+        potline = pairing.potline_from_frame(filtered_data, thresholds)
+        used = potline.new_used()
+        passes = [pair_cells(potline, pass_pairs(potline, used))
+                  for pass_pairs in (pairing.pair_poor_cells, pairing.pair_pairable_cells, pairing.pair_acceptable_cells)]
+        assert passes == baseline_passes(filtered_data, thresholds), f"line {seed}"
+
+
+def test_schedule_categories_match_the_iterrows_passes():
+    thresholds = profiles.get_profile('standard').thresholds
+    for seed in range(0, LINES, 10):
+        filtered_data = schedule.grade_cells(random_line(seed), thresholds)
+        table = schedule.build_schedule(filtered_data, thresholds)['table']
+        potline = pairing.potline_from_frame(filtered_data, thresholds)
+        categories = [pair_cells(potline, table.category(category).pairs()) for category in ('poor', 'pairable', 'acceptable')]
+        assert categories == baseline_passes(filtered_data, thresholds), f"line {seed}"
+
+
+# The leftover pass on the scalar rules: every acceptable cell still unpaired, in row order, takes the closest
+# unused 0303/0404/0406 cell that lifts the pair into 0303/0404/0406, failing that the closest one that keeps it
+# out of the poor grades. Returns the pairs and the CELLs left unpaired, in row order.
+def leftover_pairs(filtered_data, thresholds, used_cells):
+    rows = list(zip(filtered_data.index, filtered_data['CELL'], filtered_data['Si'], filtered_data['Fe'], filtered_data['Grade']))
+    first_index = {}
+    for index, cell_id, _, _, _ in rows:
+        first_index.setdefault(cell_id, index)
+    used_cells = set(used_cells)
+    pairs = []
+    for index, cell_id, si_a, fe_a, individual_grade in rows:
+        if individual_grade not in ACCEPTABLE_GRADES or cell_id in used_cells:
+            continue
+        for keep in (lambda grade: grade in PAIRABLE_GRADES, lambda grade: grade not in POOR_GRADES):
+            best_pairing, best_combined_grade = closest(rows, first_index, used_cells, index, cell_id, si_a, fe_a,
+                                                        PAIRABLE_GRADES, keep, False, thresholds)
+            if best_pairing is not None:
+                pairs.append((cell_id, best_pairing, best_combined_grade))
+                used_cells.update((cell_id, best_pairing))
+                break
+    return pairs, [cell_id for _, cell_id, _, _, _ in rows if cell_id not in used_cells]
+
+
+def test_leftover_pass_matches_the_scalar_rules():
+    thresholds = profiles.get_profile('standard').thresholds
+    for seed in range(LINES):
+        filtered_data = schedule.grade_cells(random_line(seed), thresholds)
+        potline = pairing.potline_from_frame(filtered_data, thresholds)
+        used = potline.new_used()
+        earlier = [pair for pass_pairs in (pairing.pair_poor_cells, pairing.pair_pairable_cells, pairing.pair_acceptable_cells)
+                   for pair in pair_cells(potline, pass_pairs(potline, used))]
+        pairs, remaining = pairing.pair_leftover_cells(potline, used)
+        used_cells = [cell for main_cell, partner, _ in earlier for cell in (main_cell, partner)]
+        assert (pair_cells(potline, pairs), potline.cells[remaining].tolist()) == leftover_pairs(filtered_data, thresholds, used_cells), f"line {seed}"
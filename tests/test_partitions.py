@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+import partitions
+import profiles
+import schedule
+from baseline import get_room_section
+
+
+# A line of `cells` numbered cells in a shuffled order, a few of them offline
+def random_line(seed, cells=300):
+    random = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'CELL': random.permutation(np.arange(1, cells + 1)),
+        'Si': np.round(random.uniform(0.015, 0.2, cells), 3),
+        'Fe': np.round(random.uniform(0.015, 0.3, cells), 3),
+    })
+    data.loc[random.random(cells) < 0.05, ['Si', 'Fe']] = np.nan
+    return data
+
+
+def table_cells(table):
+    cells = []
+    for record in table.records():
+        cells += [cell for cell in record[:-1] if cell is not None]
+    return cells
+
+
+def test_rooms_and_sections_match_the_notebook():
+    cells = np.arange(1, 101)
+    expected = [get_room_section(cell) for cell in cells]
+    assert list(zip(partitions.cell_rooms(cells), partitions.cell_sections(cells))) == expected
+
+    rooms, sections = partitions.model_rooms_sections(np.array([1, 25, 26, 51, 100, 0, 150, 'x'], dtype=object))
+    assert list(rooms) == ['A', 'A', 'A', 'B', 'B', 'B', 'B', '']
+    assert list(sections) == [1, 1, 2, 3, 4, 3, 4, 0]
+
+
+@pytest.mark.parametrize('partition', ('room', 'section'))
+@pytest.mark.parametrize('cross_partition', (True, False))
+def test_partitioned_schedule_lists_every_cell_once(partition, cross_partition):
+    thresholds = profiles.get_profile('standard').thresholds
+    for seed in range(5):
+        filtered_data = schedule.grade_cells(random_line(seed), thresholds)
+        table = partitions.build_partitioned_schedule(filtered_data, partition, thresholds, cross_partition=cross_partition, workers=1)['table']
+        cells = table_cells(table)
+        assert sorted(cells) == sorted(filtered_data['CELL'].tolist()), f"line {seed}"
+
+        if not cross_partition:
+            labels = dict(zip(filtered_data['CELL'], partitions.partition_labels(filtered_data, partition)))
+            assert all(labels[main_cell] == labels[partner] for main_cell, partner, _ in table.paired().records()), f"line {seed}"
+
+
+def test_partition_pool_matches_in_process(monkeypatch):
+    thresholds = profiles.get_profile('standard').thresholds
+    filtered_data = schedule.grade_cells(random_line(7, 1000), thresholds)
+    in_process = partitions.build_partitioned_schedule(filtered_data, 'section', thresholds, workers=1)['table']
+
+    monkeypatch.setattr(partitions, 'PARTITION_WORKERS', 2)
+    monkeypatch.setattr(partitions, 'PARALLEL_MIN_CELLS', 0)
+    pooled = partitions.build_partitioned_schedule(filtered_data, 'section', thresholds)['table']
+    assert list(pooled.records()) == list(in_process.records())
@@ -0,0 +1,48 @@
+import os
+import pytest
+import grading
+import pairing
+import profiles
+import schedule
+import sample_data
+from baseline import assign_grade
+
+# The limits of app.py's and tapp.py's if/elif chains
+APP_BANDS = ((0.03, 0.03), (0.04, 0.04), (0.04, 0.06), (0.05, 0.06), (0.06, 0.10), (0.10, 0.20), (0.15, 0.35))
+TAPP_BANDS = ((0.034, 0.034), (0.044, 0.044), (0.044, 0.064), (0.054, 0.064), (0.064, 0.10), (0.10, 0.20), (0.15, 0.35))
+
+
+def test_shipped_profiles_are_the_apps_bands():
+    assert profiles.get_profile('standard').thresholds == APP_BANDS
+    assert profiles.get_profile('cell_purity').thresholds == TAPP_BANDS
+
+
+def test_no_thresholds_means_the_standard_profile():
+    assert grading.default_thresholds() == profiles.get_profile('standard').thresholds
+    assert grading.assign_grade(0.045, 0.05) == assign_grade(0.045, 0.05, APP_BANDS) == '0506'
+    filtered_data = schedule.grade_cells(sample_data.generate_potline(200))
+    assert pairing.potline_from_frame(filtered_data).thresholds == APP_BANDS
+    assert list(schedule.build_schedule(filtered_data)['table'].records()) == list(schedule.build_schedule(filtered_data, APP_BANDS)['table'].records())
+
+
+def test_profiles_are_read_again_when_the_file_changes(tmp_path):
+    path = tmp_path / 'profiles.toml'
+    path.write_text('[plant]\ndescription = "Plant bands"\nbands = ' + str([list(band) for band in APP_BANDS]) + '\n')
+    assert profiles.get_profile('plant', str(path)).description == "Plant bands"
+    path.write_text('[plant]\nbands = ' + str([list(band) for band in TAPP_BANDS]) + '\n')
+    os.utime(path, (1, 1))
+    assert profiles.get_profile('plant', str(path)).thresholds == TAPP_BANDS
+    with pytest.raises(KeyError, match='plant'):
+        profiles.get_profile('standard', str(path))
+
+
+@pytest.mark.parametrize('settings', [
+    {'bands': [[0.03, 0.03]] * 6},
+    {'bands': [[0.03, 0.03]] * 6 + [[0.15]]},
+    {'bands': [[0.03, 0.03]] * 6 + [[0.15, -0.35]]},
+    {'bands': [[0.03, 0.03]] * 6 + [[True, 0.35]]},
+    {'bands': 'none'},
+])
+def test_bad_profiles_are_refused(settings):
+    with pytest.raises(ValueError, match='Threshold profile'):
+        profiles.parse_profile('bad', settings)
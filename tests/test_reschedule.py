@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import profiles
+import schedule
+from baseline import assign_grade
+
+THRESHOLDS = profiles.get_profile('standard').thresholds
+LINES = 80
+
+
+def random_line(random, cells):
+    return pd.DataFrame({
+        'CELL': random.permutation(np.arange(1, cells + 1)),
+        'Si': np.round(random.uniform(0.015, 0.2, cells), 3),
+        'Fe': np.round(random.uniform(0.015, 0.35, cells), 3),
+    })
+
+
+# Re-assays of a few cells of `data`, some taken offline, and a few new cells
+def random_delta(random, data):
+    changed = data.sample(n=max(1, len(data) // 10), random_state=int(random.integers(1 << 30)))[['CELL']].copy()
+    changed['Si'] = np.round(random.uniform(0.015, 0.2, len(changed)), 3)
+    changed['Fe'] = np.round(random.uniform(0.015, 0.35, len(changed)), 3)
+    changed.loc[random.random(len(changed)) < 0.2, 'Si'] = np.nan
+    added = random_line(random, int(random.integers(0, 6)))
+    added['CELL'] += data['CELL'].max()
+    return pd.concat([changed, added], ignore_index=True)
+
+
+def test_apply_delta_replaces_and_adds_cells():
+    data = pd.DataFrame({'CELL': [3, 1, 2], 'Si': [0.1, 0.2, 0.3], 'Fe': [0.4, 0.5, 0.6]})
+    delta = pd.DataFrame({'CELL': [1, 4, 1], 'Si': [0.25, 0.05, 0.15], 'Fe': [0.55, 0.06, 0.45]})
+    merged = schedule.apply_delta(data, delta)
+    assert merged.values.tolist() == [[3, 0.1, 0.4], [1, 0.15, 0.45], [2, 0.3, 0.6], [4, 0.05, 0.06]]
+    assert list(merged.index) == [0, 1, 2, 3]
+    assert data['Si'].tolist() == [0.1, 0.2, 0.3]
+
+
+def test_reschedule_lists_every_cell_once_and_keeps_untouched_pairs():
+    random = np.random.default_rng(5)
+    for line in range(LINES):
+        data = random_line(random, int(random.integers(10, 150)))
+        previous = schedule.build_schedule(schedule.grade_cells(data, THRESHOLDS), THRESHOLDS)
+        delta = random_delta(random, data)
+        filtered_data = schedule.grade_cells(schedule.apply_delta(data, delta), THRESHOLDS)
+        current = schedule.reschedule(previous, filtered_data, THRESHOLDS)
+
+        cells = [cell for record in current['table'].records() for cell in record[:-1] if cell is not None]
+        assert sorted(cells) == sorted(filtered_data['CELL'].tolist()), f"line {line}"
+
+        touched = set(delta['CELL'])
+        kept = {pair for pair in schedule.schedule_pairs(previous) if not touched & set(pair[:2])}
+        assert kept <= set(schedule.schedule_pairs(current)), f"line {line}"
+
+        values = filtered_data.set_index('CELL')
+        for main_cell, partner, grade in schedule.schedule_pairs(current):
+            si = (values.loc[main_cell, 'Si'] + values.loc[partner, 'Si']) / 2
+            fe = (values.loc[main_cell, 'Fe'] + values.loc[partner, 'Fe']) / 2
+            assert grade == assign_grade(si, fe, THRESHOLDS), f"line {line}"
+
+
+def test_reschedule_without_changes_is_the_same_schedule():
+    random = np.random.default_rng(9)
+    for line in range(20):
+        filtered_data = schedule.grade_cells(random_line(random, int(random.integers(10, 150))), THRESHOLDS)
+        previous = schedule.build_schedule(filtered_data, THRESHOLDS)
+        current = schedule.reschedule(previous, filtered_data, THRESHOLDS)
+        assert list(current['table'].records()) == list(previous['table'].records()), f"line {line}"
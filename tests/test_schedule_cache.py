@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import schedule_cache
+from schedule_cache import LRUCache
+
+
+def test_least_recently_used_entries_go_first():
+    cache = LRUCache(300)
+    for key in 'abc':
+        cache.put(key, b'x' * 100)
+    assert cache.get('a') == b'x' * 100
+    cache.put('d', b'y' * 100)
+    assert cache.get('b') is None
+    assert [cache.get(key) is not None for key in 'acd'] == [True, True, True]
+    assert len(cache) == 3 and cache.total_bytes == 300
+
+
+def test_memory_is_the_limit():
+    cache = LRUCache(1000)
+    cache.put('small', b'x' * 10)
+    cache.put('too_big', b'x' * 1001)
+    assert cache.get('too_big') is None and cache.get('small') is not None
+    cache.put('big', b'x' * 995)
+    assert cache.get('small') is None and cache.total_bytes == 995
+
+    # Putting a key again replaces its entry and its size
+    cache.put('big', b'x' * 20)
+    assert cache.total_bytes == 20 and len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0 and cache.total_bytes == 0
+
+
+def test_sizes_follow_the_data():
+    frame = pd.DataFrame({'CELL': np.arange(1000), 'Si': np.zeros(1000)})
+    assert schedule_cache.size_of(frame) >= 16000
+    assert schedule_cache.size_of({'table': np.zeros(500), 'bytes': b'x' * 100}) >= 4100
+
+
+def test_uploads_are_keyed_by_content():
+    assert schedule_cache.content_hash(b'CELL,Si,Fe\n1,0.1,0.2\n') == schedule_cache.content_hash(bytearray(b'CELL,Si,Fe\n1,0.1,0.2\n'))
+    assert schedule_cache.content_hash(b'CELL,Si,Fe\n1,0.1,0.2\n') != schedule_cache.content_hash(b'CELL,Si,Fe\n1,0.1,0.3\n')
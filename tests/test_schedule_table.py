@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+import export
+import grading
+import profiles
+import schedule
+
+THRESHOLDS = profiles.get_profile('standard').thresholds
+
+
+def scheduled_line(seed, pots=2):
+    random = np.random.default_rng(seed)
+    cells = int(random.integers(20, 200))
+    data = pd.DataFrame({'CELL': np.arange(1, cells + 1), 'Si': np.round(random.uniform(0.015, 0.2, cells), 3),
+                         'Fe': np.round(random.uniform(0.015, 0.4, cells), 3)})
+    return schedule.build_schedule(schedule.grade_cells(data, THRESHOLDS), THRESHOLDS, pots=pots)
+
+
+@pytest.mark.parametrize('pots', (2, 3))
+def test_categories_are_slices_of_the_table(pots):
+    for seed in range(20):
+        table = scheduled_line(seed, pots)['table']
+        slices = [table.category(category) for category in schedule.TABLE_CATEGORIES]
+        assert sum(len(part) for part in slices) == len(table)
+        for name in ('rows', 'partners', 'codes'):
+            assert np.concatenate([getattr(part, name) for part in slices]).tolist() == getattr(table, name).tolist()
+            assert getattr(table.paired(), name).tolist() == np.concatenate([getattr(part, name) for part in slices[:-1]]).tolist()
+        assert (slices[-1].partners == -1).all() and (table.paired().partners >= 0).all()
+        # Slices share the table's arrays
+        assert all(part.rows.base is table.rows or len(part) == 0 for part in slices)
+
+
+def test_records_are_the_same_in_any_chunk_size():
+    table = scheduled_line(1, pots=3)['table']
+    assert list(table.records(chunk=3)) == list(table.records())
+
+
+def test_groups_get_a_partner_column_per_further_pot():
+    for seed in range(20):
+        tapping_schedule = scheduled_line(seed, pots=3)
+        table = tapping_schedule['table']
+        if not table.groups():
+            continue
+        assert table.columns(export.SUMMARY_COLUMNS) == ('Main_Cell', 'Paired_Cell', 'Paired_Cell_2', 'Resultant_Grade')
+        frame = table.frame(export.SUMMARY_COLUMNS)
+        cells = tapping_schedule['potline'].cells
+        for row, partners, code in table.groups():
+            entry = frame[frame['Main_Cell'] == cells[row]].iloc[0]
+            assert (entry['Paired_Cell'], entry['Paired_Cell_2']) == tuple(cells[list(partners)])
+            assert entry['Resultant_Grade'] == grading.grade_name(code)
+        assert table.category('pairable').others is None or (table.category('pairable').others < 0).all()
+        return
+    pytest.fail("no line formed a group")
+
+
+def test_frame_matches_the_records():
+    table = scheduled_line(2)['table']
+    frame = table.frame(export.SUMMARY_COLUMNS)
+    values = frame.astype(object).where(frame.notna(), None).values.tolist()
+    assert values == [list(record) for record in table.records()]
+    remaining = table.category('remaining').frame(('Cell', 'Grade'))
+    assert remaining.values.tolist() == [[cell, grade] for cell, _, grade in table.category('remaining').records()]
@@ -0,0 +1,62 @@
+import json
+import pytest
+import blending
+import profiles
+import service
+
+ASSAYS = {'CELL': [1, 2, 3, 4], 'Si': [0.03, 0.12, 0.05, 0.2], 'Fe': [0.05, 0.3, 0.1, 0.4],
+          'Crew': ['north', 'south', 'north', 'south'], 'Tonnes': [4.0, 3.5, 4.2, 3.9]}
+
+
+def test_options_get_the_service_defaults():
+    assert service.request_options({}) == {
+        'profile': profiles.DEFAULT_PROFILE, 'max_distance': None, 'mode': "Greedy", 'partition': None,
+        'cross_partition': True, 'model': False, 'pots': 2, 'weight_column': None,
+    }
+
+
+def test_query_string_options_are_parsed():
+    options = service.request_options({'max_distance': '12', 'cross_partition': 'false', 'model': 'yes', 'pots': '3', 'partition': 'section'})
+    assert (options['max_distance'], options['cross_partition'], options['model'], options['pots'], options['partition']) == (12, False, True, 3, 'section')
+    assert service.request_options({'max_distance': '0'})['max_distance'] is None
+
+
+@pytest.mark.parametrize('values', [
+    {'colour': 'red'},
+    {'mode': 'Fastest'},
+    {'max_distance': -3},
+    {'max_distance': 'far'},
+    {'pots': 1},
+    {'pots': blending.MAX_POTS + 1},
+    {'profile': 'no such profile'},
+])
+def test_bad_options_are_refused(values):
+    with pytest.raises(service.RequestError):
+        service.request_options(values)
+
+
+@pytest.mark.parametrize('constant', ['NaN', 'Infinity', '-Infinity'])
+def test_json_constants_are_refused(constant):
+    body = f'{{"assays": {{"CELL": [1, 2], "Si": [0.03, {constant}], "Fe": [0.05, 0.1]}}}}'.encode()
+    with pytest.raises(service.RequestError, match=constant):
+        service.request_assays(body, None, {})
+
+
+def test_option_columns_are_read_with_the_assays():
+    body = json.dumps({'assays': ASSAYS, 'partition': 'Crew', 'weight_column': 'Tonnes'}).encode()
+    data, _ = service.request_assays(body, None, {})
+    assert list(data.columns) == ['CELL', 'Si', 'Fe', 'Crew', 'Tonnes']
+
+    data, _ = service.request_assays(json.dumps({'assays': ASSAYS}).encode(), None, {})
+    assert list(data.columns) == ['CELL', 'Si', 'Fe']
+
+
+def test_schedule_request_by_a_partition_column():
+    body = json.dumps({'assays': ASSAYS, 'partition': 'Crew', 'cross_partition': False}).encode()
+    response = json.loads(service.schedule_request(body, None, {}))
+    assert response['pairs'] == 2 and response['options']['partition'] == 'Crew'
+    crews = dict(zip(ASSAYS['CELL'], ASSAYS['Crew']))
+    main_cell, partner = response['columns'][:2]
+    for row in response['summary']:
+        if row[partner] is not None:
+            assert crews[row[main_cell]] == crews[row[partner]]
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+import grading
+import profiles
+import schedule
+import variants
+from variants import Variant
+
+
+def graded_line(seed, cells=300):
+    random = np.random.default_rng(seed)
+    data = pd.DataFrame({'CELL': random.permutation(np.arange(1, cells + 1)), 'Si': np.round(random.uniform(0.015, 0.2, cells), 3),
+                         'Fe': np.round(random.uniform(0.015, 0.4, cells), 3)})
+    return schedule.grade_cells(data)
+
+
+def test_variants_schedule_like_the_scheduler():
+    purity = profiles.get_profile('cell_purity').thresholds
+    for seed in range(3):
+        filtered_data = graded_line(seed)
+        table, schedules = variants.compare_variants(filtered_data, [
+            Variant('Scheduler'), Variant('Purity', purity), Variant('Near', max_distance=5), Variant('Optimal', mode="Optimal"),
+        ])
+        assert table['Variant'].tolist() == ['Scheduler', 'Purity', 'Near', 'Optimal']
+        expected = {
+            'Scheduler': schedule.build_schedule(filtered_data),
+            'Purity': schedule.build_schedule(filtered_data, purity),
+            'Near': schedule.build_schedule(filtered_data, max_distance=5),
+            'Optimal': schedule.build_schedule(filtered_data, mode="Optimal"),
+        }
+        for name, tapping_schedule in expected.items():
+            assert list(schedules[name]['table'].records()) == list(tapping_schedule['table'].records()), f"{name}, line {seed}"
+        assert schedules['Optimal']['comparison'] == expected['Optimal']['comparison']
+
+
+def test_metrics_add_up():
+    table, schedules = variants.compare_variants(graded_line(1), variants.default_variants())
+    value_columns = [f"Value_{grade}" for grade in grading.GRADES]
+    assert (table[value_columns].sum(axis=1) == table['Metal_Value']).all()
+    for row in table.itertuples():
+        assert row.Pairs + row.Unpaired == len(schedules[row.Variant]['table'])
+    assert table.loc[table['Variant'] == 'No leftover pass', 'Pairs'].item() <= table.loc[table['Variant'] == 'Scheduler', 'Pairs'].item()
+
+
+def test_passes_run_once_for_variants_that_share_them():
+    runner = variants.VariantRunner(graded_line(2))
+    runner.schedule(Variant('All'))
+    runner.schedule(Variant('No leftover pass', passes=('poor', 'pairable', 'acceptable')))
+    runner.schedule(Variant('Acceptable first', passes=('poor', 'acceptable', 'pairable', 'mixed')))
+    # (), poor, poor+pairable, poor+pairable+acceptable, all four, then poor+acceptable and its two successors
+    assert len(runner.states) == 8
+
+
+def test_unknown_passes_are_refused():
+    with pytest.raises(ValueError, match='Unknown pairing passes'):
+        Variant('Typo', passes=('poor', 'pairables'))
@@ -0,0 +1,157 @@
+import argparse
+import numpy as np
+import pandas as pd
+import diagnostics
+import grading
+import ingest
+import matching
+import pairing
+import profiles
+import schedule
+
+# The pairing passes by the category they fill, and the order the scheduler runs them in
+PASSES = {
+    'poor': pairing.pair_poor_cells,
+    'pairable': pairing.pair_pairable_cells,
+    'acceptable': pairing.pair_acceptable_cells,
+    'mixed': lambda potline, used, max_distance: pairing.pair_leftover_cells(potline, used, max_distance)[0],
+}
+PASS_ORDER = schedule.CATEGORIES
+
+# Columns of the comparison table, before the metal value of each resultant grade
+COMPARISON_COLUMNS = ['Variant', 'Pairs', 'Unpaired', 'Metal_Value', 'Travel', 'Score']
+
+
+# One way of scheduling the same potline: grade bands, which passes run in what order, the crucible
+# travel limit and the pairing mode. The defaults are the scheduler's own.
+class Variant:
+    def __init__(self, name, thresholds=None, passes=PASS_ORDER, max_distance=None, mode="Greedy"):
+        unknown = [pass_name for pass_name in passes if pass_name not in PASSES]
+        if unknown:
+            raise ValueError(f"Unknown pairing passes: {', '.join(unknown)}; passes are {', '.join(PASSES)}")
+        self.name = name
+        self.thresholds = tuple(tuple(band) for band in thresholds or grading.default_thresholds())
+        self.passes = tuple(passes)
+        self.max_distance = max_distance
+        self.mode = mode
+
+
+# The graded cells once, and everything variants can share: the potline for each set of grade bands
+# (cells, keys and distances are computed once and only the grades differ), and the state after every
+# sequence of passes already run, so variants that start with the same passes only run the rest.
+class VariantRunner:
+    def __init__(self, filtered_data):
+        self.base = pairing.potline_from_frame(filtered_data)
+        self.potlines = {self.base.thresholds: self.base}
+        self.states = {}
+
+    def potline(self, thresholds):
+        if thresholds not in self.potlines:
+            self.potlines[thresholds] = self.base.with_thresholds(thresholds)
+        return self.potlines[thresholds]
+
+    # Cells used and pairs made after `passes`, run from the longest sequence of them already run
+    def state(self, thresholds, max_distance, passes):
+        key = (thresholds, max_distance, passes)
+        if key not in self.states:
+            if passes:
+                used, pairs = self.state(thresholds, max_distance, passes[:-1])
+                used = used.copy()
+                pairs = dict(pairs)
+                with diagnostics.stage('pass_' + passes[-1]):
+                    pairs[passes[-1]] = pairs.get(passes[-1], []) + PASSES[passes[-1]](self.potline(thresholds), used, max_distance)
+            else:
+                used, pairs = self.potline(thresholds).new_used(), {}
+            diagnostics.count('variant_passes_run')
+            self.states[key] = (used, pairs)
+        else:
+            diagnostics.count('variant_passes_reused')
+        return self.states[key]
+
+    # The schedule dict of one variant, as build_schedule returns it
+    def schedule(self, variant):
+        potline = self.potline(variant.thresholds)
+        used, pairs = self.state(variant.thresholds, variant.max_distance, variant.passes)
+        pairs = {category: pairs.get(category, []) for category in schedule.CATEGORIES}
+        remaining = np.flatnonzero(~used[potline.keys])
+        comparison = None
+        if variant.mode == "Optimal":
+            greedy_pairs = [pair for category in schedule.CATEGORIES for pair in pairs[category]]
+            with diagnostics.stage('optimal_matching'):
+                optimal_pairs = matching.optimal_pairs(potline, max_distance=variant.max_distance, extra_pairs=greedy_pairs)
+            comparison = matching.compare_schedules(potline, greedy_pairs, optimal_pairs)
+            pairs = dict(zip(schedule.CATEGORIES, matching.split_by_category(potline, optimal_pairs)))
+            remaining = schedule.unpaired_rows(potline, optimal_pairs)
+        return schedule.finished_schedule(potline, pairs, remaining, comparison)
+
+
+# Headline numbers of a schedule from its table: pairs, unpaired cells, metal value (in total and by
+# resultant grade, one pot for an unpaired cell and two or more for a crucible), crucible travel and overall score
+def variant_metrics(tapping_schedule, distance_weight=matching.DISTANCE_WEIGHT):
+    table = tapping_schedule['table']
+    potline = tapping_schedule['potline']
+    paired = table.categories < schedule.REMAINING
+    pots = np.where(paired, 2, 1)
+    main_positions = potline.partner_positions[table.rows[paired]]
+    travel = np.abs(main_positions - potline.partner_positions[table.partners[paired]]).sum()
+    if table.others is not None:
+        others = table.others[paired]
+        pots[paired] += (others >= 0).sum(axis=1)
+        travel += np.where(others >= 0, np.abs(main_positions[:, None] - potline.partner_positions[others]), 0).sum()
+    values = matching.GRADE_VALUES[table.codes] * pots
+    metal_value = values.sum()
+    metrics = {
+        "Pairs": int(paired.sum()),
+        "Unpaired": int((~paired).sum()),
+        "Metal_Value": int(metal_value),
+        "Travel": int(travel),
+        "Score": float(metal_value - distance_weight * travel),
+    }
+    by_grade = np.bincount(table.codes[table.codes >= 0], weights=values[table.codes >= 0], minlength=len(grading.GRADES))
+    metrics.update({f"Value_{grade}": int(value) for grade, value in zip(grading.GRADES, by_grade)})
+    return metrics
+
+
+# Schedule the graded cells every way in `variants` and compare them: one row per variant with the
+# headline numbers and the metal value of each resultant grade. Returns (comparison table, schedules by name).
+def compare_variants(filtered_data, variants, distance_weight=matching.DISTANCE_WEIGHT):
+    runner = VariantRunner(filtered_data)
+    schedules = {}
+    rows = []
+    for variant in variants:
+        schedules[variant.name] = runner.schedule(variant)
+        rows.append({'Variant': variant.name, **variant_metrics(schedules[variant.name], distance_weight)})
+    columns = COMPARISON_COLUMNS + [f"Value_{grade}" for grade in grading.GRADES]
+    return pd.DataFrame(rows, columns=columns), schedules
+
+
+# A starting set of variants: the scheduler as it is, every threshold profile, the passes in other orders,
+# and tighter crucible travel limits
+def default_variants():
+    variants = [Variant('Scheduler')]
+    variants += [Variant(f"Profile {profile.name}", profile.thresholds) for profile in profiles.load_profiles().values()
+                 if profile.thresholds != grading.default_thresholds()]
+    variants += [
+        Variant('Pairable first', passes=('pairable', 'poor', 'acceptable', 'mixed')),
+        Variant('Acceptable first', passes=('poor', 'acceptable', 'pairable', 'mixed')),
+        Variant('No leftover pass', passes=('poor', 'pairable', 'acceptable')),
+    ]
+    variants += [Variant(f"Max distance {distance}", max_distance=distance) for distance in (10, 5, 2)]
+    return variants
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare scheduling variants on one assay file.")
+    parser.add_argument('input', help="assay file (xlsx, csv or parquet) with CELL, Si and Fe")
+    parser.add_argument('--output', help="write the comparison table to this CSV file")
+    args = parser.parse_args(argv)
+
+    filtered_data = schedule.grade_cells(ingest.read_assays(args.input))
+    comparison, _ = compare_variants(filtered_data, default_variants())
+    if args.output:
+        comparison.to_csv(args.output, index=False)
+    print(comparison.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()